@@ -0,0 +1,125 @@
+import secrets
+from typing import Annotated
+
+import numpy as np
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel
+from pyproj.exceptions import CRSError
+
+from app.prefetch import bbox_cells, check_cell_count, prefetcher, tile_cells, to_cells, trajectory_cells
+from config import ADMIN_TOKEN, PREFETCH_MAX_CELLS, ROUNDING_EPSG
+
+
+def verify_admin_token(authorization: Annotated[str | None, Header()] = None) -> None:
+    """
+    Checks the bearer token of admin requests. Admin endpoints are disabled if no ADMIN_TOKEN is configured.
+    """
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+    if authorization is None or not secrets.compare_digest(authorization, f"Bearer {ADMIN_TOKEN}"):
+        raise HTTPException(status_code=403, detail="Invalid admin token.")
+
+
+def profiling_requested(
+    profile: bool = False,
+    x_profile: Annotated[str | None, Header()] = None,
+    authorization: Annotated[str | None, Header()] = None,
+) -> bool:
+    """
+    Returns whether profiling is requested by the profile=1 query parameter or the X-Profile: 1 header.
+
+    Profiling requires the admin token.
+    """
+    if not profile and x_profile != "1":
+        return False
+
+    verify_admin_token(authorization)
+    return True
+
+
+admin_router = APIRouter(prefix="/admin", dependencies=[Depends(verify_admin_token)])
+
+
+class WarmRequest(BaseModel):
+    bbox: tuple[float, float, float, float] | None = None
+    tiles: list[str] = []
+    trajectory: list[tuple[float, float, float]] = []
+    epsg: int = ROUNDING_EPSG
+    z: float = 0.0
+
+
+def warm_request_cells(warm_request: WarmRequest) -> np.ndarray:
+    """
+    Returns the unique cells of a warm-up request.
+
+    The number of cells of each part is checked before its cells are created.
+
+    Raises:
+        ValueError: If a tile name is invalid, the coordinates are not finite or more than PREFETCH_MAX_CELLS
+                    cells are requested.
+        CRSError: If the EPSG code is invalid.
+    """
+    cells = [tile_cells(warm_request.tiles, warm_request.z, max_cells=PREFETCH_MAX_CELLS)]
+
+    if warm_request.bbox is not None:
+        cells.append(
+            bbox_cells(*warm_request.bbox, epsg=warm_request.epsg, z=warm_request.z, max_cells=PREFETCH_MAX_CELLS)
+        )
+
+    if warm_request.trajectory:
+        cells.append(
+            trajectory_cells(np.array(warm_request.trajectory), warm_request.epsg, max_cells=PREFETCH_MAX_CELLS)
+        )
+
+    all_cells = to_cells(np.concatenate(cells), ROUNDING_EPSG)
+    check_cell_count(len(all_cells), PREFETCH_MAX_CELLS)
+    return all_cells
+
+
+@admin_router.post("/warm", status_code=202)
+async def warm(warm_request: WarmRequest) -> dict:
+    """
+    Warms the shared tile store and the edge caches for a bounding box, CityGML tiles and/or a trajectory.
+
+    The warm-up runs in the background with bounded parallelism, its progress can be requested
+    at /admin/warm/{job_id}.
+
+    Args:
+
+        bbox (list[float], optional): min_x, min_y, max_x, max_y of a bounding box.
+        tiles (list[str], optional): CityGML tiles as "{XXX}_{YYYY}", e.g. "364_5621".
+        trajectory (list[list[float]], optional): Positions x, y, z of a trajectory.
+        epsg (int, optional): The EPSG code of the bounding box and the trajectory. Defaults to ROUNDING_EPSG.
+        z (float, optional): The height of the bounding box and the tiles. Defaults to 0.
+
+    Returns:
+
+        The warm-up job with its id, status, number of cells, warmed and failed cells and duration.
+    """
+    try:
+        # the transformation and the grid of a large request would block the event loop
+        all_cells = await run_in_threadpool(warm_request_cells, warm_request)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from exc
+    except CRSError as exc:
+        raise HTTPException(status_code=422, detail=f"Invalid EPSG code {warm_request.epsg}.") from exc
+
+    if len(all_cells) == 0:
+        raise HTTPException(status_code=422, detail="Nothing to warm, specify a bbox, tiles or a trajectory.")
+
+    return prefetcher.start(all_cells).to_dict()
+
+
+@admin_router.get("/warm/{job_id}")
+async def warm_status(job_id: str) -> dict:
+    """
+    Returns the progress of a warm-up job.
+    """
+    job = prefetcher.get_job(job_id)
+
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown warm-up job.")
+
+    return job.to_dict()
@@ -0,0 +1,246 @@
+import sys
+import threading
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from enum import Enum
+from functools import wraps
+from typing import Any, Callable, Hashable
+
+from pointset import PointSet
+
+from app.metrics import CACHE_EVICTIONS, CACHE_REQUESTS, record
+from app.singleflight import SingleFlight
+from config import CACHE_BUDGET, CACHE_POLICY, logger
+
+
+class CachePolicy(Enum):
+    LRU = "LRU"
+    LFU = "LFU"
+
+
+@dataclass
+class CacheEntry:
+    value: Any
+    nbytes: int
+    hits: int = 0
+
+
+@dataclass
+class TierStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    shared_loads: int = 0
+    entries: int = 0
+    nbytes: int = 0
+
+
+def sizeof(value: Any) -> int:
+    """
+    Estimates the memory footprint of a cached value in bytes.
+
+    Numpy arrays and objects providing an nbytes attribute are accounted with their nbytes,
+    lists and tuples with the sum of their items.
+    """
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(sizeof(item) for item in value)
+
+    if hasattr(value, "nbytes"):
+        return int(value.nbytes)
+
+    return sys.getsizeof(value)
+
+
+def make_key(*args, **kwargs) -> Hashable:
+    """
+    Creates a cache key from the arguments of a function call.
+
+    PointSets are mutable and are therefore frozen to their EPSG code and coordinates.
+    """
+
+    def freeze(value: Any) -> Hashable:
+        if isinstance(value, PointSet):
+            return (value.epsg, value.xyz.tobytes())
+        return value
+
+    return tuple(freeze(arg) for arg in args) + tuple((name, freeze(arg)) for name, arg in sorted(kwargs.items()))
+
+
+class CacheManager:
+    """
+    Memory-budgeted cache shared by all cache tiers of a process.
+
+    Every entry is accounted with its size in bytes. If the total size exceeds the budget,
+    entries of all tiers are evicted according to the eviction policy, i.e. the least recently
+    used (LRU) or the least frequently used (LFU) entry is evicted first. For LFU, the entries
+    are kept in buckets of equal hits in the order of their last hit, so that the least recently
+    used of the least frequently used entries is found in constant time.
+
+    Concurrent misses of the same key are deduplicated, i.e. only one thread loads the value
+    while the others wait for its result.
+    """
+
+    def __init__(self, budget: int = CACHE_BUDGET, policy: CachePolicy = CachePolicy(CACHE_POLICY)) -> None:
+        self.budget = budget
+        self.policy = policy
+        self.nbytes = 0
+        self._entries: OrderedDict[tuple[str, Hashable], CacheEntry] = OrderedDict()
+        self._frequencies: dict[int, OrderedDict[tuple[str, Hashable], None]] = {}
+        self._min_hits = 0
+        self._stats: dict[str, TierStats] = {}
+        self._lock = threading.RLock()
+        self._flights = SingleFlight()
+
+    def get(self, tier: str, key: Hashable) -> tuple[bool, Any]:
+        """
+        Returns whether the key is cached in the given tier and the cached value.
+        """
+        with self._lock:
+            stats = self._stats.setdefault(tier, TierStats())
+            entry = self._entries.get((tier, key))
+
+            if entry is None:
+                stats.misses += 1
+                record(CACHE_REQUESTS, (tier, "miss"))
+                return False, None
+
+            stats.hits += 1
+            record(CACHE_REQUESTS, (tier, "hit"))
+            self._hit((tier, key), entry)
+            return True, entry.value
+
+    def put(self, tier: str, key: Hashable, value: Any, nbytes: int) -> None:
+        """
+        Stores a value with a size of nbytes in the given tier and evicts entries if the budget is exceeded.
+        """
+        if nbytes > self.budget:
+            logger.warning("Cache entry of tier %s with %i bytes exceeds the cache budget", tier, nbytes)
+            return
+
+        with self._lock:
+            stats = self._stats.setdefault(tier, TierStats())
+
+            if (tier, key) in self._entries:
+                self._remove((tier, key))
+
+            # evicted before the new entry is stored, which would otherwise be the first LFU victim without hits
+            while self.nbytes + nbytes > self.budget:
+                self._evict()
+
+            self._entries[(tier, key)] = CacheEntry(value=value, nbytes=nbytes)
+            if self.policy == CachePolicy.LFU:
+                self._frequencies.setdefault(0, OrderedDict())[(tier, key)] = None
+                self._min_hits = 0
+            self.nbytes += nbytes
+            stats.entries += 1
+            stats.nbytes += nbytes
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._frequencies.clear()
+            self._stats.clear()
+            self.nbytes = 0
+
+    def stats(self) -> dict:
+        """
+        Returns the overall and per-tier cache statistics.
+        """
+        with self._lock:
+            return {
+                "budget": self.budget,
+                "nbytes": self.nbytes,
+                "policy": self.policy.value,
+                "tiers": {tier: asdict(stats) for tier, stats in self._stats.items()},
+            }
+
+    def cached(
+        self, tier: str, size: Callable[[Any], int] = sizeof
+    ) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+        """
+        Decorator that caches the results of a function in the given tier.
+
+        Args:
+            tier (str): Name of the cache tier, used for the statistics.
+            size (Callable[[Any], int], optional): Function estimating the size of a result in bytes.
+                                                   Defaults to sizeof.
+        """
+
+        def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+            @wraps(func)
+            def wrapper(*args, **kwargs) -> Any:
+                key = make_key(func.__qualname__, *args, **kwargs)
+                found, value = self.get(tier, key)
+
+                if found:
+                    return value
+
+                value, shared = self._flights.do((tier, key), self._load, tier, key, size, func, args, kwargs)
+
+                if shared:
+                    with self._lock:
+                        self._stats[tier].shared_loads += 1
+
+                return value
+
+            return wrapper
+
+        return decorator
+
+    def _load(
+        self, tier: str, key: Hashable, size: Callable[[Any], int], func: Callable[..., Any], args: tuple, kwargs: dict
+    ) -> Any:
+        with self._lock:
+            entry = self._entries.get((tier, key))
+
+            # the previous leader may have stored the value after our lookup missed but before we became leader
+            if entry is not None:
+                self._stats[tier].shared_loads += 1
+                self._hit((tier, key), entry)
+                return entry.value
+
+        value = func(*args, **kwargs)
+        self.put(tier, key, value, size(value))
+        return value
+
+    def _hit(self, entry_key: tuple[str, Hashable], entry: CacheEntry) -> None:
+        self._entries.move_to_end(entry_key)
+
+        if self.policy == CachePolicy.LFU:
+            self._unlink(entry_key, entry.hits)
+            if entry.hits == self._min_hits and entry.hits not in self._frequencies:
+                self._min_hits += 1
+            self._frequencies.setdefault(entry.hits + 1, OrderedDict())[entry_key] = None
+
+        entry.hits += 1
+
+    def _unlink(self, entry_key: tuple[str, Hashable], hits: int) -> None:
+        bucket = self._frequencies[hits]
+        del bucket[entry_key]
+        if not bucket:
+            del self._frequencies[hits]
+
+    def _evict(self) -> None:
+        if self.policy == CachePolicy.LFU:
+            # the bucket of the fewest hits may have been emptied by a removal
+            if self._min_hits not in self._frequencies:
+                self._min_hits = min(self._frequencies)
+            victim = next(iter(self._frequencies[self._min_hits]))
+        else:
+            victim = next(iter(self._entries))
+
+        self._stats[victim[0]].evictions += 1
+        record(CACHE_EVICTIONS, (victim[0],))
+        self._remove(victim)
+
+    def _remove(self, entry_key: tuple[str, Hashable]) -> None:
+        entry = self._entries.pop(entry_key)
+        if self.policy == CachePolicy.LFU:
+            self._unlink(entry_key, entry.hits)
+        stats = self._stats[entry_key[0]]
+        stats.entries -= 1
+        stats.nbytes -= entry.nbytes
+        self.nbytes -= entry.nbytes
+
+
+cache_manager = CacheManager()
@@ -1,13 +1,46 @@
-from config import EDGE_DATA_PATH, EDGE_EPSG, EDGE_LOD, EDGE_SOURCE, GEOID_EPSG, GEOID_FILE, logger
+import importlib
+from functools import cache
 
-from .edge_provider import LocalEdgeProvider, WFSEdgeProvider
-from .geoid import Geoid
+from app.edge_provider import EdgeProvider, LocalEdgeProvider, WFSEdgeProvider
+from app.geoid import Geoid
+from config import EDGE_DATA_PATH, EDGE_EPSG, EDGE_LOD, EDGE_SOURCE, GEOID_EPSG, GEOID_FILE, SUN_ENGINE, logger
 
-geoid = Geoid(filename=GEOID_FILE, epsg=GEOID_EPSG)
+# modules that are only imported when needed, warm-up imports them in advance
+DEFERRED_MODULES = (
+    "scipy.spatial",
+    *(("pvlib.solarposition",) if SUN_ENGINE == "PVLIB" else ()),
+    "plotly.graph_objects",
+    "app.tasks",
+)
+
+
+@cache
+def get_geoid() -> Geoid:
+    """
+    Returns the geoid, which is created on first use.
+    """
+    return Geoid(filename=GEOID_FILE, epsg=GEOID_EPSG)
+
+
+@cache
+def get_edge_provider() -> EdgeProvider:
+    """
+    Returns the edge provider, which is created on first use.
+    """
+    if EDGE_SOURCE == "FILE":
+        logger.info("Using local edge data from %s", EDGE_DATA_PATH)
+        return LocalEdgeProvider(data_path=EDGE_DATA_PATH, epsg=EDGE_EPSG, lod=EDGE_LOD)
 
-if EDGE_SOURCE == "FILE":
-    edge_provider = LocalEdgeProvider(data_path=EDGE_DATA_PATH, epsg=EDGE_EPSG, lod=EDGE_LOD)
-    logger.info("Using local edge data from %s", EDGE_DATA_PATH)
-else:
-    edge_provider = WFSEdgeProvider()
     logger.info("Using WFS edge data")
+    return WFSEdgeProvider()
+
+
+def init_dependencies() -> None:
+    """
+    Creates the geoid and the edge provider and imports the modules needed for the computations.
+    """
+    for module in DEFERRED_MODULES:
+        importlib.import_module(module)
+
+    get_geoid()
+    get_edge_provider()
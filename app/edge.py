@@ -1,78 +1,189 @@
-from dataclasses import dataclass, field
-from functools import cached_property
+"""
+Vectorised geometry of building edges.
+
+Edges are given as an array of shape (N, 7) with the start and end point x, y, z and the index
+of the building of each edge. The edges of a building are consecutive.
+"""
+from dataclasses import dataclass
 
 import numpy as np
 
 
-@dataclass
-class Edge:
+def azimuth_spans(edges: np.ndarray, pos: np.ndarray, grid: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Returns the azimuth bins covered by the edges as seen from a position.
+
+    An edge covers the bins with lower <= azimuth < upper between the azimuths of its start and end point.
+    If the edge is behind the position, i.e. its span contains ±pi, it covers [-pi, lower) and [upper, pi).
+
+    Args:
+        edges (np.ndarray): The edges as an array of shape (N, 7).
+        pos (np.ndarray): The position as an array of shape (3,).
+        grid (np.ndarray): The sorted azimuths of the bins in radians.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray]: The edge index, the first bin and the end bin (exclusive)
+                                                   of the spans, edges behind the position have two spans.
+    """
+    azimuth_start = np.arctan2(edges[:, 0] - pos[0], edges[:, 1] - pos[1])
+    azimuth_end = np.arctan2(edges[:, 3] - pos[0], edges[:, 4] - pos[1])
+    lower = np.minimum(azimuth_start, azimuth_end)
+    upper = np.maximum(azimuth_start, azimuth_end)
+    wraps = (np.sign(azimuth_start) != np.sign(azimuth_end)) & (upper - lower > np.pi)
+
+    index = np.arange(len(edges))
+    n_wraps = np.count_nonzero(wraps)
+    begin = np.r_[lower[~wraps], np.full(n_wraps, -np.pi), upper[wraps]]
+    end = np.r_[upper[~wraps], lower[wraps], np.full(n_wraps, np.pi)]
+    return (
+        np.r_[index[~wraps], index[wraps], index[wraps]],
+        np.searchsorted(grid, begin),
+        np.searchsorted(grid, end),
+    )
+
+
+def expand_spans(index: np.ndarray, first: np.ndarray, end: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Expands spans of bins to one (edge index, bin) pair per covered bin.
+    """
+    counts = np.maximum(end - first, 0)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(index, counts), np.repeat(first, counts) + offsets
+
+
+def elevation_at(edges: np.ndarray, pos: np.ndarray, sin_azimuth: np.ndarray, cos_azimuth: np.ndarray) -> np.ndarray:
+    """
+    Calculates the elevation angles of the edges along lines of sight.
+
+    The line of sight is intersected with the edge in the horizontal plane, the elevation is the angle
+    to the height of the start point of the edge at the distance of the intersection.
+
+    Args:
+        edges (np.ndarray): The edges as an array of shape (N, 7).
+        pos (np.ndarray): The position as an array of shape (3,).
+        sin_azimuth (np.ndarray): The sine of the azimuths of the lines of sight of shape (N,).
+        cos_azimuth (np.ndarray): The cosine of the azimuths of the lines of sight of shape (N,).
+
+    Returns:
+        np.ndarray: The elevation angles in radians of shape (N,).
+    """
+    edge_x = edges[:, 3] - edges[:, 0]
+    edge_y = edges[:, 4] - edges[:, 1]
+    start_x = edges[:, 0] - pos[0]
+    start_y = edges[:, 1] - pos[1]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        distance = (start_x * edge_y - edge_x * start_y) / (sin_azimuth * edge_y - edge_x * cos_azimuth)
+
+    return np.arctan2(edges[:, 2] - pos[2], distance)
+
+
+def elevation_bounds(edges: np.ndarray, pos: np.ndarray) -> np.ndarray:
+    """
+    Returns an upper bound of the elevation angles of the edges over their whole azimuth span.
+
+    The line of sight hits an edge at least at the horizontal distance of the edge to the position,
+    so the elevation of an edge is at most the elevation of its start point at this distance.
+    """
+    edge_xy = edges[:, 3:5] - edges[:, :2]
+    start_xy = pos[:2] - edges[:, :2]
+    length_squared = np.einsum("ij,ij->i", edge_xy, edge_xy)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = np.clip(np.einsum("ij,ij->i", start_xy, edge_xy) / length_squared, 0.0, 1.0)
+
+    nearest = edges[:, :2] + np.nan_to_num(t)[:, None] * edge_xy
+    return np.arctan2(edges[:, 2] - pos[2], np.hypot(*(nearest - pos[:2]).T))
+
+
+def building_runs(edges: np.ndarray) -> np.ndarray:
     """
-    Represents an edge between two points in 3D space.
-    Provides methods for calculating azimuth, elevation, and distance.
+    Returns the index of the first edge of every building, i.e. of every run of equal building indices.
+
+    Runs are used instead of the building indices themselves, since the indices of concatenated
+    tiles may repeat. Merging two buildings only loosens their bounds.
+    """
+    buildings = edges[:, 6]
+    return np.r_[0, np.flatnonzero(buildings[1:] != buildings[:-1]) + 1] if len(edges) else np.empty(0, np.int64)
+
+
+@dataclass(frozen=True)
+class Buildings:
     """
+    Position-independent summary of the buildings of an edge array.
+
+    Every building, i.e. every run of equal building indices (see building_runs), is summarised by
+    the bounding circle of its horizontal bounding box and its highest point.
 
-    start: np.ndarray
-    end: np.ndarray
-    pos: np.ndarray = field(
-        init=False, repr=False, default_factory=lambda: np.zeros(3, dtype=np.float64)
+    Attributes:
+        starts (np.ndarray): The index of the first edge of every building.
+        stops (np.ndarray): The index after the last edge of every building.
+        center (np.ndarray): The center of the bounding circle as an array of shape (M, 2).
+        radius (np.ndarray): The radius of the bounding circle.
+        top (np.ndarray): The height of the highest point.
+    """
+
+    starts: np.ndarray
+    stops: np.ndarray
+    center: np.ndarray
+    radius: np.ndarray
+    top: np.ndarray
+
+
+def summarise_buildings(edges: np.ndarray) -> Buildings:
+    """
+    Summarises the buildings of the edges of shape (N, 7), see Buildings.
+    """
+    starts = building_runs(edges)
+    if not len(starts):
+        return Buildings(starts, starts, np.empty((0, 2)), np.empty(0), np.empty(0))
+
+    x_min = np.minimum.reduceat(np.minimum(edges[:, 0], edges[:, 3]), starts)
+    x_max = np.maximum.reduceat(np.maximum(edges[:, 0], edges[:, 3]), starts)
+    y_min = np.minimum.reduceat(np.minimum(edges[:, 1], edges[:, 4]), starts)
+    y_max = np.maximum.reduceat(np.maximum(edges[:, 1], edges[:, 4]), starts)
+    return Buildings(
+        starts=starts,
+        stops=np.r_[starts[1:], len(edges)],
+        center=np.c_[(x_min + x_max) / 2, (y_min + y_max) / 2],
+        radius=np.hypot(x_max - x_min, y_max - y_min) / 2,
+        top=np.maximum.reduceat(np.maximum(edges[:, 2], edges[:, 5]), starts),
     )
 
-    @cached_property
-    def azimuth_start(self) -> float:
-        return np.arctan2(self.start[0] - self.pos[0], self.start[1] - self.pos[1])
-
-    @cached_property
-    def azimuth_end(self) -> float:
-        return np.arctan2(self.end[0] - self.pos[0], self.end[1] - self.pos[1])
-
-    @cached_property
-    def edge_vec(self) -> np.ndarray:
-        return self.end - self.start
-
-    @cached_property
-    def edge_vec_norm(self) -> np.float64:
-        return np.linalg.norm(self.edge_vec)
-
-    @cached_property
-    def pos_vec(self) -> np.ndarray:
-        return self.start - self.pos
-
-    @cached_property
-    def pos_vec_norm(self) -> np.float64:
-        return np.linalg.norm(self.pos_vec)
-
-    def set_position(self, pos: np.ndarray) -> None:
-        self.pos = pos
-
-    def _interpolate_to_angle(self, angle: float) -> np.ndarray:
-        beta = np.arctan(
-            np.dot(self.edge_vec, self.pos_vec)
-            / (self.edge_vec_norm * self.pos_vec_norm)
-        )
-        gamma = np.pi - (abs(beta) + abs(angle))
-        c = self.pos_vec_norm * np.sin(angle) / np.sin(gamma)
-
-        return self.start + c * self.edge_vec / self.edge_vec_norm
-
-    def _distance_at_azimuth(self, azimuth: float) -> np.ndarray:
-        # line intersection
-        line_of_sight = np.array([np.sin(azimuth), np.cos(azimuth), 0])
-        a = np.array(
-            [[line_of_sight[0], self.edge_vec[0]], [line_of_sight[1], self.edge_vec[1]]]
-        )
-        b = self.start[:2] - self.pos[:2]
-        x = np.linalg.solve(a, b)
-        return x[0]
-
-    def get_elevation(self, azimuth: float) -> np.ndarray:
-        """
-        Calculates the elevation angle between the edge and the line of sight at a given azimuth angle.
-
-        Args:
-            azimuth: The azimuth angle in radians.
-
-        Returns:
-            The elevation angle in radians.
-        """
-        distance = self._distance_at_azimuth(azimuth=azimuth)
-        return np.arctan2(self.start[2] - self.pos[2], distance)
+
+def building_bounds(
+    buildings: Buildings, pos: np.ndarray, grid: np.ndarray
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Returns an upper bound of the elevation angle of every building and the azimuth bins it may cover.
+
+    No edge of a building is closer to the position than its bounding circle or covers a bin outside the
+    circle's azimuth extent. Positions inside the circle cover all bins.
+
+    Args:
+        buildings (Buildings): The summary of the buildings.
+        pos (np.ndarray): The position as an array of shape (3,).
+        grid (np.ndarray): The azimuths of the bins in radians, uniformly spaced and starting at -pi.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray]: The elevation bound in radians, the first bin and the end bin
+                                                   (exclusive) of every building. The bins need to be taken
+                                                   modulo len(grid), since the span may wrap around.
+    """
+    center_x, center_y = buildings.center[:, 0] - pos[0], buildings.center[:, 1] - pos[1]
+    radius = buildings.radius
+    distance = np.hypot(center_x, center_y)
+    inside = distance <= radius
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        half_width = np.where(inside, np.pi, np.arcsin(np.clip(radius / distance, 0.0, 1.0)))
+
+    azimuth = np.arctan2(center_x, center_y)
+    resolution = grid[1] - grid[0]
+    # widened by one bin on both sides against rounding errors at the tangents
+    first = np.floor((azimuth - half_width - grid[0]) / resolution).astype(np.int64)
+    end = np.ceil((azimuth + half_width - grid[0]) / resolution).astype(np.int64) + 1
+    first[inside], end[inside] = 0, len(grid)
+
+    bounds = np.arctan2(buildings.top - pos[2], np.maximum(distance - radius, 0.0))
+    return bounds, first, np.minimum(end, first + len(grid))
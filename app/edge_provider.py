@@ -1,12 +1,14 @@
 import logging
-from functools import lru_cache
 from typing import Protocol
 
+import numpy as np
 from pointset import PointSet
 
-from app.edge import Edge
-from app.gml import GMLData, GMLFileList, gml_file_picker, parse_citygml
-from app.wfs import edge_list_from_wfs
+from app.cache import cache_manager
+from app.gml import GMLData, GMLFileList, gml_file_picker, load_citygml
+from app.metrics import timed
+from app.transform import get_utm_zone, to_epsg
+from app.wfs import coordinates_from_wfs, edges_from_wfs
 
 logger = logging.getLogger("root")
 
@@ -15,11 +17,15 @@ class EdgeProvider(Protocol):
     """
     Protocol for edge providers.
 
-    Edge providers are used to retrieve building edges from a given position.
-    They need to implement the get_edges method.
+    Edge providers are used to retrieve building edges as an array of shape (N, 7) from a given position.
+    They need to implement the get_edges method and the warm method, which loads
+    the data around a position into the caches without creating the edges.
     """
 
-    def get_edges(self, pos: PointSet) -> list[Edge]:
+    def get_edges(self, pos: PointSet) -> np.ndarray:
+        ...
+
+    def warm(self, pos: PointSet) -> None:
         ...
 
 
@@ -37,35 +43,44 @@ class LocalEdgeProvider:
         self.epsg = epsg
         self.lod = lod
 
-    @lru_cache(maxsize=128)
+    @cache_manager.cached(tier="gml")
     def build_gml_data(self, filepaths: GMLFileList) -> GMLData:
         """
         Builds a GMLData object from a list of filepaths.
 
         The GMLData object is cached to avoid unnecessary parsing of the same file(s).
+        A single file is used as is, i.e. memory-mapped from the shared tile store.
         """
-        coords: list[list[float]] = []
+        coords = [load_citygml(file, self.lod) for file in filepaths.files]
+        return GMLData(coordinates=coords[0] if len(coords) == 1 else np.concatenate(coords))
 
-        for file in filepaths.files:
-            coords.extend(parse_citygml(file, self.lod))
+    @cache_manager.cached(tier="edges")
+    def get_edges(self, pos: PointSet) -> np.ndarray:
+        """
+        Returns the edges for a given position.
+        """
+        gml_data = self.build_gml_data(self.pick_files(pos))
+        return gml_data.query_edges(pos.xyz)
 
-        return GMLData(coordinates=coords)
+    def warm(self, pos: PointSet) -> None:
+        """
+        Loads the gml file(s) of a given position.
+        """
+        self.build_gml_data(self.pick_files(pos))
 
-    @lru_cache(maxsize=512)
-    def get_edges(self, pos: PointSet) -> list[Edge]:
+    def pick_files(self, pos: PointSet) -> GMLFileList:
         """
-        Returns a list of edges for a given position.
+        Transforms the position to the EPSG of the data and returns the relevant gml file(s).
         """
-        pos.to_epsg(self.epsg)
-        utm_zone = int(pos.crs.utm_zone[:-1])
-        filepaths = gml_file_picker(
-            data_path=self.data_path,
-            pos=pos.xyz.flatten().tolist(),
-            utm_zone=utm_zone,
-            lod=self.lod,
-        )
-        gml_data = self.build_gml_data(filepaths)
-        return gml_data.query_edges(pos.xyz)
+        with timed("file_picking"):
+            to_epsg(pos, self.epsg)
+            utm_zone = get_utm_zone(self.epsg)
+            return gml_file_picker(
+                data_path=self.data_path,
+                pos=pos.xyz.flatten().tolist(),
+                utm_zone=utm_zone,
+                lod=self.lod,
+            )
 
 
 class WFSEdgeProvider:
@@ -80,6 +95,8 @@ class WFSEdgeProvider:
     def __init__(self) -> None:
         pass
 
-    @lru_cache(maxsize=512)
-    def get_edges(self, pos: PointSet) -> list[Edge]:
-        return edge_list_from_wfs(pos)
+    def get_edges(self, pos: PointSet) -> np.ndarray:
+        return edges_from_wfs(pos)
+
+    def warm(self, pos: PointSet) -> None:
+        coordinates_from_wfs(pos)
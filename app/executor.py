@@ -0,0 +1,153 @@
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import BrokenExecutor, Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable
+
+from fastapi import HTTPException
+
+from app.dependencies import init_dependencies
+from app.metrics import WORKER_PENDING, WORKER_REJECTIONS, collect, record, registry
+from config import METRICS_ENABLED, WORKER_PROCESSES, WORKER_QUEUE_SIZE, WORKER_RETRY_AFTER, logger
+
+
+class WorkerPool:
+    """
+    Bounded pool for the CPU-heavy parts of a request.
+
+    Jobs are executed in a pool of worker processes, or in a thread pool of the server process
+    if the number of processes is 0. At most queue_size jobs can be queued or running at the same
+    time. Further jobs are rejected with 503 and a Retry-After header instead of piling up.
+
+    Every worker runs the initializer before its first job. The ready event is set by the warm-up
+    once all workers are initialized and cleared whenever the pool is restarted.
+    """
+
+    def __init__(
+        self,
+        processes: int = WORKER_PROCESSES,
+        queue_size: int = WORKER_QUEUE_SIZE,
+        retry_after: int = WORKER_RETRY_AFTER,
+        initializer: Callable[[], None] | None = None,
+    ) -> None:
+        self.processes = processes
+        self.queue_size = queue_size
+        self.retry_after = retry_after
+        self.initializer = initializer
+        self.ready = threading.Event()
+        self.generation = 0
+        self._slots = threading.BoundedSemaphore(queue_size)
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+        self._executor: Executor | None = None
+        self._executor_lock = threading.Lock()
+
+    @property
+    def executor(self) -> Executor:
+        """
+        Returns the underlying executor, which is created on first use.
+        """
+        with self._executor_lock:
+            if self._executor is None:
+                if self.processes > 0:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.processes,
+                        mp_context=multiprocessing.get_context("spawn"),
+                        initializer=self.initializer,
+                    )
+                    logger.info("Started worker pool with %i processes", self.processes)
+                else:
+                    self._executor = ThreadPoolExecutor(thread_name_prefix="oaem-worker", initializer=self.initializer)
+                    logger.info("Started worker pool in server process")
+            return self._executor
+
+    @property
+    def pending(self) -> int:
+        """
+        Returns the number of queued and running jobs.
+        """
+        return self._pending
+
+    async def run(self, func: Callable[..., Any], *args: Any, timeout: float) -> Any:
+        """
+        Runs func(*args) in the pool and waits at most timeout seconds for the result.
+
+        Raises:
+            HTTPException: 503 if the queue is full, 504 if the job timed out.
+        """
+        if not self._slots.acquire(blocking=False):
+            logger.warning("Worker queue is full, rejecting %s", func.__name__)
+            record(WORKER_REJECTIONS, ("queue_full",))
+            raise HTTPException(
+                status_code=503,
+                detail="Server is busy, please try again later.",
+                headers={"Retry-After": str(self.retry_after)},
+            )
+
+        with self._pending_lock:
+            self._pending += 1
+            record(WORKER_PENDING, (), self._pending)
+
+        executor = self.executor
+        try:
+            # metrics recorded in the job are returned with its result, since they are lost in worker processes
+            future: Future = executor.submit(collect, func, *args) if METRICS_ENABLED else executor.submit(func, *args)
+        except BrokenExecutor as exc:
+            self._release()
+            raise self._restart(executor) from exc
+        except BaseException:
+            self._release()
+            raise
+
+        # the slot is only freed once the job has actually finished, even if the request timed out before
+        future.add_done_callback(lambda _: self._release())
+
+        try:
+            result = await asyncio.wait_for(asyncio.wrap_future(future), timeout=timeout)
+        except asyncio.TimeoutError as exc:
+            logger.warning("%s timed out after %.1f s", func.__name__, timeout)
+            record(WORKER_REJECTIONS, ("timeout",))
+            raise HTTPException(status_code=504, detail=f"{func.__name__} timed out.") from exc
+        except BrokenExecutor as exc:
+            raise self._restart(executor) from exc
+
+        if METRICS_ENABLED:
+            result, samples = result
+            registry.merge(samples)
+
+        return result
+
+    def _restart(self, executor: Executor) -> HTTPException:
+        """
+        Shuts down a broken executor, unless it was already replaced, and returns the 503 for the request.
+        """
+        logger.error("Worker pool is broken, restarting it")
+        record(WORKER_REJECTIONS, ("broken",))
+        self.shutdown(executor)
+        return HTTPException(
+            status_code=503,
+            detail="Worker pool restarted, please try again later.",
+            headers={"Retry-After": str(self.retry_after)},
+        )
+
+    def _release(self) -> None:
+        with self._pending_lock:
+            self._pending -= 1
+            record(WORKER_PENDING, (), self._pending)
+        self._slots.release()
+
+    def shutdown(self, executor: Executor | None = None) -> None:
+        """
+        Shuts down the executor and clears the ready event, only if it is still the given executor if one is given.
+        """
+        with self._executor_lock:
+            if executor is not None and executor is not self._executor:
+                return
+            self.ready.clear()
+            self.generation += 1
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+worker_pool = WorkerPool(initializer=init_dependencies)
@@ -1,10 +1,9 @@
 from enum import Enum
-from functools import lru_cache
 
-from pandas import read_csv
+import numpy as np
 from pointset import PointSet
-from scipy.interpolate import LinearNDInterpolator, NearestNDInterpolator
 
+from app.transform import transform_xyz
 from config import GEOID_EPSG, GEOID_FILE, logger
 
 
@@ -13,8 +12,8 @@ class InvalidInterpolatorError(Exception):
 
 
 class ZeroInterpolator:
-    def __call__(self, *args) -> float:
-        return 0.0
+    def __call__(self, *args) -> np.ndarray:
+        return np.zeros_like(args[0], dtype=np.float64)
 
 
 class Interpolator(Enum):
@@ -48,16 +47,20 @@ class Geoid:
         Raises:
             InvalidInterpolatorError: If an invalid interpolator type is provided.
         """
+        self.epsg = epsg
+
         if not filename:
             self.__interp = ZeroInterpolator()
             logger.info("No geoid file provided, no undulation will be applied!")
             return
 
+        from pandas import read_csv
+        from scipy.interpolate import LinearNDInterpolator, NearestNDInterpolator
+
         # read csv
         data = read_csv(filename, header=None, delim_whitespace=True)
 
         self.pos = PointSet(xyz=data.to_numpy(), epsg=epsg)
-        self.epsg = epsg
 
         # Interpolator
         if interpolator == Interpolator.NEAREST:
@@ -73,7 +76,6 @@ class Geoid:
             len(self.pos.xyz),
         )
 
-    @lru_cache(maxsize=2048)
     def interpolate(self, pos: PointSet) -> float:
         """
         Interpolates the geoid undulation for a given position.
@@ -85,8 +87,18 @@ class Geoid:
             float: The interpolated geoid undulation value.
         """
         logger.debug("Interpolating geoid undulation for position: %s", pos.xyz)
+        return float(self.interpolate_many(pos.xyz, pos.epsg)[0])
 
-        pos.to_epsg(self.epsg)
+    def interpolate_many(self, xyz: np.ndarray, epsg: int) -> np.ndarray:
+        """
+        Interpolates the geoid undulations for N positions in one call.
 
-        # interpolate
-        return self.__interp(pos.x, pos.y)
+        Args:
+            xyz (np.ndarray): Positions as an array of shape (3,) or (N, 3).
+            epsg (int): The EPSG code of the positions.
+
+        Returns:
+            np.ndarray: The interpolated geoid undulations as an array of shape (N,).
+        """
+        geoid_xyz = transform_xyz(xyz, epsg, self.epsg)
+        return np.asarray(self.__interp(geoid_xyz[:, 0], geoid_xyz[:, 1]), dtype=np.float64).reshape(-1)
@@ -1,13 +1,13 @@
 import os
 from dataclasses import dataclass, field
-from functools import lru_cache
 from typing import TypeAlias
 
 import numpy as np
 import xmltodict
-from scipy.spatial import KDTree
 
-from app.edge import Edge
+from app.edge import expand_spans
+from app.metrics import timed
+from app.tilestore import EDGE_SCALE, decode_edges, encode_edges, get_tile_store
 from config import N_RANGE, logger
 
 CoordinateList: TypeAlias = list[list[float]]
@@ -35,26 +35,49 @@ class GMLData:
     """
     Class representing the content of one or more gml files.
 
-    For efficient querying of the building edges, a KDTree is built from the coordinates.
+    The edges are kept as int32 centimetres (see tilestore.encode_edges) and only the queried
+    edges are decoded to meters. For efficient querying, a KDTree is built from the distinct
+    horizontal positions of the edge end points, which are mostly shared by several edges
+    (e.g. the corners of walls, roofs and ground surfaces). vertex_edges lists the edges of
+    every vertex, the ones of vertex i are vertex_edges[vertex_offsets[i]:vertex_offsets[i + 1]].
     """
 
-    def __init__(self, coordinates: CoordinateList) -> None:
-        self.coordinates = np.array(coordinates)
-        self.kdtree = KDTree(np.r_[self.coordinates[:, :2], self.coordinates[:, 3:5]]) if coordinates else None
-        self.edges = (
-            [Edge(start=edge_coord[:3], end=edge_coord[3:]) for edge_coord in self.coordinates] if coordinates else []
-        )
+    def __init__(self, coordinates: CoordinateList | np.ndarray) -> None:
+        from scipy.spatial import KDTree
 
-    def query_edges(self, pos: np.ndarray, n_range: float = N_RANGE) -> list[Edge]:
+        self.centimetres = encode_edges(coordinates)
+
+        with timed("kdtree_build"):
+            endpoints = np.r_[self.centimetres[:, :2], self.centimetres[:, 3:5]].astype(np.int64)
+            _, first, inverse = np.unique(
+                (endpoints[:, 0] << 32) | (endpoints[:, 1] & 0xFFFFFFFF), return_index=True, return_inverse=True
+            )
+            self.vertex_edges = (np.argsort(inverse, kind="stable") % max(len(self.centimetres), 1)).astype(np.int32)
+            self.vertex_offsets = np.r_[0, np.cumsum(np.bincount(inverse, minlength=len(first)))].astype(np.int32)
+            self.kdtree = KDTree(endpoints[first] / EDGE_SCALE) if len(self.centimetres) else None
+
+    @property
+    def nbytes(self) -> int:
         """
-        Returns a list of edges for a given position using the KDTree.
+        Estimated memory footprint of the edges and the KDTree in bytes.
         """
-        if not self.edges:
-            return []
+        kdtree_nbytes = self.kdtree.data.nbytes + self.kdtree.indices.nbytes if self.kdtree is not None else 0
+        return self.centimetres.nbytes + self.vertex_edges.nbytes + self.vertex_offsets.nbytes + kdtree_nbytes
 
-        query_indices = self.kdtree.query_ball_point(pos[:, :2].flatten(), r=n_range)
-        unique_indices = {index % len(self.edges) for index in query_indices}
-        return [self.edges[index] for index in unique_indices]
+    def query_edges(self, pos: np.ndarray, n_range: float = N_RANGE) -> np.ndarray:
+        """
+        Returns the edges with a start or end point within n_range of a given position using the KDTree.
+
+        Returns:
+            np.ndarray: The edges as an array of shape (N, 7).
+        """
+        if self.kdtree is None:
+            return np.empty((0, 7), dtype=np.float64)
+
+        with timed("kdtree_query"):
+            vertices = np.asarray(self.kdtree.query_ball_point(pos[:, :2].flatten(), r=n_range), dtype=np.int64)
+            _, slots = expand_spans(vertices, self.vertex_offsets[vertices], self.vertex_offsets[vertices + 1])
+            return decode_edges(self.centimetres[np.unique(self.vertex_edges[slots])])
 
 
 def gml_file_picker(data_path: str, pos: list[float], utm_zone: int = 32, lod: int = 2) -> GMLFileList:
@@ -179,8 +202,8 @@ def extract_lod2_coords(gml: str) -> CoordinateList:
     if not isinstance(buildings, list):
         buildings = [buildings]
 
-    for bdata in buildings:
-        building_coordinates.extend(parse_building_data(bdata))
+    for index, bdata in enumerate(buildings):
+        building_coordinates.extend([*edge, index] for edge in parse_building_data(bdata))
 
     return building_coordinates
 
@@ -196,18 +219,18 @@ def extract_lod1_coords(gml: str) -> CoordinateList:
     if not isinstance(cityobject_members, list):
         cityobject_members = [cityobject_members]
 
-    for cobj in cityobject_members:
+    for index, cobj in enumerate(cityobject_members):
         bldg = cobj.get("bldg:Building", {})
 
         # single lod1Solid
         if lod1solid := bldg.get("bldg:lod1Solid", {}):
-            building_coordinates.extend(parse_lod1solid(lod1solid))
+            building_coordinates.extend([*edge, index] for edge in parse_lod1solid(lod1solid))
 
         # multiple lod1Solids
         if bldg_parts := bldg.get("bldg:consistsOfBuildingPart", {}):
             for bpart in bldg_parts:
                 lod1solid = bpart.get("bldg:BuildingPart", {}).get("bldg:lod1Solid", {})
-                building_coordinates.extend(parse_lod1solid(lod1solid))
+                building_coordinates.extend([*edge, index] for edge in parse_lod1solid(lod1solid))
 
     return building_coordinates
 
@@ -240,7 +263,30 @@ def parse_lod1solid(lod1solid: dict) -> CoordinateList:
     return building_coordinates
 
 
-@lru_cache(maxsize=128)
+def load_citygml(filepath: str, lod: int = 2) -> np.ndarray:
+    """
+    Returns the edges of a gml file from the shared tile store.
+
+    The file is only parsed if it is not yet part of the tile store. The revision of the key is the
+    modification time and size of the file, so that updated files are parsed again and replace
+    the tiles of their earlier revisions.
+
+    Args:
+        filepath (str): Path to the gml file.
+        lod (int, optional): Level of detail. Defaults to 2.
+
+    Returns:
+        np.ndarray: The edges with coordinates in centimetres as int32 array of shape (N, 7).
+    """
+    if not os.path.isfile(filepath):
+        return encode_edges(parse_citygml(filepath, lod))
+
+    stat = os.stat(filepath)
+    name = os.path.splitext(os.path.basename(filepath))[0]
+    key = f"{name}.lod{lod}@{stat.st_mtime_ns}.{stat.st_size}"
+    return get_tile_store().get(key, lambda: parse_citygml(filepath, lod))
+
+
 def parse_citygml(filepath: str, lod: int = 2) -> CoordinateList:
     if not filepath.endswith(".gml"):
         return []
@@ -249,7 +295,7 @@ def parse_citygml(filepath: str, lod: int = 2) -> CoordinateList:
         logger.error("File %s does not exist", filepath)
         return []
 
-    with open(filepath, "r", encoding="utf-8") as f:
+    with timed("gml_parse"), open(filepath, "r", encoding="utf-8") as f:
         data = f.read()
         return extract_lod2_coords(data) if lod == 2 else extract_lod1_coords(data)
 
@@ -0,0 +1,110 @@
+"""
+HTTP caching of the OAEM responses.
+
+The OAEM of a position only depends on the position, the building data, the geoid, the
+neighbourhood and the OAEM resolution. The ETag of an /oaem response is a digest of the quantised
+position in ROUNDING_EPSG and of a data version, so that clients and proxies can revalidate responses
+with If-None-Match and get a 304 without the OAEM being computed.
+
+The data version is determined by the warm-up. Until then, /oaem responses carry no ETag, so that
+the CityGML files are not listed on the event loop.
+"""
+import hashlib
+import os
+from functools import cache
+
+import numpy as np
+from fastapi import Request
+from pyproj.exceptions import CRSError
+
+from app.transform import transform_xyz
+from config import (
+    DATA_VERSION,
+    EDGE_DATA_PATH,
+    EDGE_LOD,
+    EDGE_SOURCE,
+    ETAG_RES,
+    GEOID_FILE,
+    N_RANGE,
+    N_RES,
+    OAEM_RES,
+    ROUNDING_EPSG,
+    VERSION,
+    WFS_URL,
+)
+
+
+@cache
+def data_version() -> str:
+    """
+    Returns the version of the building data, derived from the names, sizes and modification times
+    of the CityGML files unless DATA_VERSION is set.
+
+    The version is determined once per process, like the cached tiles, which are not reloaded either.
+    """
+    if DATA_VERSION:
+        return DATA_VERSION
+
+    digest = hashlib.sha1(f"{EDGE_SOURCE}|{EDGE_LOD}|{GEOID_FILE}".encode())
+
+    if EDGE_SOURCE != "FILE":
+        digest.update(WFS_URL.encode())
+        return digest.hexdigest()[:12]
+
+    for root, _, files in sorted(os.walk(EDGE_DATA_PATH)):
+        for filename in sorted(files):
+            if filename.endswith(".gml"):
+                stat = os.stat(os.path.join(root, filename))
+                digest.update(f"{filename}|{stat.st_size}|{stat.st_mtime_ns}".encode())
+
+    return digest.hexdigest()[:12]
+
+
+def known_data_version() -> str | None:
+    """
+    Returns the data version if it was already determined, e.g. by the warm-up, and None otherwise.
+    """
+    return data_version() if data_version.cache_info().currsize else None
+
+
+def oaem_etag(pos_x: float, pos_y: float, pos_z: float, epsg: int) -> str | None:
+    """
+    Returns the ETag of the OAEM of a position or None if the position cannot be transformed
+    or the data version is not known yet.
+
+    Args:
+        pos_x (float): The x-coordinate of the position.
+        pos_y (float): The y-coordinate of the position.
+        pos_z (float): The z-coordinate of the position.
+        epsg (int): The EPSG code of the position.
+
+    Returns:
+        str | None: The quoted ETag.
+    """
+    version = known_data_version()
+    if version is None:
+        return None
+
+    try:
+        xyz = transform_xyz(np.array([pos_x, pos_y, pos_z]), epsg, ROUNDING_EPSG)[0]
+    except CRSError:
+        return None
+
+    if not np.all(np.isfinite(xyz)):
+        return None
+
+    cell = np.round(xyz / ETAG_RES).astype(np.int64).tolist()
+    key = f"{cell}|{ROUNDING_EPSG}|{OAEM_RES!r}|{N_RES}|{N_RANGE}|{version}|{VERSION}"
+    return f'"{hashlib.sha1(key.encode()).hexdigest()[:20]}"'
+
+
+def not_modified(request: Request, etag: str) -> bool:
+    """
+    Returns whether the If-None-Match header of a request matches the ETag, weak ETags included.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is None:
+        return False
+
+    candidates = {candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
@@ -0,0 +1,196 @@
+"""
+Minimal Prometheus metrics of the processing stages, the caches and the worker pool.
+
+Metrics recorded inside a job of the worker pool are collected in a thread-local buffer and
+returned to the server process together with the result of the job, so that they are not lost
+in worker processes. If METRICS_ENABLED is False, only explicitly collected jobs are recorded,
+e.g. for profiling.
+"""
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable, ContextManager, Iterator
+
+import numpy as np
+
+from config import METRICS_ENABLED
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+EDGE_BUCKETS = (0, 10, 100, 500, 1000, 2500, 5000, 10000, 20000, 50000)
+
+Sample = tuple[str, tuple[str, ...], float]
+
+_local = threading.local()
+
+
+class Metric(ABC):
+    """
+    Base class of the metrics, which store one value per combination of label values.
+    """
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: dict[tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def add(self, labels: tuple[str, ...], value: float) -> None:
+        """
+        Records a value for the given label values.
+        """
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.extend(self._render_value(labels, value))
+        return lines
+
+    def _render_value(self, labels: tuple[str, ...], value: Any) -> list[str]:
+        return [f"{self.name}{self._format_labels(labels)} {value}"]
+
+    def _format_labels(self, labels: tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{name}="{value}"' for name, value in zip(self.labelnames, labels)]
+        pairs += [extra] if extra else []
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def add(self, labels: tuple[str, ...], value: float) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + value
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def add(self, labels: tuple[str, ...], value: float) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DURATION_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = np.array(buckets, dtype=np.float64)
+
+    def add(self, labels: tuple[str, ...], value: float) -> None:
+        with self._lock:
+            counts, total = self._values.get(labels, (np.zeros(len(self.buckets) + 1, dtype=np.int64), 0.0))
+            counts[np.searchsorted(self.buckets, value)] += 1
+            self._values[labels] = (counts, total + value)
+
+    def _render_value(self, labels: tuple[str, ...], value: Any) -> list[str]:
+        counts, total = value
+        cumulative = np.cumsum(counts)
+        bounds = [f"{bound:g}" for bound in self.buckets] + ["+Inf"]
+        lines = []
+        for bound, count in zip(bounds, cumulative):
+            le_label = f'le="{bound}"'
+            lines.append(f"{self.name}_bucket{self._format_labels(labels, le_label)} {count}")
+        lines.append(f"{self.name}_sum{self._format_labels(labels)} {total}")
+        lines.append(f"{self.name}_count{self._format_labels(labels)} {cumulative[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def merge(self, samples: list[Sample]) -> None:
+        """
+        Adds the samples collected in a worker.
+        """
+        for name, labels, value in samples:
+            self.metrics[name].add(labels, value)
+
+    def render(self) -> str:
+        """
+        Returns all metrics in the Prometheus text format.
+        """
+        return "\n".join(line for metric in self.metrics.values() for line in metric.render()) + "\n"
+
+
+registry = Registry()
+
+STAGE_DURATION = registry.register(
+    Histogram("oaem_stage_duration_seconds", "Duration of the processing stages.", ("stage",))
+)
+REQUEST_DURATION = registry.register(
+    Histogram("oaem_request_duration_seconds", "Duration of the HTTP requests.", ("path", "status"))
+)
+QUERY_EDGES = registry.register(
+    Histogram("oaem_query_edges", "Number of building edges per OAEM computation.", buckets=EDGE_BUCKETS)
+)
+CACHE_REQUESTS = registry.register(
+    Counter("oaem_cache_requests_total", "Lookups of the in-memory caches.", ("tier", "result"))
+)
+CACHE_EVICTIONS = registry.register(
+    Counter("oaem_cache_evictions_total", "Evictions from the in-memory caches.", ("tier",))
+)
+WORKER_REJECTIONS = registry.register(
+    Counter("oaem_worker_rejections_total", "Jobs rejected by the worker pool.", ("reason",))
+)
+TRACK_POSITIONS = registry.register(
+    Counter("oaem_track_positions_total", "Positions received by tracking sessions.", ("result",))
+)
+WORKER_PENDING = registry.register(Gauge("oaem_worker_pending_jobs", "Queued and running jobs of the worker pool."))
+
+
+def record(metric: Metric, labels: tuple[str, ...], value: float = 1) -> None:
+    """
+    Records a value, or collects it if called within collect.
+    """
+    samples: list[Sample] | None = getattr(_local, "samples", None)
+
+    if samples is not None:
+        samples.append((metric.name, labels, value))
+    elif METRICS_ENABLED:
+        metric.add(labels, value)
+
+
+@contextmanager
+def _timed(stage: str) -> Iterator[None]:
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(STAGE_DURATION, (stage,), time.perf_counter() - start_time)
+
+
+def timed(stage: str) -> ContextManager:
+    """
+    Context manager recording the duration of a processing stage.
+    """
+    return _timed(stage) if METRICS_ENABLED or getattr(_local, "samples", None) is not None else nullcontext()
+
+
+def collect(func: Callable[..., Any], *args: Any) -> tuple[Any, list[Sample]]:
+    """
+    Runs func(*args) and returns its result together with the samples recorded meanwhile.
+    """
+    previous = getattr(_local, "samples", None)
+    samples = _local.samples = []
+    try:
+        return func(*args), samples
+    finally:
+        _local.samples = previous
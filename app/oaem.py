@@ -2,13 +2,29 @@ import time
 from dataclasses import dataclass, field
 
 import numpy as np
-from intervaltree import Interval, IntervalTree
 from pointset import PointSet
 
-from app.dependencies import edge_provider, geoid
-from app.edge import Edge
+from app.dependencies import get_edge_provider, get_geoid
+from app.edge import (
+    Buildings,
+    azimuth_spans,
+    building_bounds,
+    elevation_at,
+    elevation_bounds,
+    expand_spans,
+    summarise_buildings,
+)
+from app.metrics import QUERY_EDGES, record, timed
+from app.transform import transform_xyz
 from config import GEOID_RES, N_RES, OAEM_RES, ROUNDING_EPSG, logger
 
+AZIMUTH_GRID = np.arange(-np.pi, np.pi, OAEM_RES)
+AZIMUTH_SIN = np.sin(AZIMUTH_GRID)
+AZIMUTH_COS = np.cos(AZIMUTH_GRID)
+BOUND_MARGIN = 1e-9  # radians, guards the elevation bounds against rounding errors
+CULLING_MIN_EDGES = 500  # edges above the position from which buildings are culled, fewer are evaluated at once
+CULLING_BATCH = 16  # buildings of the first culling batch, every following batch is eight times larger
+
 
 @dataclass
 class Oaem:
@@ -21,12 +37,36 @@ class Oaem:
     azimuth: np.ndarray = field(default_factory=lambda: np.arange(-np.pi, np.pi, OAEM_RES))
     elevation: np.ndarray = field(default_factory=lambda: np.zeros_like(np.arange(0, 2 * np.pi, OAEM_RES)))
     res: float = OAEM_RES
+    winners: np.ndarray | None = field(default=None, repr=False)
+    cell: tuple[float, ...] | None = None
+    buildings: Buildings | None = field(default=None, repr=False)
 
     def __post_init__(self) -> None:
         az_idx = np.argsort(self.azimuth)
         self.azimuth = self.azimuth[az_idx]
         self.elevation = self.elevation[az_idx]
 
+        if self.winners is not None:
+            self.winners = self.winners[az_idx]
+
+    def warm_start(self, cell: tuple[float, ...]) -> np.ndarray | None:
+        """
+        Returns the indices of the edges dominating this OAEM, if it was computed with the edges of the given cell.
+        """
+        if self.winners is None or self.cell != cell:
+            return None
+
+        return np.unique(self.winners[self.winners >= 0])
+
+    def buildings_of(self, cell: tuple[float, ...], edges: np.ndarray) -> Buildings:
+        """
+        Returns the summary of the buildings of the edges of the given cell, reused if this OAEM has the same cell.
+        """
+        if self.buildings is None or self.cell != cell:
+            return summarise_buildings(edges)
+
+        return self.buildings
+
     @property
     def az_el_str(self) -> str:
         """
@@ -44,18 +84,26 @@ class Oaem:
         Returns:
             float: The elevation in radians.
         """
-        if azimuth > np.pi:
-            azimuth -= 2 * np.pi
+        return float(self.query_many(np.array([azimuth]))[0])
+
+    def query_many(self, azimuth: np.ndarray) -> np.ndarray:
+        """
+        Interpolates the elevation for an array of azimuth angles of any shape.
 
-        return float(np.interp(azimuth, self.azimuth, self.elevation))
+        The OAEM is interpolated periodically, i.e. azimuths outside [-pi, pi) are wrapped around
+        and the gap between the last and the first bin is bridged.
 
+        Args:
+            azimuth (np.ndarray): The azimuth angles in radians.
 
-def compute_oaem(
-    pos_x: float,
-    pos_y: float,
-    pos_z: float,
-    epsg: int,
-) -> Oaem:
+        Returns:
+            np.ndarray: The elevations in radians with the shape of azimuth.
+        """
+        azimuth = np.asarray(azimuth, dtype=np.float64)
+        return np.interp(azimuth.ravel(), self.azimuth, self.elevation, period=2 * np.pi).reshape(azimuth.shape)
+
+
+def compute_oaem(pos_x: float, pos_y: float, pos_z: float, epsg: int, previous: Oaem | None = None) -> Oaem:
     """
     Computes an Obstruction Adaptive Elevation Model (OAEM) for a given position.
 
@@ -64,16 +112,16 @@ def compute_oaem(
         pos_y (float): The y-coordinate of the position.
         pos_z (float): The z-coordinate of the position.
         epsg (int): The EPSG code of the position.
+        previous (Oaem, optional): The OAEM of a nearby position. If it was computed with the same edges,
+                                   its dominating edges are used as warm start. Defaults to None.
 
     Returns:
         Oaem: An Obstruction Adaptive Elevation Model (OAEM) that stores the elevation data for the given position.
     """
     query_time = time.time()
-    pos = PointSet(xyz=np.array([pos_x, pos_y, pos_z]), epsg=epsg, init_local_transformer=False)
-    pos.to_epsg(ROUNDING_EPSG)
-    pos.z -= geoid.interpolate(pos.round_to(GEOID_RES))
-    edge_list = edge_provider.get_edges(pos.round_to(N_RES))
-    oaem = oaem_from_edge_list(edge_list, pos)
+    with timed("compute_oaem"):
+        xyz = prepare_positions(np.array([pos_x, pos_y, pos_z]), epsg)
+        oaem = oaem_at(xyz[0], previous)
     response_time = time.time()
 
     logger.info(
@@ -87,74 +135,245 @@ def compute_oaem(
     return oaem
 
 
-def oaem_from_edge_list(edge_list: list[Edge], pos: PointSet) -> Oaem:
+def compute_oaem_track(xyz: np.ndarray, epsg: int) -> list[Oaem]:
     """
-    Computes an Obstruction Adaptive Elevation Model (OAEM) for a given position from a list of building edges.
+    Computes the OAEMs along a trajectory.
+
+    Consecutive positions within the same neighbourhood cell share their edges, so the buildings
+    are summarised once per cell and every OAEM is refined from the previous one instead of being
+    computed from scratch.
 
     Args:
-        edge_list (list[Edge]): A list of edges that define the building boundaries.
+        xyz (np.ndarray): The positions as an array of shape (N, 3).
+        epsg (int): The EPSG code of the positions.
+
+    Returns:
+        list[Oaem]: The OAEMs of the positions.
+    """
+    with timed("compute_oaem_track"):
+        oaems: list[Oaem] = []
+        cell, edges, buildings = None, np.empty((0, 7)), None
+        for position in prepare_positions(xyz, epsg):
+            previous = oaems[-1] if oaems else None
+            if cell_of(position) != cell:
+                cell, edges = edges_of_cell(position)
+                buildings = summarise_buildings(edges)
+
+            pos = PointSet(xyz=position[None], epsg=ROUNDING_EPSG, init_local_transformer=False)
+            warm_start = previous.warm_start(cell) if previous is not None else None
+            oaems.append(oaem_from_edges(edges, pos, warm_start, buildings))
+            oaems[-1].cell = cell
+
+    return oaems
+
+
+def oaem_at(xyz: np.ndarray, previous: Oaem | None = None) -> Oaem:
+    """
+    Computes the OAEM for a position of shape (3,) in ROUNDING_EPSG, already reduced by the geoid undulation.
+    """
+    cell, edges = edges_of_cell(xyz)
+    pos = PointSet(xyz=xyz[None], epsg=ROUNDING_EPSG, init_local_transformer=False)
+
+    if previous is None:
+        oaem = oaem_from_edges(edges, pos)
+    else:
+        oaem = oaem_from_edges(edges, pos, previous.warm_start(cell), previous.buildings_of(cell, edges))
+
+    oaem.cell = cell
+    return oaem
+
+
+def cell_of(xyz: np.ndarray) -> tuple[float, ...]:
+    """
+    Returns the neighbourhood cell of a position of shape (3,), i.e. the position rounded to N_RES.
+    """
+    return tuple((np.round(xyz / N_RES) * N_RES).tolist())
+
+
+def edges_of_cell(xyz: np.ndarray) -> tuple[tuple[float, ...], np.ndarray]:
+    """
+    Returns the neighbourhood cell of a position of shape (3,) in ROUNDING_EPSG and the edges of the cell.
+    """
+    cell = cell_of(xyz)
+    edges = get_edge_provider().get_edges(
+        PointSet(xyz=np.array([cell]), epsg=ROUNDING_EPSG, init_local_transformer=False)
+    )
+    record(QUERY_EDGES, (), len(edges))
+    return cell, edges
+
+
+def prepare_positions(xyz: np.ndarray, epsg: int) -> np.ndarray:
+    """
+    Transforms N positions to the rounding coordinate system and reduces their heights by the geoid undulation.
+
+    Args:
+        xyz (np.ndarray): Positions as an array of shape (3,) or (N, 3).
+        epsg (int): The EPSG code of the positions.
+
+    Returns:
+        np.ndarray: The positions in ROUNDING_EPSG as an array of shape (N, 3).
+    """
+    with timed("transform"):
+        xyz = transform_xyz(xyz, epsg, ROUNDING_EPSG)
+
+    with timed("geoid"):
+        xyz[:, 2] -= get_geoid().interpolate_many(np.round(xyz / GEOID_RES) * GEOID_RES, ROUNDING_EPSG)
+
+    return xyz
+
+
+def oaem_from_edges(
+    edges: np.ndarray, pos: PointSet, warm_start: np.ndarray | None = None, buildings: Buildings | None = None
+) -> Oaem:
+    """
+    Computes an Obstruction Adaptive Elevation Model (OAEM) for a given position from building edges.
+
+    Args:
+        edges (np.ndarray): The edges that define the building boundaries as an array of shape (N, 7).
         pos (PointSet): The query position.
+        warm_start (np.ndarray, optional): Indices of edges that are likely to dominate some bins, e.g. the
+                                           winners of the OAEM of a nearby position with the same edges.
+        buildings (Buildings, optional): The summary of the buildings of the edges, kept by the OAEM
+                                         for the following positions. Computed if needed by default.
 
     Returns:
         Oaem: An Obstruction Adaptive Elevation Model (OAEM) that stores the elevation data for the given position.
     """
-    if not edge_list:
-        return Oaem(pos=pos)
-
-    interval_tree = build_interval_tree(edge_list=edge_list, pos=pos.xyz.ravel())
-    oaem_grid = np.arange(-np.pi, np.pi, OAEM_RES)
-    oaem_temp = np.zeros((len(oaem_grid), 2), dtype=np.float64)
+    with timed("azimuth_evaluation"):
+        elevation, winners = evaluate_edges(edges, pos.xyz.ravel(), warm_start, buildings)
 
-    for i, az in enumerate(oaem_grid):
-        overlaps: set[Interval] = interval_tree[az]
-        oaem_temp[i, 0] = az
-        oaem_temp[i, 1] = max(
-            0,
-            max(
-                (edge_list[overlap.data].get_elevation(az) for overlap in overlaps),
-                default=0,
-            ),
-        )
-    return Oaem(pos=pos, azimuth=oaem_temp[:, 0], elevation=oaem_temp[:, 1])
+    return Oaem(pos=pos, azimuth=AZIMUTH_GRID.copy(), elevation=elevation, winners=winners, buildings=buildings)
 
 
-def build_interval_tree(edge_list: list[Edge], pos: np.ndarray) -> IntervalTree:
+def evaluate_edges(
+    edges: np.ndarray, pos: np.ndarray, warm_start: np.ndarray | None = None, buildings: Buildings | None = None
+) -> tuple[np.ndarray, np.ndarray]:
     """
-    Builds an interval tree from a list of edges that define the building boundaries and a position.
+    Evaluates the maximum elevation of the edges in every azimuth bin.
+
+    Only edges above the position can raise the mask above the horizon. With many such edges, the
+    buildings are evaluated in batches in the order of their elevation bound, i.e. near and tall
+    buildings first. Buildings whose bound does not exceed the mask established so far anywhere in
+    their azimuth extent are skipped as a whole, e.g. low buildings behind taller ones. The elevation
+    of an edge is bounded by the elevation at its horizontal distance and the azimuth spans and bins
+    where this bound does not exceed the mask are skipped.
+
+    When buildings are culled, the buildings of the warm start edges are evaluated first, so that the
+    mask of a nearby position only needs to be refined: all remaining buildings are culled against
+    this mask at once.
 
     Args:
-        edge_list (list[Edge]): A list of edges that define the building boundaries.
-        pos (np.ndarray): The position as a numpy array of shape (3,) in the format (x, y, z).
+        edges (np.ndarray): The edges as an array of shape (N, 7).
+        pos (np.ndarray): The position as an array of shape (3,).
+        warm_start (np.ndarray, optional): Indices of edges whose buildings are evaluated first.
+        buildings (Buildings, optional): The summary of the buildings of the edges, computed if needed by default.
 
     Returns:
-        IntervalTree: An interval tree that stores the intervals of azimuth angles that intersect with the edges.
-    """
-
-    def add_to_interval_tree(interval_tree: IntervalTree, start: float, end: float, data: float) -> None:
-        if start == end:
-            return
-        interval_tree.addi(start, end, data)
-
-    interval_tree = IntervalTree()
-    start_time = time.time()
-    for i, edge in enumerate(edge_list):
-        edge.set_position(pos=pos)
-        az_1 = np.arctan2(edge.start[0] - pos[0], edge.start[1] - pos[1])
-        az_2 = np.arctan2(edge.end[0] - pos[0], edge.end[1] - pos[1])
-        if np.sign(az_1) != np.sign(az_2) and np.abs(az_1 - az_2) > np.pi:
-            add_to_interval_tree(interval_tree=interval_tree, start=-np.pi, end=min(az_1, az_2), data=i)
-            add_to_interval_tree(interval_tree=interval_tree, start=max(az_1, az_2), end=np.pi, data=i)
-        else:
-            add_to_interval_tree(
-                interval_tree=interval_tree,
-                start=min(az_1, az_2),
-                end=max(az_1, az_2),
-                data=i,
-            )
-
-    logger.debug(
-        "Building interval tree with %i intervals took %.3f seconds",
-        len(interval_tree),
-        time.time() - start_time,
-    )
-    return interval_tree
+        tuple[np.ndarray, np.ndarray]: The elevation per bin in radians and the index of the edge
+                                       dominating each bin, -1 if no edge is above the horizon.
+    """
+    elevation = np.zeros(len(AZIMUTH_GRID), dtype=np.float64)
+    winners = np.full(len(AZIMUTH_GRID), -1, dtype=np.int64)
+    candidates = np.flatnonzero(edges[:, 2] > pos[2]) if len(edges) else np.empty(0, dtype=np.int64)
+    if len(candidates) < CULLING_MIN_EDGES:
+        _evaluate_candidates(edges, pos, candidates, elevation, winners, bound_check=True)
+        return elevation, winners
+
+    buildings = buildings if buildings is not None else summarise_buildings(edges)
+    warm = warm_start is not None and len(warm_start) > 0
+
+    if warm:
+        # whole buildings, since the dominating edges of near buildings change with every step
+        warm_buildings = np.unique(np.searchsorted(buildings.starts, warm_start, side="right") - 1)
+        _evaluate_buildings(edges, pos, buildings, warm_buildings, elevation, winners, bound_check=False)
+
+    bounds, first, end = building_bounds(buildings, pos, AZIMUTH_GRID)
+    order = np.flatnonzero(buildings.top > pos[2])
+
+    if warm:
+        batch_size = len(order)
+    else:
+        order, batch_size = order[np.argsort(-bounds[order])], CULLING_BATCH
+
+    batch_start = 0
+    while batch_start < len(order):
+        batch = order[batch_start : batch_start + batch_size]
+        batch = batch[bounds[batch] + BOUND_MARGIN > _span_minimum(elevation, first[batch], end[batch])]
+        _evaluate_buildings(edges, pos, buildings, batch, elevation, winners, bound_check=True)
+        batch_start, batch_size = batch_start + batch_size, batch_size * 8
+
+    return elevation, winners
+
+
+def _span_minimum(elevation: np.ndarray, first: np.ndarray, end: np.ndarray) -> np.ndarray:
+    """
+    Returns the minimum of the mask over the bins first..end (exclusive, modulo the number of bins), inf if empty.
+
+    The spans are answered in constant time from a sparse table of the mask repeated twice, whose row k
+    holds the minima of all runs of 2**k bins. A span is covered by two such runs from both of its ends.
+    """
+    n_bins = len(elevation)
+    table = np.full((int(np.log2(n_bins)) + 1, 2 * n_bins), np.inf)
+    table[0] = np.r_[elevation, elevation]
+    for k in range(1, len(table)):
+        run = 2 ** (k - 1)
+        table[k, : 2 * n_bins - run] = np.minimum(table[k - 1, :-run], table[k - 1, run:])
+
+    counts = np.clip(end - first, 0, n_bins)
+    covered = counts > 0
+    start, counts = first[covered] % n_bins, counts[covered]
+    k = np.frexp(counts)[1] - 1
+
+    minimum = np.full(len(first), np.inf)
+    minimum[covered] = np.minimum(table[k, start], table[k, start + counts - 2**k])
+    return minimum
+
+
+def _evaluate_buildings(
+    edges: np.ndarray,
+    pos: np.ndarray,
+    buildings: Buildings,
+    selection: np.ndarray,
+    elevation: np.ndarray,
+    winners: np.ndarray,
+    bound_check: bool,
+) -> None:
+    _, members = expand_spans(selection, buildings.starts[selection], buildings.stops[selection])
+    _evaluate_candidates(edges, pos, members[edges[members, 2] > pos[2]], elevation, winners, bound_check)
+
+
+def _evaluate_candidates(
+    edges: np.ndarray,
+    pos: np.ndarray,
+    candidates: np.ndarray,
+    elevation: np.ndarray,
+    winners: np.ndarray,
+    bound_check: bool,
+) -> None:
+    if not len(candidates):
+        return
+
+    candidate_edges = edges[candidates]
+    index, first, end = azimuth_spans(candidate_edges, pos, AZIMUTH_GRID)
+
+    if bound_check:
+        bounds = elevation_bounds(candidate_edges, pos)
+
+    if bound_check and elevation.any():
+        # spans whose bound does not exceed the mask anywhere are skipped before they are expanded to bins
+        relevant = bounds[index] + BOUND_MARGIN > _span_minimum(elevation, first, end)
+        index, first, end = index[relevant], first[relevant], end[relevant]
+
+    index, bins = expand_spans(index, first, end)
+
+    if bound_check:
+        relevant = bounds[index] + BOUND_MARGIN > elevation[bins]
+        index, bins = index[relevant], bins[relevant]
+
+    values = elevation_at(candidate_edges[index], pos, AZIMUTH_SIN[bins], AZIMUTH_COS[bins])
+    above = values > elevation[bins]
+    index, bins, values = index[above], bins[above], values[above]
+
+    np.maximum.at(elevation, bins, values)
+    dominating = values == elevation[bins]
+    winners[bins[dominating]] = candidates[index[dominating]]
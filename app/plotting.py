@@ -1,12 +1,101 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import Any
 
 import numpy as np
-import plotly.graph_objects as go
 
+from app.metrics import timed
 from app.oaem import Oaem
 from app.suntrack import SunTrack
 
+MASK_COLOR = "#96d0ff"
+SUN_TRACK_COLOR = "#000000"
+SUN_POSITION_COLOR = "#ffd700"
+POLAR_BGCOLOR = "#c2c2c2"
+PAPER_BGCOLOR = "#e5ecf6"
+
+MASK_TRACE = dict(fill="toself", fillcolor=MASK_COLOR, name="Obstruction Adaptive Elevation Mask")
+SUN_TRACK_TRACE = dict(name="Sun Trajectory", line=dict(color=SUN_TRACK_COLOR))
+SUN_POSITION_TRACE = dict(name="Sun Position", mode="markers", marker=dict(size=40, color=SUN_POSITION_COLOR))
+
+COMPACT_SUN_TRACK_FREQ = timedelta(minutes=5)  # sampling of the sun track in the compact plot data
+COMPACT_DECIMALS = 2  # number of decimals of the angles in the compact plot data
+
+
+def create_layout(width: int = 600, height: int = 600, heading: float = 0.0) -> dict:
+    """
+    Returns the layout of the skyplot as a plain dictionary.
+    """
+    return dict(
+        polar=dict(
+            angularaxis=dict(direction="clockwise", rotation=90 + heading),
+            radialaxis=dict(
+                angle=90,
+                tickmode="array",
+                tickvals=[0, 15, 30, 45, 60, 75],
+                ticktext=["90°", "75°", "60°", "45°", "30°", "15°"],
+                tickangle=90,
+            ),
+            bgcolor=POLAR_BGCOLOR,
+        ),
+        width=width,
+        height=height,
+        font=dict(size=30),
+        showlegend=False,
+        paper_bgcolor=PAPER_BGCOLOR,
+        plot_bgcolor="#fff",
+    )
+
+
+def create_plot_template() -> dict:
+    """
+    Returns the static part of the skyplot, i.e. the layout and the trace styles.
+
+    Clients can fetch the template once and combine it with the compact plot data of create_plot_data.
+    """
+    return {
+        "layout": create_layout(),
+        "traces": {
+            "mask": dict(type="scatterpolar", **MASK_TRACE),
+            "sun_track": dict(type="scatterpolar", **SUN_TRACK_TRACE),
+            "sun": dict(type="scatterpolar", **SUN_POSITION_TRACE),
+        },
+    }
+
+
+def to_polar(azimuth: np.ndarray, elevation: np.ndarray) -> dict:
+    """
+    Converts azimuth and elevation in radians to the theta and r coordinates of the skyplot in degrees.
+    """
+    return {
+        "theta": np.round(np.rad2deg(azimuth), COMPACT_DECIMALS).tolist(),
+        "r": np.round(np.rad2deg(np.pi / 2 - np.asarray(elevation)), COMPACT_DECIMALS).tolist(),
+    }
+
+
+def create_plot_data(oaem: Oaem, sun_track: SunTrack) -> dict:
+    """
+    Returns only the changing data of the skyplot, i.e. the OAEM, the sun track and the current sun position.
+
+    Args:
+        oaem (Oaem): The OAEM object containing the azimuth and elevation data.
+        sun_track (SunTrack): The sun track for the position of the OAEM.
+
+    Returns:
+        dict: theta and r coordinates in degrees of the mask, the sun track and the sun position.
+              The sun position is None if the sun is below the horizon.
+    """
+    today_sun_track = sun_track.get_sun_track(
+        date=datetime.now().astimezone(), freq=COMPACT_SUN_TRACK_FREQ, daylight_only=True
+    )
+    current_sun_az, current_sun_el = sun_track.current_sunpos
+
+    with timed("plot_serialisation"):
+        return {
+            "mask": to_polar(oaem.azimuth, oaem.elevation),
+            "sun_track": to_polar(today_sun_track[:, 1], today_sun_track[:, 2]),
+            "sun": to_polar(current_sun_az, current_sun_el) if current_sun_el > 0 else None,
+        }
+
 
 def create_json_fig(width: int, height: int, heading: float, oaem: Oaem, sun_track: SunTrack) -> str | None | Any:
     """
@@ -21,57 +110,37 @@ def create_json_fig(width: int, height: int, heading: float, oaem: Oaem, sun_tra
     Returns:
         str: A JSON string representation of the Plotly figure.
     """
+    import plotly.graph_objects as go
+
     today_sun_track = sun_track.get_sun_track(date=datetime.now().astimezone(), daylight_only=True)
 
-    fig = go.Figure()
+    with timed("plot_serialisation"):
+        fig = go.Figure()
 
-    fig.add_trace(
-        trace=go.Scatterpolar(
-            theta=np.rad2deg(oaem.azimuth),
-            r=np.rad2deg(np.pi / 2 - oaem.elevation),
-            fill="toself",
-            fillcolor="#96d0ff",
-            name="Obstruction Adaptive Elevation Mask",
-        ),
-    )
-
-    fig.add_trace(
-        trace=go.Scatterpolar(
-            theta=np.rad2deg(today_sun_track[:, 1]),
-            r=np.rad2deg(np.pi / 2 - today_sun_track[:, 2]),
-            name="Sun Trajectory",
-            line_color="black",
-        ),
-    )
-    current_sun_az, current_sun_el = sun_track.current_sunpos
-    if current_sun_el > 0:
         fig.add_trace(
             trace=go.Scatterpolar(
-                theta=[np.rad2deg(current_sun_az)],
-                r=[np.rad2deg(np.pi / 2 - current_sun_el)],
-                name="Sun Position",
-                mode="markers",
-                marker=dict(size=40, color="gold"),
+                theta=np.rad2deg(oaem.azimuth),
+                r=np.rad2deg(np.pi / 2 - oaem.elevation),
+                **MASK_TRACE,
             ),
         )
 
-    fig.update_layout(
-        polar=dict(
-            angularaxis=dict(direction="clockwise", rotation=90 + heading),
-            radialaxis=dict(
-                angle=90,
-                tickmode="array",
-                tickvals=[0, 15, 30, 45, 60, 75],
-                ticktext=["90°", "75°", "60°", "45°", "30°", "15°"],
-                tickangle=90,
+        fig.add_trace(
+            trace=go.Scatterpolar(
+                theta=np.rad2deg(today_sun_track[:, 1]),
+                r=np.rad2deg(np.pi / 2 - today_sun_track[:, 2]),
+                **SUN_TRACK_TRACE,
             ),
-            bgcolor="#c2c2c2",
-        ),
-        width=width,
-        height=height,
-        font=dict(size=30),
-        showlegend=False,
-        paper_bgcolor="#e5ecf6",
-        plot_bgcolor="#fff",
-    )
-    return fig.to_json()
+        )
+        current_sun_az, current_sun_el = sun_track.current_sunpos
+        if current_sun_el > 0:
+            fig.add_trace(
+                trace=go.Scatterpolar(
+                    theta=[np.rad2deg(current_sun_az)],
+                    r=[np.rad2deg(np.pi / 2 - current_sun_el)],
+                    **SUN_POSITION_TRACE,
+                ),
+            )
+
+        fig.update_layout(**create_layout(width=width, height=height, heading=heading))
+        return fig.to_json()
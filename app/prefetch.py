@@ -0,0 +1,355 @@
+"""
+Cache warm-up for bounding boxes, CityGML tiles and trajectories.
+
+Positions are reduced to the neighbourhood cells of N_RES meters for which compute_oaem requests
+the building edges. Warming a cell parses the underlying CityGML tiles or sends the WFS request,
+so that the first request in an area does not pay for it. Parsed tiles and WFS responses are kept
+in the shared tile store, parsed tiles additionally in the memory of the worker that executed the job.
+
+Usage:
+
+    python -m app.prefetch --bbox 364000 5620000 366000 5622000
+    python -m app.prefetch --tiles 364_5620 364_5621 --z 60
+    python -m app.prefetch --trajectory track.csv --epsg 4326
+"""
+import argparse
+import asyncio
+import re
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+import numpy as np
+from fastapi import HTTPException
+
+from app import tasks
+from app.executor import WorkerPool, worker_pool
+from app.transform import transform_xyz
+from config import (
+    EDGE_EPSG,
+    N_RES,
+    PREFETCH_CHUNK_SIZE,
+    PREFETCH_DISTANCE,
+    PREFETCH_HORIZON,
+    PREFETCH_MAX_AGE,
+    PREFETCH_PARALLELISM,
+    PREFETCH_TIMEOUT,
+    ROUNDING_EPSG,
+    logger,
+)
+
+TILE_PATTERN = re.compile(r"^(\d+)_(\d+)$")
+TILE_SIZE = 1000  # meters, size of the CityGML tiles
+MAX_JOBS = 32  # number of warm-up jobs kept for status requests
+MAX_CLIENTS = 1024  # number of clients tracked by the predictive prefetcher
+MAX_WARMED_CELLS = 16384  # number of recently prefetched cells that are not prefetched again
+
+
+def to_cells(xyz: np.ndarray, epsg: int) -> np.ndarray:
+    """
+    Reduces N positions to their unique neighbourhood cells, keeping the order of the positions.
+
+    Args:
+        xyz (np.ndarray): Positions as an array of shape (3,) or (N, 3).
+        epsg (int): The EPSG code of the positions.
+
+    Returns:
+        np.ndarray: The cells in ROUNDING_EPSG as an array of shape (M, 3).
+    """
+    cells = np.round(transform_xyz(xyz, epsg, ROUNDING_EPSG) / N_RES) * N_RES
+    _, index = np.unique(cells, axis=0, return_index=True)
+    return cells[np.sort(index)]
+
+
+def check_cell_count(count: float, max_cells: int | None) -> None:
+    """
+    Checks the number of cells of a warm-up before the cells are created.
+
+    Raises:
+        ValueError: If the count exceeds max_cells.
+    """
+    if max_cells is not None and count > max_cells:
+        raise ValueError(f"{count:.0f} cells requested, at most {max_cells} are allowed.")
+
+
+def bbox_cells(
+    min_x: float,
+    min_y: float,
+    max_x: float,
+    max_y: float,
+    epsg: int,
+    z: float = 0.0,
+    max_cells: int | None = None,
+) -> np.ndarray:
+    """
+    Returns the neighbourhood cells covering a bounding box.
+
+    The bounding box is given in the coordinate system of the EPSG code and transformed to ROUNDING_EPSG.
+
+    Raises:
+        ValueError: If the bounding box is not finite or covers more than max_cells cells.
+    """
+    corners = transform_xyz(
+        np.array([[min_x, min_y, z], [max_x, min_y, z], [min_x, max_y, z], [max_x, max_y, z]]), epsg, ROUNDING_EPSG
+    )
+    if not np.all(np.isfinite(corners)):
+        raise ValueError("The bounding box must be finite.")
+
+    # the size of the grid is checked before it is created
+    n_x, n_y = np.floor(np.ptp(corners[:, :2], axis=0) / N_RES) + 2
+    check_cell_count(float(n_x) * float(n_y), max_cells)
+
+    grid_x = np.arange(corners[:, 0].min(), corners[:, 0].max() + N_RES, N_RES)
+    grid_y = np.arange(corners[:, 1].min(), corners[:, 1].max() + N_RES, N_RES)
+    grid = np.stack(np.meshgrid(grid_x, grid_y), axis=-1).reshape(-1, 2)
+    return to_cells(np.c_[grid, np.full(len(grid), corners[:, 2].mean())], ROUNDING_EPSG)
+
+
+def tile_cells(tiles: list[str], z: float = 0.0, max_cells: int | None = None) -> np.ndarray:
+    """
+    Returns the neighbourhood cells covering CityGML tiles.
+
+    Tiles are given as "{XXX}_{YYYY}" like in the names of the Geobasis NRW CityGML files, e.g. "364_5621".
+
+    Raises:
+        ValueError: If a tile name is invalid or the tiles cover more than max_cells cells.
+    """
+    tiles = list(dict.fromkeys(tiles))
+    check_cell_count(len(tiles) * (TILE_SIZE // N_RES + 1) ** 2, max_cells)
+
+    cells = []
+    for tile in tiles:
+        match = TILE_PATTERN.match(tile)
+
+        if match is None:
+            raise ValueError(f"Invalid tile {tile}, expected {{XXX}}_{{YYYY}}")
+
+        min_x, min_y = int(match.group(1)) * TILE_SIZE, int(match.group(2)) * TILE_SIZE
+        cells.append(bbox_cells(min_x, min_y, min_x + TILE_SIZE, min_y + TILE_SIZE, EDGE_EPSG, z))
+
+    return to_cells(np.concatenate(cells), ROUNDING_EPSG) if cells else np.empty((0, 3))
+
+
+def trajectory_cells(xyz: np.ndarray, epsg: int, max_cells: int | None = None) -> np.ndarray:
+    """
+    Returns the neighbourhood cells along a trajectory.
+
+    The trajectory is resampled every N_RES meters, so that no cell between two epochs is missed.
+
+    Raises:
+        ValueError: If the trajectory is not finite or longer than max_cells cells.
+    """
+    xyz = transform_xyz(xyz, epsg, ROUNDING_EPSG)
+
+    if not np.all(np.isfinite(xyz)):
+        raise ValueError("The trajectory must be finite.")
+
+    distance = np.r_[0.0, np.cumsum(np.linalg.norm(np.diff(xyz[:, :2], axis=0), axis=1))]
+    check_cell_count(distance[-1] / N_RES + 1, max_cells)
+    samples = np.arange(0.0, distance[-1] + N_RES, N_RES)
+    resampled = np.c_[tuple(np.interp(samples, distance, xyz[:, i]) for i in range(3))]
+    return to_cells(resampled, ROUNDING_EPSG)
+
+
+@dataclass
+class WarmJob:
+    """
+    Progress of a warm-up of neighbourhood cells.
+    """
+
+    cells: int
+    job_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    warmed: int = 0
+    failed: int = 0
+    start_time: float = field(default_factory=time.time)
+    end_time: float | None = None
+
+    @property
+    def status(self) -> str:
+        return "running" if self.end_time is None else "finished"
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "cells": self.cells,
+            "warmed": self.warmed,
+            "failed": self.failed,
+            "duration": (self.end_time or time.time()) - self.start_time,
+        }
+
+
+class Prefetcher:
+    """
+    Warms neighbourhood cells in the worker pool with bounded parallelism.
+
+    The cells are split into chunks of chunk_size cells and at most parallelism chunks are
+    queued or running at the same time. If the worker pool is full, the chunk is retried
+    after the Retry-After delay of the pool, so that a warm-up never fails user requests.
+    """
+
+    def __init__(
+        self,
+        pool: WorkerPool = worker_pool,
+        parallelism: int = PREFETCH_PARALLELISM,
+        chunk_size: int = PREFETCH_CHUNK_SIZE,
+        timeout: float = PREFETCH_TIMEOUT,
+    ) -> None:
+        self.pool = pool
+        self.parallelism = parallelism
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self._jobs: OrderedDict[str, WarmJob] = OrderedDict()
+        self._tasks: set[asyncio.Task] = set()
+
+    async def warm(self, cells: np.ndarray, job: WarmJob | None = None) -> WarmJob:
+        """
+        Warms the given cells of shape (N, 3) in ROUNDING_EPSG and waits until all chunks are done.
+        """
+        job = job or WarmJob(cells=len(cells))
+        semaphore = asyncio.Semaphore(self.parallelism)
+        chunks = [cells[i : i + self.chunk_size] for i in range(0, len(cells), self.chunk_size)]
+        await asyncio.gather(*(self._warm_chunk(chunk, job, semaphore) for chunk in chunks))
+        job.end_time = time.time()
+        logger.info("Warmed %i of %i cells in %.3f s", job.warmed, job.cells, job.end_time - job.start_time)
+        return job
+
+    def start(self, cells: np.ndarray) -> WarmJob:
+        """
+        Starts warming the given cells in the background and returns the job for status requests.
+        """
+        job = WarmJob(cells=len(cells))
+        self._jobs[job.job_id] = job
+
+        while len(self._jobs) > MAX_JOBS:
+            self._jobs.popitem(last=False)
+
+        task = asyncio.create_task(self.warm(cells, job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    def get_job(self, job_id: str) -> WarmJob | None:
+        return self._jobs.get(job_id)
+
+    async def _warm_chunk(self, chunk: np.ndarray, job: WarmJob, semaphore: asyncio.Semaphore) -> None:
+        async with semaphore:
+            while True:
+                try:
+                    warmed = await self.pool.run(tasks.warm_cells, chunk, timeout=self.timeout)
+                    job.warmed += warmed
+                    return
+                except HTTPException as exc:
+                    if exc.status_code != 503:
+                        logger.warning("Warm-up of %i cells failed: %s", len(chunk), exc.detail)
+                        job.failed += len(chunk)
+                        return
+
+                    await asyncio.sleep(self.pool.retry_after)
+                except Exception:
+                    logger.exception("Warm-up of %i cells failed", len(chunk))
+                    job.failed += len(chunk)
+                    return
+
+
+class PredictivePrefetcher:
+    """
+    Warms the cells ahead of moving clients.
+
+    The velocity of a client is estimated from its last two positions. The cells along the
+    extrapolated path of the next horizon seconds, but at most distance meters, are warmed in
+    the background. Prefetching only takes place while the worker pool is less than half full,
+    so that it never competes with user requests.
+    """
+
+    def __init__(
+        self,
+        prefetcher: Prefetcher,
+        horizon: float = PREFETCH_HORIZON,
+        distance: float = PREFETCH_DISTANCE,
+        max_age: float = PREFETCH_MAX_AGE,
+    ) -> None:
+        self.prefetcher = prefetcher
+        self.horizon = horizon
+        self.distance = distance
+        self.max_age = max_age
+        self._positions: OrderedDict[str, tuple[np.ndarray, float]] = OrderedDict()
+        self._warmed: OrderedDict[bytes, None] = OrderedDict()
+        self._tasks: set[asyncio.Task] = set()
+
+    def observe(self, client: str, pos_x: float, pos_y: float, pos_z: float, epsg: int) -> None:
+        """
+        Records the position of a client and prefetches the cells ahead of it.
+        """
+        now = time.monotonic()
+        xyz = transform_xyz(np.array([pos_x, pos_y, pos_z]), epsg, ROUNDING_EPSG)[0]
+        previous = self._positions.pop(client, None)
+        self._positions[client] = (xyz, now)
+
+        while len(self._positions) > MAX_CLIENTS:
+            self._positions.popitem(last=False)
+
+        if previous is None or not 0 < now - previous[1] <= self.max_age:
+            return
+
+        velocity = (xyz[:2] - previous[0][:2]) / (now - previous[1])
+        speed = np.linalg.norm(velocity)
+        distance = min(speed * self.horizon, self.distance)
+
+        if distance < N_RES:
+            return
+
+        steps = np.arange(N_RES, distance + N_RES, N_RES)
+        ahead = np.c_[xyz[:2] + steps[:, None] * velocity / speed, np.full(len(steps), xyz[2])]
+        cells = np.array([cell for cell in to_cells(ahead, ROUNDING_EPSG) if cell.tobytes() not in self._warmed])
+
+        if len(cells) == 0 or self.prefetcher.pool.pending >= self.prefetcher.pool.queue_size // 2:
+            return
+
+        for cell in cells:
+            self._warmed[cell.tobytes()] = None
+
+        while len(self._warmed) > MAX_WARMED_CELLS:
+            self._warmed.popitem(last=False)
+
+        logger.debug("Prefetching %i cells ahead of %s", len(cells), client)
+        task = asyncio.create_task(self.prefetcher.warm(cells))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+
+prefetcher = Prefetcher()
+predictive_prefetcher = PredictivePrefetcher(Prefetcher(parallelism=1))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Warms the shared tile store and the edge caches.")
+    parser.add_argument("--bbox", nargs=4, type=float, metavar=("MIN_X", "MIN_Y", "MAX_X", "MAX_Y"))
+    parser.add_argument("--tiles", nargs="+", default=[], metavar="XXX_YYYY")
+    parser.add_argument("--trajectory", help="csv file with x, y, z columns (whitespace or comma separated)")
+    parser.add_argument("--epsg", type=int, default=ROUNDING_EPSG, help="EPSG code of the bbox and the trajectory")
+    parser.add_argument("--z", type=float, default=0.0, help="height of the bbox and the tiles")
+    args = parser.parse_args()
+
+    cells = [tile_cells(args.tiles, args.z)]
+
+    if args.bbox is not None:
+        cells.append(bbox_cells(*args.bbox, epsg=args.epsg, z=args.z))
+
+    if args.trajectory is not None:
+        delimiter = "," if args.trajectory.endswith(".csv") else None
+        cells.append(trajectory_cells(np.loadtxt(args.trajectory, delimiter=delimiter, ndmin=2)[:, :3], args.epsg))
+
+    all_cells = to_cells(np.concatenate(cells), ROUNDING_EPSG)
+
+    if len(all_cells) == 0:
+        parser.error("nothing to warm, specify --bbox, --tiles or --trajectory")
+
+    job = asyncio.run(prefetcher.warm(all_cells))
+    worker_pool.shutdown()
+    print(job.to_dict())
+
+
+if __name__ == "__main__":
+    main()
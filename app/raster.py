@@ -0,0 +1,367 @@
+"""
+Server-side rendering of the skyplot as PNG or SVG image.
+
+The PNG is rasterised with NumPy only: the azimuth and elevation of every pixel are
+precomputed once per image size together with a background sprite and the polar grid.
+The heading only shifts the OAEM azimuth bins, so rendering an image requires a vectorised
+comparison of the pixel elevations with the shifted OAEM and drawing the sun track and the
+sun position. The image is an indexed-color image, i.e. every pixel holds an index into PALETTE.
+"""
+import struct
+import zlib
+from dataclasses import dataclass
+from datetime import datetime
+
+import numpy as np
+
+from app.cache import CacheManager
+from app.metrics import timed
+from app.oaem import Oaem
+from app.plotting import MASK_COLOR, PAPER_BGCOLOR, POLAR_BGCOLOR, SUN_POSITION_COLOR, SUN_TRACK_COLOR
+from app.suntrack import SunTrack
+from config import OAEM_RES, SKYPLOT_CACHE_BUDGET
+
+GRID_COLOR = "#ffffff"
+GRID_RINGS = (15, 30, 45, 60, 75)  # zenith distances of the elevation grid lines in degrees
+GRID_SPOKES = 30  # spacing of the azimuth grid lines in degrees
+MARGIN = 0.05  # relative margin around the polar area
+SUN_TRACK_WIDTH = 2  # pixels
+SUN_RADIUS = 0.035  # relative to the image size
+PNG_COMPRESSION = 1  # skyplots consist of large flat areas, higher levels barely reduce the size
+
+
+# palette indices of the indexed-color image
+PAPER, POLAR, MASK, GRID, SUN_TRACK, SUN_POSITION = range(6)
+
+
+def hex_to_rgb(color: str) -> list[int]:
+    return [int(color[i : i + 2], 16) for i in (1, 3, 5)]
+
+
+# the polar grids are large and kept apart from the caches of the OAEM computation
+skyplot_cache = CacheManager(budget=SKYPLOT_CACHE_BUDGET)
+
+PALETTE = np.array(
+    [
+        hex_to_rgb(color)
+        for color in (PAPER_BGCOLOR, POLAR_BGCOLOR, MASK_COLOR, GRID_COLOR, SUN_TRACK_COLOR, SUN_POSITION_COLOR)
+    ],
+    dtype=np.uint8,
+)
+
+
+@dataclass(frozen=True)
+class SkyplotGeometry:
+    """
+    Mapping of azimuth and elevation to the pixels of a skyplot with a given size and heading.
+    """
+
+    width: int
+    height: int
+    heading: float
+
+    @property
+    def center(self) -> tuple[float, float]:
+        return self.width / 2, self.height / 2
+
+    @property
+    def radius(self) -> float:
+        return min(self.width, self.height) / 2 * (1 - 2 * MARGIN)
+
+    @property
+    def oaem_grid(self) -> np.ndarray:
+        return np.arange(-np.pi, np.pi, OAEM_RES)
+
+    def to_pixels(self, azimuth: np.ndarray, elevation: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Converts azimuth and elevation in radians to pixel coordinates.
+        """
+        r = (np.pi / 2 - np.asarray(elevation)) / (np.pi / 2) * self.radius
+        phi = np.asarray(azimuth) - np.deg2rad(self.heading)
+        return self.center[0] + r * np.sin(phi), self.center[1] - r * np.cos(phi)
+
+
+@dataclass(frozen=True)
+class PolarGrid:
+    """
+    Precomputed pixels of a skyplot of a given size, independent of the heading.
+
+    Attributes:
+        width (int): The width of the skyplot in pixels.
+        height (int): The height of the skyplot in pixels.
+        inside (np.ndarray): Flat indices of all pixels inside the horizon.
+        azimuth (np.ndarray): Azimuth of the inside pixels in radians at heading 0.
+        elevation (np.ndarray): Elevation of the inside pixels in radians.
+        left (np.ndarray): Index of the OAEM azimuth bin left of the inside pixels at heading 0.
+        weights (np.ndarray): Linear interpolation weight of the right OAEM azimuth bin at heading 0.
+        grid (np.ndarray): Flat indices of the grid line pixels.
+        sprite (np.ndarray): Flat indexed-color background image without the grid lines.
+    """
+
+    width: int
+    height: int
+    inside: np.ndarray
+    azimuth: np.ndarray
+    elevation: np.ndarray
+    left: np.ndarray
+    weights: np.ndarray
+    grid: np.ndarray
+    sprite: np.ndarray
+
+    @property
+    def nbytes(self) -> int:
+        return sum(
+            array.nbytes
+            for array in (
+                self.inside,
+                self.azimuth,
+                self.elevation,
+                self.left,
+                self.weights,
+                self.grid,
+                self.sprite,
+            )
+        )
+
+
+@skyplot_cache.cached(tier="skyplot")
+def polar_grid(width: int, height: int) -> PolarGrid:
+    """
+    Computes the pixel geometry and the background sprite of a skyplot at heading 0.
+
+    The result is kept within SKYPLOT_CACHE_BUDGET, since clients usually request the same image size repeatedly.
+    """
+    geometry = SkyplotGeometry(width=width, height=height, heading=0.0)
+    center, radius = geometry.center, geometry.radius
+
+    cols, rows = np.meshgrid(np.arange(width, dtype=np.float32) + 0.5, np.arange(height, dtype=np.float32) + 0.5)
+    dx = (cols - center[0]).ravel()
+    dy = (center[1] - rows).ravel()
+    distance = np.hypot(dx, dy)
+
+    inside = np.flatnonzero(distance <= radius).astype(np.int32)
+    azimuth = np.arctan2(dx[inside], dy[inside])
+    zenith = distance[inside] / radius * 90
+
+    # grid lines are one pixel wide rings and spokes
+    ring_distance = np.min(np.abs(zenith[:, None] - np.array(GRID_RINGS, dtype=np.float32)), axis=1) / 90 * radius
+    spoke_angle = np.deg2rad(GRID_SPOKES)
+    spoke_distance = np.abs((azimuth + spoke_angle / 2) % spoke_angle - spoke_angle / 2) * distance[inside]
+    on_grid = (ring_distance < 0.6) | (spoke_distance < 0.6) | (distance[inside] > radius - 1)
+
+    # interpolation in the regular OAEM azimuth grid
+    n_bins = len(geometry.oaem_grid)
+    bin_position = (azimuth + np.pi) / OAEM_RES
+    left = np.floor(bin_position).astype(np.int32)
+
+    sprite = np.full(height * width, PAPER, dtype=np.uint8)
+    sprite[inside] = POLAR
+
+    return PolarGrid(
+        width=width,
+        height=height,
+        inside=inside,
+        azimuth=azimuth,
+        elevation=np.deg2rad(90 - zenith),
+        left=(left % n_bins).astype(np.int16),
+        weights=(bin_position - left).astype(np.float32),
+        grid=inside[on_grid],
+        sprite=sprite,
+    )
+
+
+def rasterise_skyplot(
+    grid: PolarGrid, heading: float, oaem: Oaem, sun_track: np.ndarray, sun_position: tuple[float, float]
+) -> np.ndarray:
+    """
+    Rasterises the skyplot into an indexed-color image.
+
+    Args:
+        grid (PolarGrid): The precomputed pixel geometry.
+        heading (float): The heading of the plot in degrees.
+        oaem (Oaem): The OAEM object containing the azimuth and elevation data.
+        sun_track (np.ndarray): The sun track as an array of shape (N, 3) with time, azimuth and elevation.
+        sun_position (tuple[float, float]): The current azimuth and elevation of the sun in radians.
+
+    Returns:
+        np.ndarray: The palette indices of the image as an array of shape (height, width).
+    """
+    image = grid.sprite.copy()
+
+    # free sky view
+    image[grid.inside[grid.elevation > interpolate_mask(grid, heading, oaem)]] = MASK
+    image[grid.grid] = GRID
+
+    geometry = SkyplotGeometry(width=grid.width, height=grid.height, heading=heading)
+    image = image.reshape(geometry.height, geometry.width)
+
+    if len(sun_track) > 1:
+        x, y = geometry.to_pixels(sun_track[:, 1], sun_track[:, 2])
+        draw_polyline(image, x, y, SUN_TRACK)
+
+    if sun_position[1] > 0:
+        x, y = geometry.to_pixels(*sun_position)
+        draw_disc(image, float(x), float(y), SUN_RADIUS * min(geometry.width, geometry.height), SUN_POSITION)
+
+    return image
+
+
+def interpolate_mask(grid: PolarGrid, heading: float, oaem: Oaem) -> np.ndarray:
+    """
+    Interpolates the OAEM elevation at the azimuth of every inside pixel for the given heading in degrees.
+
+    OAEMs on the regular grid use the precomputed bins and weights: the heading is split into whole bins,
+    which shift the OAEM, and a fraction of a bin, which is added to the weights. Other OAEMs are
+    interpolated periodically.
+    """
+    oaem_grid = SkyplotGeometry(width=grid.width, height=grid.height, heading=heading).oaem_grid
+
+    if len(oaem.azimuth) == len(oaem_grid) and np.allclose(oaem.azimuth, oaem_grid):
+        offset = np.deg2rad(heading) / OAEM_RES % len(oaem_grid)
+        shift = int(offset)
+
+        # elevation of the bins i + shift, continued by two bins for the right neighbours of the carried pixels
+        elevation = np.roll(oaem.elevation.astype(np.float32), -shift)
+        elevation = np.r_[elevation, elevation[:2]]
+
+        weights = grid.weights + np.float32(offset - shift)
+        carry = weights >= 1
+        left = grid.left + carry
+        weights -= carry
+        left_elevation = elevation[left]
+        return left_elevation + weights * (elevation[left + 1] - left_elevation)
+
+    return np.interp(grid.azimuth + np.deg2rad(heading), oaem.azimuth, oaem.elevation, period=2 * np.pi)
+
+
+def draw_polyline(image: np.ndarray, x: np.ndarray, y: np.ndarray, color: int) -> None:
+    """
+    Draws a polyline by resampling it with half a pixel spacing.
+    """
+    length = np.r_[0, np.cumsum(np.hypot(np.diff(x), np.diff(y)))]
+    samples = np.arange(0, length[-1], 0.5)
+    cols = np.interp(samples, length, x).astype(np.int64)
+    rows = np.interp(samples, length, y).astype(np.int64)
+
+    for offset in range(SUN_TRACK_WIDTH):
+        valid = (cols + offset < image.shape[1]) & (rows + offset < image.shape[0]) & (cols >= 0) & (rows >= 0)
+        image[rows[valid], cols[valid] + offset] = color
+        image[rows[valid] + offset, cols[valid]] = color
+
+
+def draw_disc(image: np.ndarray, x: float, y: float, radius: float, color: int) -> None:
+    row_min, row_max = max(int(y - radius), 0), min(int(y + radius) + 1, image.shape[0])
+    col_min, col_max = max(int(x - radius), 0), min(int(x + radius) + 1, image.shape[1])
+    rows, cols = np.ogrid[row_min:row_max, col_min:col_max]
+    disc = (rows + 0.5 - y) ** 2 + (cols + 0.5 - x) ** 2 <= radius**2
+    image[row_min:row_max, col_min:col_max][disc] = color
+
+
+def encode_png(image: np.ndarray) -> bytes:
+    """
+    Encodes an indexed-color image as PNG without any imaging library.
+    """
+    height, width = image.shape
+    scanlines = np.empty((height, width + 1), dtype=np.uint8)
+    scanlines[:, 0] = 0  # no filter
+    scanlines[:, 1:] = image
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 3, 0, 0, 0))
+        + chunk(b"PLTE", PALETTE.tobytes())
+        + chunk(b"IDAT", zlib.compress(scanlines.tobytes(), PNG_COMPRESSION))
+        + chunk(b"IEND", b"")
+    )
+
+
+def create_png(width: int, height: int, heading: float, oaem: Oaem, sun_track: SunTrack) -> bytes:
+    """
+    Creates a PNG skyplot of the Obstruction Adaptive Elevation Mask (OAEM).
+
+    Args:
+        width (int): The width of the image in pixels.
+        height (int): The height of the image in pixels.
+        heading (float): The heading of the plot in degrees.
+        oaem (Oaem): The OAEM object containing the azimuth and elevation data.
+        sun_track (SunTrack): The sun track for the position of the OAEM.
+
+    Returns:
+        bytes: The PNG image.
+    """
+    today_sun_track = sun_track.get_sun_track(date=datetime.now().astimezone(), daylight_only=True)
+    sunpos = sun_track.current_sunpos
+
+    with timed("image_rendering"):
+        return encode_png(rasterise_skyplot(polar_grid(width, height), heading, oaem, today_sun_track, sunpos))
+
+
+def create_svg(width: int, height: int, heading: float, oaem: Oaem, sun_track: SunTrack) -> str:
+    """
+    Creates an SVG skyplot of the Obstruction Adaptive Elevation Mask (OAEM).
+
+    Args:
+        width (int): The width of the image in pixels.
+        height (int): The height of the image in pixels.
+        heading (float): The heading of the plot in degrees.
+        oaem (Oaem): The OAEM object containing the azimuth and elevation data.
+        sun_track (SunTrack): The sun track for the position of the OAEM.
+
+    Returns:
+        str: The SVG image.
+    """
+    today_sun_track = sun_track.get_sun_track(date=datetime.now().astimezone(), daylight_only=True)
+    sunpos = sun_track.current_sunpos
+
+    with timed("image_rendering"):
+        return render_svg(width, height, heading, oaem, today_sun_track, sunpos)
+
+
+def render_svg(
+    width: int, height: int, heading: float, oaem: Oaem, sun_track: np.ndarray, sunpos: tuple[float, float]
+) -> str:
+    """
+    Renders the SVG skyplot from the OAEM, the sun track of shape (N, 3) and the current sun position.
+    """
+    sun_az, sun_el = sunpos
+    geometry = SkyplotGeometry(width=width, height=height, heading=heading)
+    cx, cy = geometry.center
+
+    def points(x: np.ndarray, y: np.ndarray) -> str:
+        return " ".join(f"{xi:.1f},{yi:.1f}" for xi, yi in zip(x, y))
+
+    elements = [
+        f'<rect width="{width}" height="{height}" fill="{PAPER_BGCOLOR}"/>',
+        f'<circle cx="{cx}" cy="{cy}" r="{geometry.radius:.1f}" fill="{POLAR_BGCOLOR}"/>',
+        f'<polygon points="{points(*geometry.to_pixels(oaem.azimuth, oaem.elevation))}" fill="{MASK_COLOR}"/>',
+    ]
+
+    for ring in (*GRID_RINGS, 90):
+        elements.append(
+            f'<circle cx="{cx}" cy="{cy}" r="{ring / 90 * geometry.radius:.1f}" fill="none" stroke="{GRID_COLOR}"/>'
+        )
+
+    spokes = np.deg2rad(np.arange(0, 360, GRID_SPOKES))
+    for x, y in zip(*geometry.to_pixels(spokes, np.zeros_like(spokes))):
+        elements.append(f'<line x1="{cx}" y1="{cy}" x2="{x:.1f}" y2="{y:.1f}" stroke="{GRID_COLOR}"/>')
+
+    if len(sun_track) > 1:
+        elements.append(
+            f'<polyline points="{points(*geometry.to_pixels(sun_track[:, 1], sun_track[:, 2]))}" '
+            f'fill="none" stroke="{SUN_TRACK_COLOR}" stroke-width="{SUN_TRACK_WIDTH}"/>'
+        )
+
+    if sun_el > 0:
+        x, y = geometry.to_pixels(sun_az, sun_el)
+        elements.append(
+            f'<circle cx="{x:.1f}" cy="{y:.1f}" r="{SUN_RADIUS * min(width, height):.1f}" fill="{SUN_POSITION_COLOR}"/>'
+        )
+
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" viewBox="0 0 {width} {height}">'
+        + "".join(elements)
+        + "</svg>"
+    )
@@ -1,18 +1,65 @@
-from typing import Annotated
-
-from fastapi import APIRouter, Depends, Request
-from fastapi.responses import FileResponse
+import base64
+import binascii
+from typing import Annotated, Literal
+
+import numpy as np
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, WebSocket
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response
 from fastapi.templating import Jinja2Templates
-
+from pydantic import BaseModel, PrivateAttr, ValidationError, model_validator
+from pyproj.exceptions import CRSError
+
+from app import tasks
+from app.admin import profiling_requested
+from app.executor import worker_pool
+from app.http_cache import not_modified, oaem_etag
+from app.metrics import registry
 from app.oaem import Oaem, compute_oaem
-from app.plotting import create_json_fig
+from app.plotting import create_plot_template
+from app.prefetch import predictive_prefetcher
 from app.suntrack import SunTrack
-from config import FAVICON_PATH, VERSION
+from app.tracking import TrackingSession
+from config import (
+    FAVICON_PATH,
+    MAX_IMAGE_SIZE,
+    METRICS_ENABLED,
+    N_RES,
+    OAEM_MAX_AGE,
+    OAEM_TIMEOUT,
+    PLOT_TEMPLATE_MAX_AGE,
+    PLOT_TIMEOUT,
+    PREFETCH_ENABLED,
+    PROFILE_TIMEOUT,
+    SUNVIS_TIMEOUT,
+    TRACK_TOLERANCE,
+    VERSION,
+    VISIBILITY_MAX_BODY_SIZE,
+    VISIBILITY_MAX_OBSERVATIONS,
+    VISIBILITY_MAX_POSITIONS,
+    VISIBILITY_TIMEOUT,
+)
 
 router = APIRouter()
 templates = Jinja2Templates(directory="app/templates")
 
 
+async def get_oaem(request: Request, pos_x: float, pos_y: float, pos_z: float, epsg: int) -> Oaem:
+    """Computes the OAEM in the worker pool and prefetches the cells ahead of the client."""
+    if PREFETCH_ENABLED and request.client is not None:
+        predictive_prefetcher.observe(request.client.host, pos_x, pos_y, pos_z, epsg)
+
+    return await worker_pool.run(compute_oaem, pos_x, pos_y, pos_z, epsg, timeout=OAEM_TIMEOUT)
+
+
+def get_heading(heading: float = 0.0) -> float:
+    """Validates the heading of a skyplot in degrees, which must be finite."""
+    if not np.isfinite(heading):
+        raise HTTPException(status_code=422, detail="The heading must be a finite number of degrees.")
+
+    return heading
+
+
 @router.get("/favicon.ico", include_in_schema=False)
 async def favicon():
     """Favicon endpoint."""
@@ -25,8 +72,36 @@ async def index(request: Request):
     return templates.TemplateResponse("index.html", {"request": request, "version": VERSION})
 
 
+@router.get("/ready")
+async def readiness() -> JSONResponse:
+    """
+    Readiness probe, returns 200 once the geoid and the edge data are initialized in all workers and 503 before.
+    """
+    is_ready = worker_pool.ready.is_set()
+    return JSONResponse(content={"ready": is_ready}, status_code=200 if is_ready else 503)
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics() -> PlainTextResponse:
+    """
+    Stage durations, cache lookups and worker pool statistics in the Prometheus text format.
+    """
+    if not METRICS_ENABLED:
+        return PlainTextResponse("Metrics are disabled.", status_code=404)
+
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
 @router.get("/oaem")
-async def request_oaem(oaem: Annotated[Oaem, Depends(compute_oaem)]) -> dict:
+async def request_oaem(
+    request: Request,
+    response: Response,
+    pos_x: float,
+    pos_y: float,
+    pos_z: float,
+    epsg: int,
+    profile: Annotated[bool, Depends(profiling_requested)],
+) -> dict:
     """
     Computes the Obstruction Adaptive Elevation Mask (OAEM) for a given position and EPSG code.
 
@@ -36,12 +111,17 @@ async def request_oaem(oaem: Annotated[Oaem, Depends(compute_oaem)]) -> dict:
     Note: The OAEM data provided by this API is currently available only for the state of North Rhine-Westphalia (NRW), Germany.
     If the provided position is outside the area of operation, an empty OAEM is returned.
 
+    The response carries an ETag derived from the position and the version of the building data.
+    If it matches the If-None-Match header, 304 Not Modified is returned without computing the OAEM.
+
     Args:
 
         pos_x (float): The x-coordinate of the position.
         pos_y (float): The y-coordinate of the position.
         pos_z (float): The z-coordinate of the position.
         epsg (int): The EPSG code specifying the coordinate reference system (CRS) of the provided position.
+        profile (bool, optional): If true, the computation is profiled with cProfile. Can also be requested
+                                  with the header X-Profile: 1. Requires the admin token. Defaults to false.
 
     Returns:
 
@@ -50,13 +130,238 @@ async def request_oaem(oaem: Annotated[Oaem, Depends(compute_oaem)]) -> dict:
             - data (str): The OAEM data represented as a string in azimuth:elevation format.
                           If the position is outside the area of operation, the OAEM will be empty.
                           Azimuth and elevation are given in radians.
+            - profile (dict): Only if profiled, the number of edges, the durations of the processing stages
+                              in seconds and the cProfile report.
     """
+    if profile:
+        try:
+            oaem, report = await worker_pool.run(
+                tasks.profile_oaem, pos_x, pos_y, pos_z, epsg, timeout=PROFILE_TIMEOUT
+            )
+        except tasks.ProfilerBusyError as exc:
+            raise HTTPException(
+                status_code=503,
+                detail=f"{exc} Please try again later.",
+                headers={"Retry-After": str(worker_pool.retry_after)},
+            ) from exc
+
+        response.headers["Cache-Control"] = "no-store"
+        return {"data": oaem.az_el_str, "profile": report}
+
+    etag = oaem_etag(pos_x, pos_y, pos_z, epsg)
+    if etag is not None:
+        headers = {"ETag": etag, "Cache-Control": f"public, max-age={OAEM_MAX_AGE}"}
+        if not_modified(request, etag):
+            return Response(status_code=304, headers=headers)
+
+        response.headers.update(headers)
+
+    oaem = await get_oaem(request, pos_x, pos_y, pos_z, epsg)
     return {"data": oaem.az_el_str}
 
 
+class VisibilityRequest(BaseModel):
+    positions: list[tuple[float, float, float]]
+    epsg: int
+    azimuth: str | list[list[float | None]]
+    elevation: str | list[list[float | None]]
+    shape: tuple[int, int] | None = None
+    degrees: bool = False
+    encoding: Literal["base64", "list"] = "base64"
+
+    _azimuth: np.ndarray = PrivateAttr()
+    _elevation: np.ndarray = PrivateAttr()
+
+    @model_validator(mode="after")
+    def check_observations(self) -> "VisibilityRequest":
+        if isinstance(self.azimuth, str) and isinstance(self.elevation, str):
+            if self.shape is None or min(self.shape) < 1:
+                raise ValueError("shape E x S is required for base64 encoded observations.")
+
+            if self.shape[0] * self.shape[1] > VISIBILITY_MAX_OBSERVATIONS:
+                raise ValueError(f"At most {VISIBILITY_MAX_OBSERVATIONS} observations are allowed per request.")
+
+            self._azimuth = decode_observations(self.azimuth, self.shape)
+            self._elevation = decode_observations(self.elevation, self.shape)
+        elif isinstance(self.azimuth, list) and isinstance(self.elevation, list):
+            n_satellites = len(self.azimuth[0]) if self.azimuth else 0
+            if n_satellites == 0 or any(len(row) != n_satellites for row in self.azimuth):
+                raise ValueError("azimuth must be a non-empty rectangular array of shape E x S.")
+
+            if len(self.elevation) != len(self.azimuth) or any(len(row) != n_satellites for row in self.elevation):
+                raise ValueError("azimuth and elevation must be arrays of the same shape E x S.")
+
+            if len(self.azimuth) * n_satellites > VISIBILITY_MAX_OBSERVATIONS:
+                raise ValueError(f"At most {VISIBILITY_MAX_OBSERVATIONS} observations are allowed per request.")
+
+            self._azimuth = np.array(self.azimuth, dtype=np.float64)
+            self._elevation = np.array(self.elevation, dtype=np.float64)
+        else:
+            raise ValueError("azimuth and elevation must both be base64 strings or both be nested lists.")
+
+        if len(self.positions) not in (1, len(self._azimuth)):
+            raise ValueError("Provide one position or one position per epoch.")
+
+        if len(set(self.positions)) > VISIBILITY_MAX_POSITIONS:
+            raise ValueError(f"At most {VISIBILITY_MAX_POSITIONS} distinct positions are allowed per request.")
+
+        if self.degrees:
+            self._azimuth, self._elevation = np.deg2rad(self._azimuth), np.deg2rad(self._elevation)
+
+        return self
+
+    def observations(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns the positions of shape (1, 3) or (E, 3) and the azimuths and elevations in radians of shape (E, S).
+        """
+        return np.array(self.positions, dtype=np.float64), self._azimuth, self._elevation
+
+
+def decode_observations(data: str, shape: tuple[int, int]) -> np.ndarray:
+    """
+    Decodes base64 little-endian float32 observations of shape E x S, NaN for missing observations.
+    """
+    try:
+        values = np.frombuffer(base64.b64decode(data, validate=True), dtype="<f4")
+    except binascii.Error as exc:
+        raise ValueError("Observations must be base64 encoded.") from exc
+
+    if len(values) != shape[0] * shape[1]:
+        raise ValueError(f"Expected {shape[0] * shape[1]} float32 values, got {len(values)}.")
+
+    return values.astype(np.float64).reshape(shape)
+
+
+async def read_body(request: Request, max_size: int) -> bytes:
+    """
+    Reads the request body and rejects it with 413 as soon as it exceeds max_size bytes.
+    """
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > max_size:
+        raise HTTPException(status_code=413, detail=f"The request body must not exceed {max_size} bytes.")
+
+    body = bytearray()
+    async for chunk in request.stream():
+        body.extend(chunk)
+        if len(body) > max_size:
+            raise HTTPException(status_code=413, detail=f"The request body must not exceed {max_size} bytes.")
+
+    return bytes(body)
+
+
+def parse_visibility_request(body: bytes) -> VisibilityRequest:
+    """
+    Parses and validates a /visibility request, raises HTTPException 422 if it is invalid.
+    """
+    try:
+        return VisibilityRequest.model_validate_json(body)
+    except ValidationError as exc:
+        raise HTTPException(
+            status_code=422, detail=exc.errors(include_url=False, include_context=False, include_input=False)
+        ) from exc
+
+
+@router.post(
+    "/visibility",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": VisibilityRequest.model_json_schema()}},
+        }
+    },
+)
+async def request_satellite_visibility(request: Request) -> dict:
+    """
+    Intersects a block of satellite observations (epochs x satellites) with the OAEM in one vectorised pass.
+
+    The body is parsed and validated in a thread, so that large requests do not block the server.
+    For large blocks, the observations should be sent as base64 instead of nested lists, which is
+    several times smaller and faster to parse.
+
+    Args:
+
+        positions (list[list[float]]): One position x, y, z of a static receiver or one position per epoch.
+        epsg (int): The EPSG code of the positions.
+        azimuth (str | list[list[float]]): The azimuths of the satellites per epoch, as base64 little-endian
+                                           float32 of shape E x S or as nested lists, NaN or null for missing
+                                           observations.
+        elevation (str | list[list[float]]): The elevations of the satellites per epoch, like azimuth.
+        shape (list[int], optional): The number of epochs and satellites, required for base64 observations.
+        degrees (bool, optional): Whether the angles are given in degrees instead of radians. Defaults to false.
+        encoding (str, optional): "base64" for compact binary arrays or "list" for nested lists. Defaults to "base64".
+
+    Returns:
+
+        A JSON object with:
+
+            - shape (list[int]): The number of epochs and satellites.
+            - bitmask (str): Only for "base64", whether the satellites are above the OAEM as packed bits,
+                             every epoch starts at a new byte and the first satellite is the most significant bit.
+            - visible (list[list[bool]]): Only for "list", whether the satellites are above the OAEM.
+            - margin (str | list[list[float]]): The elevation above the OAEM in radians, as base64 little-endian
+                                                float32 with NaN for missing observations or as nested lists.
+    """
+    body = await read_body(request, VISIBILITY_MAX_BODY_SIZE)
+    visibility_request = await run_in_threadpool(parse_visibility_request, body)
+    positions, azimuth, elevation = visibility_request.observations()
+
+    try:
+        return await worker_pool.run(
+            tasks.satellite_visibility,
+            positions,
+            visibility_request.epsg,
+            azimuth,
+            elevation,
+            visibility_request.encoding,
+            timeout=VISIBILITY_TIMEOUT,
+        )
+    except CRSError as exc:
+        raise HTTPException(status_code=422, detail=f"Invalid EPSG code {visibility_request.epsg}.") from exc
+
+
+@router.websocket("/ws/track")
+async def track(
+    websocket: WebSocket,
+    tolerance: Annotated[float, Query(ge=0, le=N_RES)] = TRACK_TOLERANCE,
+    masks: bool = True,
+) -> None:
+    """
+    Streams the OAEM and the visibility of satellites to a moving client.
+
+    The client sends its positions as JSON messages and receives one response per answered position.
+    The OAEM is only recomputed if the position moves more than the tolerance or enters another
+    neighbourhood cell, otherwise the last OAEM is reused.
+
+    Args:
+
+        tolerance (float, optional): Distance in meters the position may move before the OAEM is recomputed.
+                                     Defaults to TRACK_TOLERANCE.
+        masks (bool, optional): If false, only the satellite visibility is sent. Defaults to true.
+
+    Messages:
+
+        pos_x, pos_y, pos_z (float): The position.
+        epsg (int): The EPSG code of the position.
+        seq (int, optional): Sequence number, returned in the response.
+        satellites (dict, optional): Satellites as name: [azimuth, elevation] in radians.
+
+    Responses:
+
+        - seq (int): The sequence number of the answered position.
+        - skipped (int): Number of positions skipped since the last response, since they arrived during a computation.
+        - updated (bool): Whether the OAEM was recomputed.
+        - data (str): Only if updated, the OAEM in azimuth:elevation format.
+        - visible (dict): Only if satellites were sent, whether each satellite is above the OAEM.
+        - error: Only if the position could not be answered.
+    """
+    await websocket.accept()
+    client = f"{websocket.client.host}:{websocket.client.port}" if websocket.client is not None else "websocket"
+    await TrackingSession(client, tolerance, masks).serve(websocket)
+
+
 @router.get("/sunvis")
 async def request_sun_visibility(
-    oaem: Annotated[Oaem, Depends(compute_oaem)], sun_track: Annotated[SunTrack, Depends()]
+    oaem: Annotated[Oaem, Depends(get_oaem)], sun_track: Annotated[SunTrack, Depends()]
 ) -> dict:
     """
     Derives the sun visibility for a given position using the Obstruction Adaptive Elevation Mask (OAEM).
@@ -80,24 +385,17 @@ async def request_sun_visibility(
                 - since (str): The start time of the current sun visibility interval.
                 - until (str): The end time of the current sun visibility interval.
     """
-    sun_track.intersect_with_oaem(oaem)
-    sun_az, sun_el = sun_track.current_sunpos
-    sun_visible = sun_el > oaem.query(sun_az)
-
-    return {
-        "visible": str(sun_visible),
-        "since": str(sun_track.since),
-        "until": str(sun_track.until),
-    }
+    return await worker_pool.run(tasks.sun_visibility, oaem, sun_track, timeout=SUNVIS_TIMEOUT)
 
 
 @router.get("/plot")
 async def plot_oaem(
-    oaem: Annotated[Oaem, Depends(compute_oaem)],
+    oaem: Annotated[Oaem, Depends(get_oaem)],
     sun_track: Annotated[SunTrack, Depends()],
+    heading: Annotated[float, Depends(get_heading)],
     width: int = 600,
     height: int = 600,
-    heading: float = 0.0,
+    compact: bool = False,
 ):
     """
     Computes the Obstruction Adaptive Elevation Mask (OAEM) for a given position and EPSG code, and returns a plot of the OAEM.
@@ -114,20 +412,101 @@ async def plot_oaem(
         width (int, optional): The width of the plot in pixels. Defaults to 600.
         height (int, optional): The height of the plot in pixels. Defaults to 600.
         heading (float, optional): The heading of the plot in degrees. Defaults to 0.0.
+        compact (bool, optional): If true, only the plot data is returned instead of the full Plotly figure.
+                                  The data needs to be combined with the template of /plot/layout. Defaults to false.
 
     Returns:
 
-        A JSON string representation of the Plotly figure.
+        A JSON object with:
+
+            - data: A JSON string representation of the Plotly figure or, if compact, the theta and r
+                    coordinates in degrees of the mask, the sun track and the sun position (null below the horizon).
+            - visible (str): The sun visibility as a boolean value.
+            - since (str): The start time of the current sun visibility interval.
+            - until (str): The end time of the current sun visibility interval.
+    """
+    if compact:
+        return await worker_pool.run(tasks.plot_data, oaem, sun_track, timeout=PLOT_TIMEOUT)
+
+    return await worker_pool.run(tasks.plot, oaem, sun_track, width, height, heading, timeout=PLOT_TIMEOUT)
+
+
+@router.get("/plot/layout")
+async def plot_layout() -> JSONResponse:
+    """
+    Returns the static template of the skyplot for the compact /plot data.
+
+    The template does not change between requests and can be cached by the client.
+
+    Returns:
+
+        A JSON object with:
+
+            - layout: The Plotly layout of the skyplot. Width, height and the rotation of the angular
+                      axis (90° + heading) are set by the client.
+            - traces: The Plotly trace styles of the mask, the sun track and the sun position.
     """
-    sun_track.intersect_with_oaem(oaem)
-    sun_az, sun_el = sun_track.current_sunpos
-    sun_visible = sun_el > oaem.query(sun_az)
+    return JSONResponse(
+        content=create_plot_template(),
+        headers={"Cache-Control": f"public, max-age={PLOT_TEMPLATE_MAX_AGE}"},
+    )
 
-    fig_json = create_json_fig(width, height, heading, oaem, sun_track)
 
-    return {
-        "data": fig_json,
-        "visible": str(sun_visible),
-        "since": str(sun_track.since),
-        "until": str(sun_track.until),
-    }
+@router.get("/plot.png", response_class=Response)
+async def plot_oaem_png(
+    oaem: Annotated[Oaem, Depends(get_oaem)],
+    sun_track: Annotated[SunTrack, Depends()],
+    heading: Annotated[float, Depends(get_heading)],
+    width: Annotated[int, Query(gt=0, le=MAX_IMAGE_SIZE)] = 600,
+    height: Annotated[int, Query(gt=0, le=MAX_IMAGE_SIZE)] = 600,
+) -> Response:
+    """
+    Computes the Obstruction Adaptive Elevation Mask (OAEM) for a given position and EPSG code, and returns
+    a skyplot of the OAEM, the sun track and the current sun position as PNG image.
+
+    Args:
+
+        pos_x (float): The x-coordinate of the position.
+        pos_y (float): The y-coordinate of the position.
+        pos_z (float): The z-coordinate of the position.
+        epsg (int): The EPSG code of the position.
+        width (int, optional): The width of the image in pixels. Defaults to 600.
+        height (int, optional): The height of the image in pixels. Defaults to 600.
+        heading (float, optional): The heading of the plot in degrees. Defaults to 0.0.
+
+    Returns:
+
+        The PNG image.
+    """
+    png = await worker_pool.run(tasks.plot_png, oaem, sun_track, width, height, heading, timeout=PLOT_TIMEOUT)
+    return Response(content=png, media_type="image/png")
+
+
+@router.get("/plot.svg", response_class=Response)
+async def plot_oaem_svg(
+    oaem: Annotated[Oaem, Depends(get_oaem)],
+    sun_track: Annotated[SunTrack, Depends()],
+    heading: Annotated[float, Depends(get_heading)],
+    width: Annotated[int, Query(gt=0, le=MAX_IMAGE_SIZE)] = 600,
+    height: Annotated[int, Query(gt=0, le=MAX_IMAGE_SIZE)] = 600,
+) -> Response:
+    """
+    Computes the Obstruction Adaptive Elevation Mask (OAEM) for a given position and EPSG code, and returns
+    a skyplot of the OAEM, the sun track and the current sun position as SVG image.
+
+    Args:
+
+        pos_x (float): The x-coordinate of the position.
+        pos_y (float): The y-coordinate of the position.
+        pos_z (float): The z-coordinate of the position.
+        epsg (int): The EPSG code of the position.
+        width (int, optional): The width of the image in pixels. Defaults to 600.
+        height (int, optional): The height of the image in pixels. Defaults to 600.
+        heading (float, optional): The heading of the plot in degrees. Defaults to 0.0.
+
+    Returns:
+
+        The SVG image.
+    """
+    svg = await worker_pool.run(tasks.plot_svg, oaem, sun_track, width, height, heading, timeout=PLOT_TIMEOUT)
+    return Response(content=svg, media_type="image/svg+xml")
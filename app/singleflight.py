@@ -0,0 +1,46 @@
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Hashable
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent calls with the same key.
+
+    The first thread calling do with a key executes the function, all other threads calling do
+    with the same key while the call is in flight wait for its future and share the result
+    (or the exception).
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: dict[Hashable, Future] = {}
+
+    def do(self, key: Hashable, func: Callable[..., Any], *args, **kwargs) -> tuple[Any, bool]:
+        """
+        Executes func(*args, **kwargs) once per key at a time.
+
+        Returns:
+            tuple[Any, bool]: The result of the call and whether it was shared with another call.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+
+        if not leader:
+            return future.result(), True
+
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                del self._calls[key]
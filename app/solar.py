@@ -0,0 +1,116 @@
+"""
+NumPy implementation of the solar position algorithm 5 of Grena (2012).
+
+R. Grena, "Five new algorithms for the computation of sun position from 2010 to 2110",
+Solar Energy 86 (2012), pp. 1323-1337.
+
+The algorithm works on raw UNIX timestamps and needs neither pandas nor pvlib. Its stated
+maximum error is 0.0027° between 2010 and 2110. The atmospheric refraction is corrected with
+the formula of the NREL SPA, like in pvlib, so that sunrise and sunset agree with pvlib as well.
+
+Like in pvlib, the refraction is only applied down to the elevation -HORIZON_DIP. Within about 0.01° of
+this cutoff, the small difference of the elevations can switch the refraction on in one implementation
+and off in the other, so that the apparent elevations differ by the refraction at the horizon of about
+0.6° there. See tests/test_solar.py for the comparison with pvlib.
+"""
+import numpy as np
+
+DELTA_T = 67.0  # seconds, difference between terrestrial time and universal time, as in pvlib
+GRENA_EPOCH = 32872.0  # days from 1970-01-01 to 2060-01-01, the origin of the time scale of Grena (2012)
+HORIZON_DIP = 0.26667 + 0.5667  # degrees, sun radius and refraction at the horizon, below the sun has set
+
+
+def altitude_to_pressure(altitude: float) -> float:
+    """
+    Returns the standard atmospheric pressure in hPa at an altitude in meters, like pvlib's alt2pres.
+    """
+    return ((44331.514 - altitude) / 11880.516) ** (1 / 0.1902632)
+
+
+def solar_position(
+    timestamps: np.ndarray,
+    latitude: float,
+    longitude: float,
+    altitude: float = 0.0,
+    temperature: float = 12.0,
+    delta_t: float = DELTA_T,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Computes the azimuth and the apparent elevation of the sun.
+
+    Args:
+        timestamps (np.ndarray): UNIX timestamps in seconds.
+        latitude (float): Latitude in degrees.
+        longitude (float): Longitude in degrees.
+        altitude (float, optional): Altitude in meters, used for the pressure of the refraction. Defaults to 0.0.
+        temperature (float, optional): Air temperature in °C, used for the refraction. Defaults to 12.0.
+        delta_t (float, optional): Difference between terrestrial and universal time in seconds. Defaults to DELTA_T.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The azimuth in radians clockwise from north in [0, 2pi) and
+                                       the apparent elevation in radians, both of the shape of timestamps.
+    """
+    t = np.asarray(timestamps, dtype=np.float64) / 86400 - GRENA_EPOCH
+    te = t + delta_t / 86400
+
+    # heliocentric longitude with its periodic corrections
+    wte = 0.0172019715 * te
+    s1, c1 = np.sin(wte), np.cos(wte)
+    s2, c2 = 2 * s1 * c1, (c1 + s1) * (c1 - s1)
+    s3, c3 = s2 * c1 + c2 * s1, c2 * c1 - s2 * s1
+    mean_longitude = (
+        1.7527901
+        + 1.7202792159e-2 * te
+        + 3.33024e-2 * s1
+        - 2.0582e-3 * c1
+        + 3.512e-4 * s2
+        - 4.07e-5 * c2
+        + 5.2e-6 * s3
+        - 9e-7 * c3
+        - 8.23e-5 * s1 * np.sin(2.92e-5 * te)
+        + 1.27e-5 * np.sin(1.49e-3 * te - 2.337)
+        + 1.21e-5 * np.sin(4.31e-3 * te + 3.065)
+        + 2.33e-5 * np.sin(1.076e-2 * te - 1.533)
+        + 3.49e-5 * np.sin(1.575e-2 * te - 2.358)
+        + 2.67e-5 * np.sin(2.152e-2 * te + 0.074)
+        + 1.28e-5 * np.sin(3.152e-2 * te + 1.547)
+        + 3.14e-5 * np.sin(2.1277e-1 * te - 0.488)
+    )
+
+    # nutation and aberration
+    nu = 9.282e-4 * te - 0.8
+    nutation = 8.34e-5 * np.sin(nu)
+    geocentric_longitude = mean_longitude + np.pi + nutation
+    obliquity = 4.089567e-1 - 6.19e-9 * te + 4.46e-5 * np.cos(nu)
+
+    sin_longitude = np.sin(geocentric_longitude)
+    right_ascension = np.arctan2(sin_longitude * np.cos(obliquity), np.cos(geocentric_longitude))
+    declination = np.arcsin(sin_longitude * np.sin(obliquity))
+
+    hour_angle = 1.7528311 + 6.300388099 * t + np.deg2rad(longitude) - right_ascension + 0.92 * nutation
+    hour_angle = np.mod(hour_angle + np.pi, 2 * np.pi) - np.pi
+
+    # topocentric elevation with parallax correction
+    sin_latitude, cos_latitude = np.sin(np.deg2rad(latitude)), np.cos(np.deg2rad(latitude))
+    sin_declination, cos_declination = np.sin(declination), np.cos(declination)
+    cos_hour_angle = np.cos(hour_angle)
+    sin_elevation = sin_latitude * sin_declination + cos_latitude * cos_declination * cos_hour_angle
+    elevation = np.arcsin(sin_elevation) - 4.26e-5 * np.sqrt(1 - sin_elevation**2)
+
+    # Grena's azimuth is measured from south, positive towards west
+    azimuth = np.arctan2(
+        np.sin(hour_angle), cos_hour_angle * sin_latitude - sin_declination * cos_latitude / cos_declination
+    )
+    azimuth = np.mod(azimuth + np.pi, 2 * np.pi)
+
+    # refraction of the NREL SPA in degrees, applied down to the sun's upper limb touching the horizon
+    elevation_deg = np.rad2deg(elevation)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        refraction = (
+            (altitude_to_pressure(altitude) / 1010.0)
+            * (283.0 / (273.0 + temperature))
+            * 1.02
+            / (60 * np.tan(np.deg2rad(elevation_deg + 10.3 / (elevation_deg + 5.11))))
+        )
+
+    return azimuth, np.deg2rad(elevation_deg + np.where(elevation_deg >= -HORIZON_DIP, refraction, 0.0))
@@ -9,15 +9,50 @@ function convertUnixTimestamp(unixTimestamp) {
     return date.toLocaleString();
 }
 
-function handle_plot_response(response) {
+let plotTemplate = null;
+
+function load_plot_template() {
+    // the template is static, it is only requested once
+    if (plotTemplate === null) {
+        plotTemplate = $.ajax({
+            url: "/plot/layout",
+            type: "GET",
+            dataType: "json",
+        }).fail(function () {
+            // a failed request is not cached, the next plot requests the template again
+            plotTemplate = null;
+        });
+    }
+    return plotTemplate;
+}
+
+function create_figure(template, data, width, height, heading) {
+    const traces = [
+        { ...template.traces.mask, ...data.mask },
+        { ...template.traces.sun_track, ...data.sun_track },
+    ];
+
+    if (data.sun !== null) {
+        traces.push({ ...template.traces.sun, theta: [data.sun.theta], r: [data.sun.r] });
+    }
+
+    const layout = structuredClone(template.layout);
+    layout.width = width;
+    layout.height = height;
+    layout.polar.angularaxis.rotation = 90 + parseFloat(heading);
+
+    return { data: traces, layout: layout };
+}
+
+function handle_plot_response(response, template, width, height, heading) {
     const sunVisibilityText = `Sun Visibility: ${response.visible}`;
     const sunSinceText = `Since: ${convertUnixTimestamp(response.since)}`;
     const sunUntilText = `Until: ${convertUnixTimestamp(response.until)}`;
 
     document.getElementById('sun').innerHTML = `${sunVisibilityText}<br>${sunSinceText}<br>${sunUntilText}`;
 
-    let fig = JSON.parse(response.data);
-    Plotly.newPlot("plot", fig.data, fig.layout);
+    const fig = create_figure(template, response.data, width, height, heading);
+    Plotly.react("plot", fig.data, fig.layout);
 }
 
 function request_oaem(position) {
@@ -43,11 +78,14 @@ function request_oaem(position) {
 
     document.getElementById('position').innerText = `Current Position: ${latitude}°, ${longitude}°, ${height} m`;
 
-    $.ajax({
-        url: `/plot?pos_x=${latitude}&pos_y=${longitude}&pos_z=${height}&epsg=4326&width=${winwidth}&height=${winheight}&heading=${heading}`,
+    const plotData = $.ajax({
+        url: `/plot?pos_x=${latitude}&pos_y=${longitude}&pos_z=${height}&epsg=4326&compact=true`,
         type: "GET",
         dataType: "json",
-        success: handle_plot_response,
+    });
+
+    $.when(plotData, load_plot_template()).done(function (plotResult, templateResult) {
+        handle_plot_response(plotResult[0], templateResult[0], winwidth, winheight, heading);
     });
 
 }
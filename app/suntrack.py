@@ -2,11 +2,13 @@ from dataclasses import dataclass, field
 from datetime import datetime, timedelta
 
 import numpy as np
-import pandas as pd
 from pointset import PointSet
-from pvlib import solarposition
 
+from app.metrics import timed
 from app.oaem import Oaem
+from app.solar import solar_position
+from app.transform import transform_xyz
+from config import SUN_ENGINE
 
 
 @dataclass
@@ -23,10 +25,38 @@ class SunTrack:
 
     def __post_init__(self) -> None:
         self.pos = PointSet(
-            xyz=np.array([self.pos_x, self.pos_y, self.pos_z]),
-            epsg=self.epsg,
+            xyz=transform_xyz(np.array([self.pos_x, self.pos_y, self.pos_z]), self.epsg, 4326),
+            epsg=4326,
+            init_local_transformer=False,
         )
-        self.pos.to_epsg(4326)
+
+    def sun_positions(self, timestamps: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Computes the azimuth and the apparent elevation of the sun in radians with the SUN_ENGINE.
+
+        Args:
+            timestamps (np.ndarray): UNIX timestamps in seconds.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: The azimuth clockwise from north and the apparent elevation.
+        """
+        with timed("sun_ephemeris"):
+            if SUN_ENGINE != "PVLIB":
+                return solar_position(timestamps, latitude=self.pos.x, longitude=self.pos.y, altitude=self.pos.z)
+
+            import pandas as pd
+            from pvlib import solarposition
+
+            solpos = solarposition.get_solarposition(
+                time=pd.to_datetime(timestamps, unit="s", utc=True),
+                latitude=self.pos.x,
+                longitude=self.pos.y,
+                altitude=self.pos.z,
+            )
+            return (
+                np.deg2rad(solpos["azimuth"].to_numpy(dtype=float)),
+                np.deg2rad(solpos["apparent_elevation"].to_numpy(dtype=float)),
+            )
 
     def get_sun_track(
         self,
@@ -34,42 +64,26 @@ class SunTrack:
         freq: timedelta = timedelta(minutes=1),
         daylight_only: bool = False,
     ) -> np.ndarray:
-        start_time = datetime.combine(date, datetime.min.time())
-        end_time = datetime.combine(date, datetime.max.time())
-
-        times = pd.date_range(
-            start_time,
-            end_time,
-            freq=freq,
-            tz=date.tzinfo,
-        )
+        start_time = datetime.combine(date, datetime.min.time(), tzinfo=date.tzinfo)
+        end_time = datetime.combine(date, datetime.max.time(), tzinfo=date.tzinfo)
+        timestamps = np.arange(start_time.timestamp(), end_time.timestamp(), freq.total_seconds())
 
-        solpos = solarposition.get_solarposition(
-            time=times, latitude=self.pos.x, longitude=self.pos.y, altitude=self.pos.z
-        )
+        sun_track = np.column_stack((timestamps, *self.sun_positions(timestamps)))
 
         if daylight_only:
-            solpos = solpos.loc[solpos["apparent_elevation"] > 0, :]
+            sun_track = sun_track[sun_track[:, 2] > 0]
 
-        return np.c_[
-            np.array([time.timestamp() for time in solpos.index], dtype=float),
-            np.deg2rad(solpos["azimuth"].to_numpy(dtype=float)),
-            np.deg2rad(solpos["apparent_elevation"].to_numpy(dtype=float)),
-        ]
+        return sun_track
 
     @property
     def current_sunpos(self) -> tuple[float, float]:
-        date = datetime.now().astimezone()
-        solpos = solarposition.get_solarposition(
-            time=date, latitude=self.pos.x, longitude=self.pos.y, altitude=self.pos.z
-        )
-        return float(np.deg2rad(solpos["azimuth"].iloc[0])), float(np.deg2rad(solpos["apparent_elevation"].iloc[0]))
+        azimuth, elevation = self.sun_positions(np.array([datetime.now().astimezone().timestamp()]))
+        return float(azimuth[0]), float(elevation[0])
 
     def intersect_with_oaem(self, oaem: Oaem) -> None:
         date = datetime.now().astimezone()
         sun_track = self.get_sun_track(date=date)
-        oaem_query_func = np.vectorize(oaem.query)
-        oaem_elevations = oaem_query_func(sun_track[:, 1])
+        oaem_elevations = oaem.query_many(sun_track[:, 1])
 
         vis_idx = np.c_[sun_track[:, 0], sun_track[:, 2] > oaem_elevations]
         changes = np.where(np.abs(np.diff(vis_idx[:, 1])) == 1)[0]
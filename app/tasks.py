@@ -0,0 +1,180 @@
+"""
+Jobs that are executed in the worker pool.
+
+All arguments and return values need to be picklable, since the jobs may run in separate processes.
+"""
+import base64
+import cProfile
+import io
+import pstats
+import threading
+
+import numpy as np
+from pointset import PointSet
+
+from app.dependencies import get_edge_provider
+from app.metrics import QUERY_EDGES, STAGE_DURATION, collect
+from app.oaem import Oaem, compute_oaem, compute_oaem_track, prepare_positions
+from app.plotting import create_json_fig, create_plot_data
+from app.raster import create_png, create_svg
+from app.suntrack import SunTrack
+from config import N_RES, PROFILE_REPORT_LINES, ROUNDING_EPSG
+
+# only one profiler can be active per process, cProfile raises a ValueError otherwise since Python 3.12
+profiling_lock = threading.Lock()
+
+
+class ProfilerBusyError(Exception):
+    """Raised if another computation is already being profiled in the worker."""
+
+
+def sun_visibility(oaem: Oaem, sun_track: SunTrack) -> dict:
+    """
+    Intersects the sun track with the OAEM and returns the current sun visibility.
+    """
+    sun_track.intersect_with_oaem(oaem)
+    sun_az, sun_el = sun_track.current_sunpos
+    sun_visible = sun_el > oaem.query(sun_az)
+
+    return {
+        "visible": str(sun_visible),
+        "since": str(sun_track.since),
+        "until": str(sun_track.until),
+    }
+
+
+def plot(oaem: Oaem, sun_track: SunTrack, width: int, height: int, heading: float) -> dict:
+    """
+    Creates the Plotly skyplot of the OAEM together with the current sun visibility.
+    """
+    return {"data": create_json_fig(width, height, heading, oaem, sun_track), **sun_visibility(oaem, sun_track)}
+
+
+def plot_data(oaem: Oaem, sun_track: SunTrack) -> dict:
+    """
+    Creates the compact skyplot data of the OAEM together with the current sun visibility.
+    """
+    return {"data": create_plot_data(oaem, sun_track), **sun_visibility(oaem, sun_track)}
+
+
+def plot_png(oaem: Oaem, sun_track: SunTrack, width: int, height: int, heading: float) -> bytes:
+    """
+    Renders the skyplot of the OAEM as PNG image.
+    """
+    return create_png(width, height, heading, oaem, sun_track)
+
+
+def plot_svg(oaem: Oaem, sun_track: SunTrack, width: int, height: int, heading: float) -> str:
+    """
+    Renders the skyplot of the OAEM as SVG image.
+    """
+    return create_svg(width, height, heading, oaem, sun_track)
+
+
+def satellite_visibility(
+    positions: np.ndarray, epsg: int, azimuth: np.ndarray, elevation: np.ndarray, encoding: str = "base64"
+) -> dict:
+    """
+    Intersects a block of satellite observations with the OAEMs of one or more positions.
+
+    Args:
+        positions (np.ndarray): One position or one position per epoch as an array of shape (1, 3) or (E, 3).
+        epsg (int): The EPSG code of the positions.
+        azimuth (np.ndarray): The azimuths of the satellites in radians as an array of shape (E, S),
+                              NaN for missing observations.
+        elevation (np.ndarray): The elevations of the satellites in radians as an array of shape (E, S).
+        encoding (str, optional): "base64" or "list", see encode_visibility. Defaults to "base64".
+
+    Returns:
+        dict: The shape, the visibility bitmask and the margin above the OAEM.
+    """
+    # repeated positions, e.g. of a static receiver, share their OAEM; the OAEMs are computed in trajectory order
+    unique, first, inverse = np.unique(positions, axis=0, return_index=True, return_inverse=True)
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    oaems = compute_oaem_track(unique[order], epsg)
+
+    rows = rank[inverse.ravel()] if len(positions) > 1 else np.zeros(len(azimuth), dtype=np.int64)
+    epochs = np.argsort(rows, kind="stable")
+    mask = np.empty_like(azimuth)
+    for oaem, oaem_epochs in zip(oaems, np.split(epochs, np.cumsum(np.bincount(rows, minlength=len(oaems)))[:-1])):
+        mask[oaem_epochs] = oaem.query_many(azimuth[oaem_epochs])
+
+    margin = elevation - mask
+    return encode_visibility(margin > 0, margin, encoding)
+
+
+def encode_visibility(visible: np.ndarray, margin: np.ndarray, encoding: str) -> dict:
+    """
+    Encodes the visibility and the margin of E epochs x S satellites.
+
+    With "base64", the bitmask is packed row by row, i.e. every epoch starts at a new byte, with the first
+    satellite in the most significant bit, and the margin is given as little-endian float32 with NaN for
+    missing observations. With "list", both are returned as nested lists, the margin rounded to 0.1 mrad.
+    """
+    if encoding == "list":
+        rounded = np.round(margin, 4)
+        return {
+            "shape": list(visible.shape),
+            "visible": visible.tolist(),
+            "margin": [[None if np.isnan(value) else value for value in row] for row in rounded.tolist()],
+        }
+
+    return {
+        "shape": list(visible.shape),
+        "bitmask": base64.b64encode(np.packbits(visible, axis=1).tobytes()).decode("ascii"),
+        "margin": base64.b64encode(margin.astype("<f4").tobytes()).decode("ascii"),
+    }
+
+
+def warm_cells(xyz: np.ndarray) -> int:
+    """
+    Loads the data of the edge provider for N positions given in ROUNDING_EPSG.
+
+    The positions are reduced to their neighbourhood cells exactly like in compute_oaem.
+    The edges themselves are not cached, since they are cheap to query once the data is loaded.
+    Returns the number of warmed cells.
+    """
+    cells = np.unique(np.round(prepare_positions(xyz, ROUNDING_EPSG) / N_RES) * N_RES, axis=0)
+    edge_provider = get_edge_provider()
+
+    for cell in cells:
+        edge_provider.warm(PointSet(xyz=cell[None], epsg=ROUNDING_EPSG, init_local_transformer=False))
+
+    return len(cells)
+
+
+def profile_oaem(pos_x: float, pos_y: float, pos_z: float, epsg: int) -> tuple[Oaem, dict]:
+    """
+    Computes the OAEM under cProfile.
+
+    Returns:
+        tuple[Oaem, dict]: The OAEM and the profile with the number of edges, the durations of the
+                           processing stages in seconds and the cProfile report sorted by cumulative time.
+
+    Raises:
+        ProfilerBusyError: If another computation is being profiled in the same process.
+    """
+    # the lock is held until the profiled computation has finished, even if its request timed out before
+    if not profiling_lock.acquire(blocking=False):
+        raise ProfilerBusyError("Another request is being profiled.")
+
+    try:
+        profiler = cProfile.Profile()
+        oaem, samples = collect(profiler.runcall, compute_oaem, pos_x, pos_y, pos_z, epsg)
+    finally:
+        profiling_lock.release()
+
+    report = io.StringIO()
+    pstats.Stats(profiler, stream=report).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(PROFILE_REPORT_LINES)
+
+    stages: dict[str, float] = {}
+    edges = 0
+    for name, labels, value in samples:
+        if name == STAGE_DURATION.name:
+            stages[labels[0]] = stages.get(labels[0], 0.0) + value
+        elif name == QUERY_EDGES.name:
+            edges = int(value)
+
+    return oaem, {"edges": edges, "stages": stages, "report": report.getvalue()}
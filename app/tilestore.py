@@ -0,0 +1,235 @@
+import fcntl
+import os
+import re
+import time
+from contextlib import contextmanager
+from functools import cache
+from typing import Callable, Iterator
+
+import numpy as np
+
+from config import TILE_CACHE_PATH, logger
+
+EDGE_SCALE = 100  # edge coordinates are stored in centimetres
+TILE_FORMAT = 2  # version of the stored edge layout, tiles of other versions are parsed again
+EDGE_LIMIT = np.iinfo(np.int32).max / EDGE_SCALE  # meters, largest absolute coordinate that can be stored
+TMP_MAX_AGE = 3600  # seconds, older temporary files are left over from crashed processes and removed
+TILE_PATTERN = re.compile(r"(?P<key>.+?)(?:\.v(?P<version>\d+))?\.npy")
+
+
+def encode_edges(coordinates) -> np.ndarray:
+    """
+    Encodes edges in meters as int32 array of shape (N, 7) with the coordinates in centimetres and the index
+    of the building, int32 arrays are returned as is.
+
+    Projected coordinates of up to EDGE_LIMIT meters fit into int32 without an offset, so the encoded
+    edges need half the memory of float64 coordinates without losing centimetre accuracy.
+
+    Raises:
+        ValueError: If a coordinate exceeds EDGE_LIMIT.
+    """
+    if isinstance(coordinates, np.ndarray) and coordinates.dtype == np.int32:
+        return coordinates.reshape(-1, 7)
+
+    coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 7)
+    if len(coordinates) and np.abs(coordinates[:, :6]).max() > EDGE_LIMIT:
+        raise ValueError(f"Edge coordinates exceed {EDGE_LIMIT:.0f} m and cannot be stored in centimetres.")
+
+    return np.c_[np.round(coordinates[:, :6] * EDGE_SCALE), coordinates[:, 6]].astype(np.int32)
+
+
+def decode_edges(centimetres: np.ndarray) -> np.ndarray:
+    """
+    Decodes int32 edges to float64 edges of shape (N, 7) with the coordinates in meters.
+    """
+    edges = centimetres.astype(np.float64)
+    edges[:, :6] /= EDGE_SCALE
+    return edges
+
+
+class TileStore:
+    """
+    Cross-process store for parsed tiles.
+
+    The edge coordinates of a tile are written once as a numpy file of int32 centimetres and attached by all
+    processes as a read-only memory map. This way, all uvicorn and pool workers share the
+    same pages of the operating system's page cache instead of holding their own copies.
+    A lock file per tile ensures that only one process ingests a given tile, while the
+    others wait and attach the result afterwards. The lock file is removed again once the tile is stored.
+
+    Keys of the form source@revision identify a revision of a source, e.g. of a gml file. Once a new
+    revision is stored, the tiles of the earlier revisions of the source are superseded. They are removed
+    together with tiles of earlier formats, lock and temporary files left over from crashed processes
+    during warm-up and whenever a new revision is stored, see prune. If no path is given, the store is
+    disabled and tiles are loaded directly.
+    """
+
+    def __init__(self, path: str = TILE_CACHE_PATH) -> None:
+        self.path = path
+
+        if self.path:
+            os.makedirs(self.path, exist_ok=True)
+            logger.info("Using shared tile cache at %s", self.path)
+
+    def get(self, key: str, loader: Callable[[], np.ndarray], max_age: float | None = None) -> np.ndarray:
+        """
+        Returns the tile stored under key and calls loader to create it if it does not exist yet.
+
+        Args:
+            key (str): Unique name of the tile, must be usable as a filename, optionally as source@revision.
+            loader (Callable[[], np.ndarray]): Function that returns the edge coordinates of the tile in meters.
+            max_age (float, optional): Maximum age of the stored tile in seconds, older tiles are loaded again.
+                                       Defaults to None, which keeps stored tiles forever.
+
+        Returns:
+            np.ndarray: The (read-only) edges of the tile as int32 array of shape (N, 7), see encode_edges.
+        """
+        if not self.path:
+            return encode_edges(loader())
+
+        filename = os.path.join(self.path, f"{key}.v{TILE_FORMAT}.npy")
+
+        if (data := self._attach(filename, max_age)) is not None:
+            return data
+
+        with self._lock(key):
+            # another process may have ingested the tile while we were waiting for the lock
+            if (data := self._attach(filename, max_age)) is not None:
+                return data
+
+            data = encode_edges(loader())
+            tmp_filename = f"{filename}.{os.getpid()}.tmp"
+            with open(tmp_filename, "wb") as f:
+                np.save(f, data)
+            os.replace(tmp_filename, filename)
+            logger.info("Stored tile %s with %i edges", key, len(data))
+
+        if "@" in key:
+            self.prune()
+
+        return self._attach(filename)
+
+    def prune(self, prefix: str | None = None, max_size: int | None = None, max_age: float | None = None) -> int:
+        """
+        Removes tiles of earlier formats, superseded revisions, unused lock files and stale temporary files,
+        and optionally evicts tiles.
+
+        Of the tiles with keys source@revision, only the most recently stored revision of every source is kept.
+        Tiles that are still attached by other processes stay readable, since their memory maps keep the data.
+
+        Args:
+            prefix (str, optional): Prefix of the keys of the tiles to evict, e.g. "wfs.". Defaults to None,
+                                    which evicts no tiles.
+            max_size (int, optional): Total size in bytes of the evicted tiles, the oldest ones beyond it are
+                                      removed. Defaults to None.
+            max_age (float, optional): Maximum age of the evicted tiles in seconds. Defaults to None.
+
+        Returns:
+            int: The number of removed files.
+        """
+        if not self.path:
+            return 0
+
+        now = time.time()
+        removed = 0
+        stale = []
+        candidates = []
+        revisions: dict[str, list[tuple[float, str]]] = {}
+
+        with os.scandir(self.path) as entries:
+            for entry in entries:
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+
+                if entry.name.endswith(".tmp"):
+                    if now - stat.st_mtime > TMP_MAX_AGE:
+                        stale.append(entry.path)
+                elif entry.name.endswith(".lock"):
+                    removed += self._remove_unused_lock(entry.path)
+                elif (match := TILE_PATTERN.fullmatch(entry.name)) is not None:
+                    source, _, revision = match["key"].partition("@")
+                    if int(match["version"] or 0) < TILE_FORMAT:
+                        stale.append(entry.path)
+                        continue
+                    if revision:
+                        revisions.setdefault(source, []).append((stat.st_mtime, entry.path))
+                    if prefix is not None and entry.name.startswith(prefix):
+                        candidates.append((stat.st_mtime, stat.st_size, entry.path))
+
+        for source_revisions in revisions.values():
+            stale.extend(path for _, path in sorted(source_revisions)[:-1])
+
+        # the newest tiles are kept as long as they are not too old and fit into max_size
+        size = 0
+        for mtime, file_size, path in sorted(candidates, reverse=True):
+            size += file_size
+            if (max_age is not None and now - mtime > max_age) or (max_size is not None and size > max_size):
+                stale.append(path)
+
+        for path in stale:
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+
+        if removed:
+            logger.info("Removed %i files from the tile cache", removed)
+
+        return removed
+
+    @staticmethod
+    def _attach(filename: str, max_age: float | None = None) -> np.ndarray | None:
+        try:
+            if max_age is not None and time.time() - os.stat(filename).st_mtime > max_age:
+                return None
+            return np.load(filename, mmap_mode="r")
+        except FileNotFoundError:
+            # not stored yet or evicted meanwhile
+            return None
+
+    def _remove_unused_lock(self, lock_filename: str) -> bool:
+        try:
+            with open(lock_filename, "a", encoding="utf-8") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                if not self._is_current(lock_file.fileno(), lock_filename):
+                    return False
+                os.remove(lock_filename)
+        except BlockingIOError:
+            return False
+        return True
+
+    @contextmanager
+    def _lock(self, key: str) -> Iterator[None]:
+        lock_filename = os.path.join(self.path, f"{key}.lock")
+
+        while True:
+            with open(lock_filename, "a", encoding="utf-8") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    # the lock file may have been removed by its previous holder while we were waiting for it
+                    if self._is_current(lock_file.fileno(), lock_filename):
+                        try:
+                            yield
+                        finally:
+                            os.remove(lock_filename)
+                        return
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _is_current(fd: int, filename: str) -> bool:
+        try:
+            return os.path.samestat(os.fstat(fd), os.stat(filename))
+        except FileNotFoundError:
+            return False
+
+
+@cache
+def get_tile_store() -> TileStore:
+    """
+    Returns the tile store, which is created on first use.
+    """
+    return TileStore()
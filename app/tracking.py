@@ -0,0 +1,176 @@
+"""
+Live tracking of moving clients over a WebSocket.
+
+A client streams its positions and receives the OAEM and/or the visibility of satellites.
+The session keeps the last computed OAEM together with its position and neighbourhood cell,
+the OAEM is only recomputed if the position moves more than the tolerance or enters another
+N_RES cell, i.e. if the edge set changes. Otherwise, the last OAEM is reused, which only costs
+a coordinate transformation.
+"""
+import asyncio
+from contextlib import suppress
+
+import numpy as np
+from fastapi import HTTPException, WebSocket, WebSocketDisconnect
+from pydantic import BaseModel, ValidationError
+from pyproj.exceptions import CRSError
+
+from app.executor import worker_pool
+from app.metrics import TRACK_POSITIONS, record
+from app.oaem import Oaem, compute_oaem
+from app.prefetch import predictive_prefetcher
+from app.transform import transform_xyz
+from config import N_RES, OAEM_TIMEOUT, PREFETCH_ENABLED, ROUNDING_EPSG, TRACK_TOLERANCE, logger
+
+
+class TrackMessage(BaseModel):
+    pos_x: float
+    pos_y: float
+    pos_z: float
+    epsg: int
+    seq: int | None = None
+    satellites: dict[str, tuple[float, float]] = {}
+
+
+class TrackingSession:
+    """
+    State of a tracking client.
+
+    Attributes:
+        client (str): Identifier of the client, used for the predictive prefetching.
+        tolerance (float): Distance in meters the position may move before the OAEM is recomputed.
+        masks (bool): Whether recomputed OAEMs are sent to the client.
+        oaem (Oaem | None): The last computed OAEM.
+        position (np.ndarray | None): Position of the last computed OAEM in ROUNDING_EPSG.
+    """
+
+    def __init__(self, client: str, tolerance: float = TRACK_TOLERANCE, masks: bool = True) -> None:
+        self.client = client
+        self.tolerance = tolerance
+        self.masks = masks
+        self.oaem: Oaem | None = None
+        self.position: np.ndarray | None = None
+
+    def needs_update(self, xyz: np.ndarray) -> bool:
+        """
+        Returns whether the OAEM needs to be recomputed for a position in ROUNDING_EPSG.
+        """
+        if self.oaem is None or self.position is None:
+            return True
+
+        crossed_cell = np.any(np.round(xyz / N_RES) != np.round(self.position / N_RES))
+        return bool(crossed_cell or np.linalg.norm(xyz - self.position) > self.tolerance)
+
+    async def update(self, message: TrackMessage) -> bool:
+        """
+        Recomputes the OAEM if necessary and returns whether it was recomputed.
+
+        Raises:
+            HTTPException: 503 if the worker pool is busy, 504 if the computation timed out.
+        """
+        xyz = transform_xyz(np.array([message.pos_x, message.pos_y, message.pos_z]), message.epsg, ROUNDING_EPSG)[0]
+
+        if not self.needs_update(xyz):
+            record(TRACK_POSITIONS, ("reused",))
+            return False
+
+        if PREFETCH_ENABLED:
+            predictive_prefetcher.observe(self.client, message.pos_x, message.pos_y, message.pos_z, message.epsg)
+
+        self.oaem = await worker_pool.run(
+            compute_oaem, message.pos_x, message.pos_y, message.pos_z, message.epsg, self.oaem, timeout=OAEM_TIMEOUT
+        )
+        self.position = xyz
+        record(TRACK_POSITIONS, ("computed",))
+        return True
+
+    def visibility(self, satellites: dict[str, tuple[float, float]]) -> dict[str, bool]:
+        """
+        Returns whether the satellites, given as name: (azimuth, elevation) in radians, are above the OAEM.
+        """
+        if self.oaem is None:
+            return {}
+
+        azimuth, elevation = np.array(list(satellites.values()), dtype=np.float64).T
+        return dict(zip(satellites, (elevation > self.oaem.query_many(azimuth)).tolist()))
+
+    async def respond(self, message: TrackMessage, skipped: int) -> dict:
+        response: dict = {"seq": message.seq, "skipped": skipped}
+
+        try:
+            response["updated"] = await self.update(message)
+        except HTTPException as exc:
+            response["error"] = exc.detail
+            response["updated"] = False
+        except CRSError:
+            response["error"] = f"Invalid EPSG code {message.epsg}."
+            response["updated"] = False
+        except Exception:
+            # the session is kept alive, the client is informed like for a failed request
+            logger.exception("Tracking update of %s failed", self.client)
+            response["error"] = "Internal server error."
+            response["updated"] = False
+
+        if "error" in response:
+            # the last OAEM may belong to a position far from this one, the next position recomputes it
+            self.oaem, self.position = None, None
+
+        if response["updated"] and self.masks and self.oaem is not None:
+            response["data"] = self.oaem.az_el_str
+
+        if message.satellites:
+            response["visible"] = self.visibility(message.satellites)
+
+        return response
+
+    async def serve(self, websocket: WebSocket) -> None:
+        """
+        Answers the positions of an accepted WebSocket until the client disconnects.
+
+        Positions arriving while the OAEM is computed are not queued, only the latest one is answered
+        and the number of skipped positions is reported, so that slow computations do not add up to a lag.
+        Binary frames are not supported, the WebSocket is closed with code 1003 once the answer in progress is sent.
+        """
+        latest: asyncio.Queue[str | None] = asyncio.Queue(maxsize=1)
+        skipped = 0
+        binary = False
+
+        async def receive() -> None:
+            nonlocal skipped, binary
+            try:
+                while (frame := await websocket.receive())["type"] == "websocket.receive":
+                    if (text := frame.get("text")) is None:
+                        binary = True
+                        break
+                    if latest.full():
+                        latest.get_nowait()
+                        skipped += 1
+                        record(TRACK_POSITIONS, ("skipped",))
+                    latest.put_nowait(text)
+            finally:
+                if latest.full():
+                    latest.get_nowait()
+                latest.put_nowait(None)
+
+        receiver = asyncio.create_task(receive())
+        try:
+            while (text := await latest.get()) is not None:
+                reported, skipped = skipped, 0
+                try:
+                    message = TrackMessage.model_validate_json(text)
+                except ValidationError as exc:
+                    await websocket.send_json({"error": exc.errors(include_url=False, include_context=False)})
+                    continue
+
+                response = await self.respond(message, reported)
+                await websocket.send_json(response)
+
+            if binary:
+                await websocket.close(code=1003, reason="Only text frames with JSON positions are supported.")
+        except WebSocketDisconnect:
+            pass
+        finally:
+            receiver.cancel()
+            # retrieves unexpected errors of the receiver, which are raised to the server
+            with suppress(asyncio.CancelledError):
+                await receiver
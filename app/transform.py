@@ -0,0 +1,60 @@
+from functools import lru_cache
+
+import numpy as np
+from pointset import PointSet
+from pyproj import CRS, Transformer
+
+
+@lru_cache(maxsize=64)
+def get_transformer(src_epsg: int, dst_epsg: int) -> Transformer:
+    """
+    Returns a pyproj transformer between two EPSG codes.
+
+    Creating a transformer is by far the most expensive part of a coordinate transformation,
+    therefore transformers are cached and reused for every (src, dst) pair.
+    The axis order follows the authority definition, just like PointSet.to_epsg.
+    """
+    return Transformer.from_crs(CRS.from_epsg(src_epsg), CRS.from_epsg(dst_epsg))
+
+
+@lru_cache(maxsize=64)
+def get_utm_zone(epsg: int) -> int:
+    """
+    Returns the UTM zone number of a projected coordinate system.
+    """
+    return int(CRS.from_epsg(epsg).utm_zone[:-1])
+
+
+def transform_xyz(xyz: np.ndarray, src_epsg: int, dst_epsg: int) -> np.ndarray:
+    """
+    Transforms N positions from one EPSG code to another in a single call.
+
+    Args:
+        xyz (np.ndarray): Positions as an array of shape (3,) or (N, 3).
+        src_epsg (int): The EPSG code of the input positions.
+        dst_epsg (int): The EPSG code of the output positions.
+
+    Returns:
+        np.ndarray: The transformed positions as an array of shape (N, 3).
+    """
+    xyz = np.atleast_2d(np.asarray(xyz, dtype=np.float64))
+
+    if src_epsg == dst_epsg:
+        return xyz.copy()
+
+    x, y, z = get_transformer(src_epsg, dst_epsg).transform(xyz[:, 0], xyz[:, 1], xyz[:, 2])
+    return np.c_[x, y, z]
+
+
+def to_epsg(pos: PointSet, epsg: int) -> PointSet:
+    """
+    Transforms a PointSet in place using a cached transformer.
+
+    Drop-in replacement for PointSet.to_epsg for non-local coordinate systems.
+    """
+    if pos.epsg == epsg:
+        return pos
+
+    pos.xyz = transform_xyz(pos.xyz, pos.epsg, epsg)
+    pos.epsg = epsg
+    return pos
@@ -0,0 +1,59 @@
+import asyncio
+import time
+
+from app.dependencies import init_dependencies
+from app.executor import worker_pool
+from app.http_cache import data_version
+from app.tilestore import get_tile_store
+from config import WARM_UP_RETRY, WARM_UP_TIMEOUT, logger
+
+
+async def warm_up() -> None:
+    """
+    Keeps the workers initialized in the background.
+
+    The dependencies are initialized in every worker process if a process pool is used. A failed
+    warm-up is retried after WARM_UP_RETRY seconds and the warm-up is redone after the worker pool
+    was restarted, which clears its ready event. The data version of the ETags is determined and
+    the files left over in the tile store are removed first.
+    """
+    try:
+        await asyncio.to_thread(data_version)
+    except OSError:
+        logger.exception("Failed to determine the data version, /oaem responses carry no ETag")
+
+    try:
+        await asyncio.to_thread(lambda: get_tile_store().prune())
+    except OSError:
+        logger.exception("Failed to prune the tile store")
+
+    while True:
+        if not worker_pool.ready.is_set():
+            await warm_up_workers()
+        await asyncio.sleep(WARM_UP_RETRY)
+
+
+async def warm_up_workers() -> bool:
+    """
+    Starts all workers of the pool and sets its ready event once they are initialized.
+
+    Returns:
+        bool: Whether the warm-up succeeded.
+    """
+    start_time = time.time()
+    generation = worker_pool.generation
+    jobs = [worker_pool.run(init_dependencies, timeout=WARM_UP_TIMEOUT) for _ in range(max(worker_pool.processes, 1))]
+    results = await asyncio.gather(*jobs, return_exceptions=True)
+
+    for result in results:
+        if isinstance(result, BaseException):
+            logger.error("Warm-up failed, retrying in %g s", WARM_UP_RETRY, exc_info=result)
+            return False
+
+    # the pool may have been restarted meanwhile, its new workers are not warmed up yet
+    if worker_pool.generation != generation:
+        return False
+
+    worker_pool.ready.set()
+    logger.info("Warm-up finished in %.3f s", time.time() - start_time)
+    return True
@@ -1,19 +1,34 @@
-from functools import lru_cache
+from typing import TYPE_CHECKING
 
 import numpy as np
-import requests
 from pointset import PointSet
 
-from app.edge import Edge
+from app.cache import cache_manager
 from app.gml import extract_lod1_coords
-from config import N_RANGE, WFS_BASE_REQUEST, WFS_EPSG, WFS_URL, logger
-
-
-@lru_cache(maxsize=1024)
-def edge_list_from_wfs(pos: PointSet, nrange: float = N_RANGE) -> list[Edge]:
+from app.metrics import timed
+from app.tilestore import decode_edges, get_tile_store
+from app.transform import to_epsg
+from config import (
+    N_RANGE,
+    TILE_CACHE_WFS_MAX_AGE,
+    TILE_CACHE_WFS_MAX_SIZE,
+    WFS_BASE_REQUEST,
+    WFS_EPSG,
+    WFS_URL,
+    logger,
+)
+
+if TYPE_CHECKING:
+    from requests import Response
+
+WFS_TILE_PREFIX = "wfs."  # prefix of the keys of WFS responses in the tile store
+
+
+@cache_manager.cached(tier="wfs")
+def edges_from_wfs(pos: PointSet, nrange: float = N_RANGE) -> np.ndarray:
     """
     Sends a request to the WFS server to retrieve the Level of Detail 1 (LOD1) CityGML data
-    for the specified position.
+    for the specified position. Responses are kept in the shared tile store.
 
     Args:
         pos (PointSet): The position to retrieve the data for.
@@ -21,12 +36,28 @@ def edge_list_from_wfs(pos: PointSet, nrange: float = N_RANGE) -> list[Edge]:
                                   Defaults to N_RANGE.
 
     Returns:
-        list[Edge]: A list of Edge objects representing the retrieved CityGML data.
+        np.ndarray: The edges of the retrieved CityGML data as an array of shape (N, 7).
 
     Raises:
         requests.RequestException: If the WFS request fails.
     """
-    pos.to_epsg(WFS_EPSG)
+    return decode_edges(coordinates_from_wfs(pos, nrange))
+
+
+def coordinates_from_wfs(pos: PointSet, nrange: float = N_RANGE) -> np.ndarray:
+    """
+    Returns the edge coordinates around the specified position from the shared tile store,
+    the WFS server is only requested if the response is not stored yet or older than TILE_CACHE_WFS_MAX_AGE.
+
+    Args:
+        pos (PointSet): The position to retrieve the data for.
+        nrange (float, optional): The range around the position to retrieve the CityGML data for.
+                                  Defaults to N_RANGE.
+
+    Returns:
+        np.ndarray: The edges with coordinates in centimetres as int32 array of shape (N, 7).
+    """
+    to_epsg(pos, WFS_EPSG)
     logger.info(
         "Position in WFS EPSG: %.3f, %.3f, %.3f], EPSG: %i",
         pos.x,
@@ -34,9 +65,40 @@ def edge_list_from_wfs(pos: PointSet, nrange: float = N_RANGE) -> list[Edge]:
         pos.z,
         WFS_EPSG,
     )
+    key = f"{WFS_TILE_PREFIX}{pos.x:.1f}.{pos.y:.1f}.{nrange:.1f}"
+    return get_tile_store().get(key, lambda: fetch_coordinates(pos=pos, nrange=nrange), max_age=TILE_CACHE_WFS_MAX_AGE)
+
+
+def fetch_coordinates(pos: PointSet, nrange: float) -> np.ndarray:
+    """
+    Requests the edge coordinates from the WFS server for the tile store and evicts
+    old responses, so that the stored responses do not grow without bounds.
+    """
+    coordinates = request_coordinates(pos=pos, nrange=nrange)
+    get_tile_store().prune(WFS_TILE_PREFIX, max_size=TILE_CACHE_WFS_MAX_SIZE, max_age=TILE_CACHE_WFS_MAX_AGE)
+    return coordinates
+
+
+def request_coordinates(pos: PointSet, nrange: float) -> np.ndarray:
+    """
+    Requests the building edge coordinates around the specified position from the WFS server.
+
+    Args:
+        pos (PointSet): The position to retrieve the data for.
+        nrange (float): The range around the position to retrieve the CityGML data for.
+
+    Returns:
+        np.ndarray: The edges as an array of shape (N, 7).
+
+    Raises:
+        requests.RequestException: If the WFS request fails.
+    """
+    import requests
+
     request_url = create_request(pos=pos, nrange=nrange)
     logger.debug("Sending request %s", request_url)
-    response = requests.get(request_url, timeout=10)
+    with timed("wfs_request"):
+        response = requests.get(request_url, timeout=10)
     logger.debug("received answer. Status code: %s", response.status_code)
 
     if response.status_code != 200:
@@ -63,18 +125,17 @@ def create_request(pos: PointSet, nrange: float) -> str:
     return f"{WFS_URL}?{WFS_BASE_REQUEST}&{bbox}"
 
 
-def parse_response(response: requests.Response) -> list[Edge]:
+def parse_response(response: "Response") -> np.ndarray:
     """
-    Parses the response from the WFS server and returns a list of edges representing
-    the building roof footprints.
+    Parses the response from the WFS server and returns the coordinates of the edges
+    representing the building roof footprints.
 
     Args:
         response (Response): The response object from the WFS server.
 
     Returns:
-        list[Edge]: A list of edges representing the building roof footprints.
+        np.ndarray: The edges as an array of shape (N, 7).
     """
     logger.debug("parsing response ...")
-    building_coordinates: np.ndarray = np.array(extract_lod1_coords(str(response.content, encoding="utf-8")))
-
-    return [Edge(start=edge_coord[:3], end=edge_coord[3:]) for edge_coord in building_coordinates]
+    building_coordinates = extract_lod1_coords(str(response.content, encoding="utf-8"))
+    return np.array(building_coordinates, dtype=np.float64).reshape(-1, 7)
@@ -0,0 +1,181 @@
+"""
+Generator of synthetic CityGML tiles for benchmarks.
+
+Buildings are random boxes with flat or gabled roofs. The tiles follow the file naming
+of the Geobasis NRW CityGML files, so that they can be used as EDGE_DATA_PATH.
+
+Usage:
+
+    python -m benchmarks.citygen ./gmldata --tiles 364_5620 364_5621 --lod 2 --density 1500
+"""
+import argparse
+import os
+
+import numpy as np
+
+TILE_SIZE = 1000  # meters
+UTM_ZONE = 32
+GROUND_HEIGHT = 60.0  # meters
+
+Polygon = list[tuple[float, float, float]]
+
+CITY_MODEL = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<core:CityModel xmlns:core="http://www.opengis.net/citygml/2.0" '
+    'xmlns:bldg="http://www.opengis.net/citygml/building/2.0" xmlns:gml="http://www.opengis.net/gml">'
+    "{members}</core:CityModel>\n"
+)
+
+
+def building_polygons(rng: np.random.Generator, x: float, y: float) -> dict[str, list[Polygon]]:
+    """
+    Returns the wall, roof and ground polygons of a random building at the given position.
+    """
+    width, depth = rng.uniform(6.0, 25.0, size=2)
+    eaves = rng.uniform(3.0, 25.0)
+    ground = GROUND_HEIGHT + rng.uniform(-1.0, 1.0)
+    top = ground + eaves
+    corners = [(x, y), (x + width, y), (x + width, y + depth), (x, y + depth)]
+
+    walls = [[(*a, ground), (*b, ground), (*b, top), (*a, top)] for a, b in zip(corners, corners[1:] + corners[:1])]
+    ground_polygon = [(*corner, ground) for corner in reversed(corners)]
+
+    if rng.random() < 0.5:
+        return {"walls": walls, "roofs": [[(*corner, top) for corner in corners]], "ground": [ground_polygon]}
+
+    # gabled roof with the ridge along the x axis
+    ridge = top + rng.uniform(2.0, 6.0)
+    mid_y = y + depth / 2
+    roofs = [
+        [(x, y, top), (x + width, y, top), (x + width, mid_y, ridge), (x, mid_y, ridge)],
+        [(x + width, y + depth, top), (x, y + depth, top), (x, mid_y, ridge), (x + width, mid_y, ridge)],
+    ]
+    gables = [
+        [(x, y + depth, top), (x, y, top), (x, mid_y, ridge)],
+        [(x + width, y, top), (x + width, y + depth, top), (x + width, mid_y, ridge)],
+    ]
+    return {"walls": walls + gables, "roofs": roofs, "ground": [ground_polygon]}
+
+
+def polygon_edges(polygon: Polygon) -> np.ndarray:
+    """
+    Returns the edges of a closed polygon as an array of shape (N, 6), without the building index of the parser.
+    """
+    ring = np.array(polygon + polygon[:1])
+    return np.c_[ring[:-1], ring[1:]]
+
+
+def pos_list(polygon: Polygon) -> str:
+    return " ".join(f"{value:.3f}" for point in polygon + polygon[:1] for value in point)
+
+
+def surface_member(polygon: Polygon) -> str:
+    return (
+        "<gml:surfaceMember><gml:Polygon><gml:exterior><gml:LinearRing>"
+        f"<gml:posList>{pos_list(polygon)}</gml:posList>"
+        "</gml:LinearRing></gml:exterior></gml:Polygon></gml:surfaceMember>"
+    )
+
+
+def lod2_building(polygons: dict[str, list[Polygon]]) -> str:
+    def bounded_by(surface: str, polygon: Polygon) -> str:
+        return (
+            f"<bldg:boundedBy><bldg:{surface}><bldg:lod2MultiSurface><gml:MultiSurface>{surface_member(polygon)}"
+            f"</gml:MultiSurface></bldg:lod2MultiSurface></bldg:{surface}></bldg:boundedBy>"
+        )
+
+    surfaces = [bounded_by("WallSurface", polygon) for polygon in polygons["walls"]]
+    surfaces += [bounded_by("RoofSurface", polygon) for polygon in polygons["roofs"]]
+    surfaces += [bounded_by("GroundSurface", polygon) for polygon in polygons["ground"]]
+    return f"<core:cityObjectMember><bldg:Building>{''.join(surfaces)}</bldg:Building></core:cityObjectMember>"
+
+
+def lod1_building(polygons: dict[str, list[Polygon]]) -> str:
+    # LoD1 buildings are blocks, the roof is flattened to the eaves height
+    top = max(point[2] for point in polygons["walls"][0])
+    blocks = polygons["walls"][:4] + [[(x, y, top) for x, y, _ in polygons["ground"][0][::-1]]] + polygons["ground"]
+    members = "".join(surface_member(polygon) for polygon in blocks)
+    return (
+        "<core:cityObjectMember><bldg:Building><bldg:lod1Solid><gml:Solid><gml:exterior><gml:CompositeSurface>"
+        f"{members}</gml:CompositeSurface></gml:exterior></gml:Solid></bldg:lod1Solid></bldg:Building>"
+        "</core:cityObjectMember>"
+    )
+
+
+def generate_tile(tile_x: int, tile_y: int, lod: int = 2, density: int = 1000, seed: int = 0) -> str:
+    """
+    Generates a CityGML tile of 1 km x 1 km.
+
+    Args:
+        tile_x (int): Easting of the tile in km, e.g. 364.
+        tile_y (int): Northing of the tile in km, e.g. 5620.
+        lod (int, optional): Level of detail, 1 or 2. Defaults to 2.
+        density (int, optional): Number of buildings per km². Defaults to 1000.
+        seed (int, optional): Seed of the random generator. Defaults to 0.
+
+    Returns:
+        str: The CityGML document.
+    """
+    rng = np.random.default_rng([seed, tile_x, tile_y])
+    origins = rng.uniform(0, TILE_SIZE - 25.0, size=(density, 2)) + [tile_x * TILE_SIZE, tile_y * TILE_SIZE]
+    to_xml = lod2_building if lod == 2 else lod1_building
+    return CITY_MODEL.format(members="".join(to_xml(building_polygons(rng, x, y)) for x, y in origins))
+
+
+def tile_filename(tile_x: int, tile_y: int, lod: int = 2) -> str:
+    return f"LoD{lod}_{UTM_ZONE}_{tile_x}_{tile_y}_1_NW.gml"
+
+
+def write_tiles(
+    data_path: str, tiles: list[tuple[int, int]], lod: int = 2, density: int = 1000, seed: int = 0
+) -> list[str]:
+    """
+    Writes CityGML tiles to data_path and returns their file paths.
+    """
+    os.makedirs(data_path, exist_ok=True)
+    filepaths = []
+
+    for tile_x, tile_y in tiles:
+        filepath = os.path.join(data_path, tile_filename(tile_x, tile_y, lod))
+        with open(filepath, "w", encoding="utf-8") as f:
+            f.write(generate_tile(tile_x, tile_y, lod, density, seed))
+        filepaths.append(filepath)
+
+    return filepaths
+
+
+def random_edges(rng: np.random.Generator, center: np.ndarray, n_edges: int, radius: float = 80.0) -> np.ndarray:
+    """
+    Returns at least n_edges LoD2 building edges of shape (N, 7) around a center of shape (3,).
+    """
+    edges = []
+    count = 0
+
+    while count < n_edges:
+        distance, azimuth = radius * np.sqrt(rng.uniform(0.01, 1.0)), rng.uniform(0, 2 * np.pi)
+        polygons = building_polygons(
+            rng, center[0] + distance * np.sin(azimuth), center[1] + distance * np.cos(azimuth)
+        )
+        building = np.concatenate([polygon_edges(polygon) for group in polygons.values() for polygon in group])
+        edges.append(np.c_[building, np.full(len(building), len(edges))])
+        count += len(building)
+
+    return np.concatenate(edges)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generates synthetic CityGML tiles in the Geobasis NRW naming.")
+    parser.add_argument("data_path")
+    parser.add_argument("--tiles", nargs="+", default=["364_5620"], metavar="XXX_YYYY")
+    parser.add_argument("--lod", type=int, choices=(1, 2), default=2)
+    parser.add_argument("--density", type=int, default=1000, help="buildings per km²")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    tiles = [tuple(int(value) for value in tile.split("_")) for tile in args.tiles]
+    for filepath in write_tiles(args.data_path, tiles, args.lod, args.density, args.seed):
+        print(filepath)
+
+
+if __name__ == "__main__":
+    main()
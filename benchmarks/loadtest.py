@@ -0,0 +1,440 @@
+"""
+Load test of the OAEM-API under concurrent traffic.
+
+The harness starts a local stub WFS server, which serves synthetic LoD1 buildings with a configurable
+latency, and the FastAPI app in a subprocess using either synthetic CityGML tiles (EDGE_SOURCE "FILE")
+or the stub WFS (EDGE_SOURCE "WFS"). Simulated clients request /oaem, /sunvis and /plot along random
+walks, trajectories or at hotspots. Latency histograms, throughput and cache hits are reported.
+
+Usage:
+
+    python -m benchmarks.loadtest --source FILE --scenario walk --concurrency 16 --duration 30
+    python -m benchmarks.loadtest --source WFS --wfs-latency 0.2 --scenario hotspot --workers 4
+    python -m benchmarks.loadtest --endpoints oaem=1 --output benchmarks/results/load.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+import numpy as np
+
+import config
+
+# the server subprocess and its spawned workers apply the configuration of the harness before importing the app
+CONFIG_VARIABLE = "OAEM_LOADTEST_CONFIG"
+for key, value in json.loads(os.environ.get(CONFIG_VARIABLE, "{}")).items():
+    setattr(config, key, value)
+
+from benchmarks.citygen import CITY_MODEL, TILE_SIZE, building_polygons, lod1_building, write_tiles
+
+TILES = [(364, 5620), (365, 5620), (364, 5621), (365, 5621)]
+AREA = (364 * TILE_SIZE + 100.0, 5620 * TILE_SIZE + 100.0, 366 * TILE_SIZE - 100.0, 5622 * TILE_SIZE - 100.0)
+HEIGHT = 62.0  # meters
+BLOCK_SIZE = 100  # meters, the stub WFS generates the buildings per block to serve overlapping requests consistently
+HOTSPOTS = 8
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, np.inf)
+CACHE_PATTERN = re.compile(r'^oaem_cache_requests_total\{tier="(\w+)",result="(\w+)"\} (\S+)$', re.MULTILINE)
+REJECTION_PATTERN = re.compile(r'^oaem_worker_rejections_total\{reason="(\w+)"\} (\S+)$', re.MULTILINE)
+
+
+class StubWFS(ThreadingHTTPServer):
+    """
+    WFS server answering GetFeature requests with synthetic LoD1 buildings inside the requested BBOX.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, latency: float = 0.0, density: int = 1000, seed: int = 0) -> None:
+        super().__init__(("127.0.0.1", 0), StubWFSHandler)
+        self.latency = latency
+        self.density = density
+        self.seed = seed
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/wfs"
+
+    def count_request(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def buildings(self, min_x: float, min_y: float, max_x: float, max_y: float) -> str:
+        members = []
+        n_buildings = max(round(self.density * BLOCK_SIZE**2 / 1e6), 1)
+
+        for block_x in range(int(min_x // BLOCK_SIZE), int(max_x // BLOCK_SIZE) + 1):
+            for block_y in range(int(min_y // BLOCK_SIZE), int(max_y // BLOCK_SIZE) + 1):
+                rng = np.random.default_rng([self.seed, block_x, block_y])
+                offset = np.array([block_x, block_y]) * BLOCK_SIZE
+                origins = rng.uniform(0, BLOCK_SIZE, size=(n_buildings, 2)) + offset
+                for x, y in origins:
+                    polygons = building_polygons(rng, x, y)
+                    if min_x <= x <= max_x and min_y <= y <= max_y:
+                        members.append(lod1_building(polygons))
+
+        return CITY_MODEL.format(members="".join(members))
+
+
+class StubWFSHandler(BaseHTTPRequestHandler):
+    server: StubWFS
+
+    def do_GET(self) -> None:
+        self.server.count_request()
+        time.sleep(self.server.latency)
+
+        try:
+            bbox = parse_qs(urlparse(self.path).query)["BBOX"][0].split(",")
+            body = self.server.buildings(*(float(value) for value in bbox[:4])).encode("utf-8")
+        except (KeyError, ValueError):
+            self.send_error(400, "Invalid BBOX")
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/gml+xml")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def random_walk(rng: np.random.Generator, step: float = 5.0) -> Iterator[np.ndarray]:
+    """
+    Positions of a pedestrian changing direction randomly, steps of about step meters.
+    """
+    position = rng.uniform(AREA[:2], AREA[2:])
+    while True:
+        yield position
+        position = np.clip(position + rng.normal(0.0, step, size=2), AREA[:2], AREA[2:])
+
+
+def trajectory(rng: np.random.Generator, speed: float = 10.0) -> Iterator[np.ndarray]:
+    """
+    Positions of a vehicle driving straight at speed meters per request and turning at the border of the area.
+    """
+    position = rng.uniform(AREA[:2], AREA[2:])
+    direction = rng.uniform(0, 2 * np.pi)
+    while True:
+        yield position
+        position = position + speed * np.array([np.sin(direction), np.cos(direction)])
+        if np.any(position < AREA[:2]) or np.any(position > AREA[2:]):
+            position = np.clip(position, AREA[:2], AREA[2:])
+            direction = rng.uniform(0, 2 * np.pi)
+
+
+def hotspot(rng: np.random.Generator, hotspots: np.ndarray, spread: float = 5.0) -> Iterator[np.ndarray]:
+    """
+    Positions around a few popular places, chosen with Zipf-like weights.
+    """
+    weights = 1 / np.arange(1, len(hotspots) + 1)
+    weights /= weights.sum()
+    while True:
+        yield hotspots[rng.choice(len(hotspots), p=weights)] + rng.normal(0.0, spread, size=2)
+
+
+def positions(scenario: str, rng: np.random.Generator, hotspots: np.ndarray, client: int) -> Iterator[np.ndarray]:
+    if scenario == "mixed":
+        scenario = ("walk", "trajectory", "hotspot")[client % 3]
+
+    if scenario == "walk":
+        return random_walk(rng)
+    if scenario == "trajectory":
+        return trajectory(rng)
+    return hotspot(rng, hotspots)
+
+
+async def run_client(
+    client: httpx.AsyncClient,
+    route: Iterator[np.ndarray],
+    endpoints: dict[str, float],
+    rng: np.random.Generator,
+    deadline: float,
+    samples: list[tuple[str, int, float]],
+) -> None:
+    names = list(endpoints)
+    weights = np.array(list(endpoints.values())) / sum(endpoints.values())
+
+    while time.perf_counter() < deadline:
+        endpoint = names[rng.choice(len(names), p=weights)]
+        x, y = next(route)
+        params = {"pos_x": f"{x:.3f}", "pos_y": f"{y:.3f}", "pos_z": HEIGHT, "epsg": config.EDGE_EPSG}
+
+        start_time = time.perf_counter()
+        try:
+            status = (await client.get(f"/{endpoint}", params=params)).status_code
+        except httpx.HTTPError:
+            status = 0
+        samples.append((endpoint, status, time.perf_counter() - start_time))
+
+        if status == 503:
+            await asyncio.sleep(config.WORKER_RETRY_AFTER)
+
+
+async def drive(
+    base_url: str, scenario: str, endpoints: dict[str, float], concurrency: int, duration: float, seed: int
+) -> tuple[list[tuple[str, int, float]], float]:
+    """
+    Runs concurrency closed-loop clients for duration seconds and returns the samples and the elapsed time.
+    """
+    rng = np.random.default_rng(seed)
+    hotspots = rng.uniform(AREA[:2], AREA[2:], size=(HOTSPOTS, 2))
+    samples: list[tuple[str, int, float]] = []
+    limits = httpx.Limits(max_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=120.0, limits=limits) as client:
+        start_time = time.perf_counter()
+        deadline = start_time + duration
+        await asyncio.gather(
+            *(
+                run_client(
+                    client,
+                    positions(scenario, np.random.default_rng([seed, i]), hotspots, i),
+                    endpoints,
+                    np.random.default_rng([seed, i, 1]),
+                    deadline,
+                    samples,
+                )
+                for i in range(concurrency)
+            )
+        )
+        return samples, time.perf_counter() - start_time
+
+
+def summarise(samples: list[tuple[str, int, float]], elapsed: float) -> dict:
+    """
+    Returns throughput, latency percentiles, status codes and the latency histogram per endpoint.
+    """
+    summary = {}
+    groups = {"all": samples} | {
+        endpoint: [sample for sample in samples if sample[0] == endpoint]
+        for endpoint in sorted({s[0] for s in samples})
+    }
+
+    for name, group in groups.items():
+        statuses = np.array([status for _, status, _ in group])
+        latencies = np.array([latency for _, status, latency in group if status == 200])
+        percentiles = np.percentile(latencies, [50, 90, 99]) if len(latencies) else [np.nan] * 3
+        counts = np.bincount(np.searchsorted(LATENCY_BUCKETS, latencies), minlength=len(LATENCY_BUCKETS))
+        summary[name] = {
+            "requests": len(group),
+            "throughput": len(latencies) / elapsed,
+            "p50": float(percentiles[0]),
+            "p90": float(percentiles[1]),
+            "p99": float(percentiles[2]),
+            "max": float(latencies.max()) if len(latencies) else float("nan"),
+            "status": {str(status): int(count) for status, count in zip(*np.unique(statuses, return_counts=True))},
+            "histogram": {
+                f"{bound:g}" if np.isfinite(bound) else "+Inf": int(count)
+                for bound, count in zip(LATENCY_BUCKETS, counts)
+            },
+        }
+
+    return summary
+
+
+def scrape_counters(base_url: str) -> dict[str, float]:
+    """
+    Returns the cache and rejection counters of the /metrics endpoint.
+    """
+    text = httpx.get(f"{base_url}/metrics").text
+    counters = {f"cache.{tier}.{result}": float(value) for tier, result, value in CACHE_PATTERN.findall(text)}
+    counters |= {f"rejected.{reason}": float(value) for reason, value in REJECTION_PATTERN.findall(text)}
+    return counters
+
+
+def cache_report(before: dict[str, float], after: dict[str, float]) -> dict:
+    tiers = sorted({key.split(".")[1] for key in after if key.startswith("cache.")})
+    report = {}
+
+    for tier in tiers:
+        hits = after.get(f"cache.{tier}.hit", 0) - before.get(f"cache.{tier}.hit", 0)
+        misses = after.get(f"cache.{tier}.miss", 0) - before.get(f"cache.{tier}.miss", 0)
+        report[tier] = {"hits": hits, "misses": misses, "hit_ratio": hits / (hits + misses) if hits + misses else None}
+
+    return report
+
+
+def print_report(summary: dict, caches: dict, rejections: dict, wfs_requests: int, elapsed: float) -> None:
+    print(f"\n{'endpoint':<10} {'requests':>9} {'req/s':>8} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}  status")
+    for name, result in summary.items():
+        print(
+            f"{name:<10} {result['requests']:>9} {result['throughput']:>8.1f} "
+            + " ".join(f"{result[key] * 1000:>7.1f}ms" for key in ("p50", "p90", "p99", "max"))
+            + f"  {result['status']}"
+        )
+
+    total = summary["all"]["histogram"]
+    scale = 50 / max(max(total.values()), 1)
+    print("\nlatency histogram (successful requests)")
+    for bound, count in total.items():
+        print(f"  <= {bound:>5} s {count:>7} {'#' * round(count * scale)}")
+
+    print("\ncache    hits  misses  hit ratio")
+    for tier, result in caches.items():
+        ratio = f"{result['hit_ratio']:.1%}" if result["hit_ratio"] is not None else "-"
+        print(f"  {tier:<6} {result['hits']:>5.0f} {result['misses']:>7.0f} {ratio:>10}")
+
+    print(f"\nrejected jobs: {rejections or 0}")
+    print(f"stub WFS requests: {wfs_requests}, elapsed: {elapsed:.1f}s")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(base_url: str, server: subprocess.Popen, timeout: float) -> None:
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("The server terminated during start-up.")
+        try:
+            if httpx.get(f"{base_url}/ready").status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+
+    raise TimeoutError(f"The server was not ready within {timeout} seconds.")
+
+
+def serve() -> None:
+    import uvicorn
+
+    from main import app
+
+    uvicorn.run(app, host=config.APP_HOST, port=config.APP_PORT, log_level="warning")
+
+
+def parse_endpoints(values: list[str]) -> dict[str, float]:
+    endpoints = {}
+    for value in values:
+        name, _, weight = value.partition("=")
+        if name not in ("oaem", "sunvis", "plot"):
+            raise argparse.ArgumentTypeError(f"Unknown endpoint {name}, use oaem, sunvis or plot.")
+        endpoints[name] = float(weight or 1)
+    return endpoints
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Runs a load test against a local OAEM-API server.")
+    parser.add_argument("--source", choices=("FILE", "WFS"), default="FILE", help="EDGE_SOURCE of the server")
+    parser.add_argument("--scenario", choices=("walk", "trajectory", "hotspot", "mixed"), default="mixed")
+    parser.add_argument("--endpoints", nargs="+", default=["oaem=0.6", "sunvis=0.2", "plot=0.2"], metavar="NAME=W")
+    parser.add_argument("--concurrency", type=int, default=16, help="number of simultaneous clients")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds")
+    parser.add_argument("--workers", type=int, default=config.WORKER_PROCESSES, help="WORKER_PROCESSES of the server")
+    parser.add_argument("--queue-size", type=int, default=config.WORKER_QUEUE_SIZE, help="WORKER_QUEUE_SIZE")
+    parser.add_argument("--lod", type=int, choices=(1, 2), default=2, help="EDGE_LOD of the FILE source")
+    parser.add_argument("--density", type=int, default=1500, help="buildings per km²")
+    parser.add_argument("--wfs-latency", type=float, default=0.1, help="seconds per stub WFS response")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="", help="JSON file of the results")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve()
+        return
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    endpoints = parse_endpoints(args.endpoints)
+    data_path = tempfile.mkdtemp(prefix="oaem-loadtest-")
+    wfs = StubWFS(latency=args.wfs_latency, density=args.density, seed=args.seed)
+    threading.Thread(target=wfs.serve_forever, daemon=True).start()
+
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    server_config = {
+        "APP_HOST": "127.0.0.1",
+        "APP_PORT": port,
+        "GEOID_FILE": "",
+        "EDGE_SOURCE": args.source,
+        "EDGE_LOD": args.lod,
+        "EDGE_DATA_PATH": os.path.join(data_path, "gmldata"),
+        "TILE_CACHE_PATH": os.path.join(data_path, "tilecache"),
+        "WFS_URL": wfs.url,
+        "WORKER_PROCESSES": args.workers,
+        "WORKER_QUEUE_SIZE": args.queue_size,
+        "METRICS_ENABLED": True,
+        "PREFETCH_ENABLED": False,
+    }
+
+    server = None
+    log_path = os.path.join(data_path, "server.log")
+    try:
+        if args.source == "FILE":
+            write_tiles(server_config["EDGE_DATA_PATH"], TILES, lod=args.lod, density=args.density, seed=args.seed)
+
+        with open(log_path, "w", encoding="utf-8") as log:
+            server = subprocess.Popen(
+                [sys.executable, "-m", "benchmarks.loadtest", "--serve"],
+                env={**os.environ, CONFIG_VARIABLE: json.dumps(server_config)},
+                stdout=log,
+                stderr=subprocess.STDOUT,
+            )
+        wait_ready(base_url, server, timeout=config.WARM_UP_TIMEOUT)
+
+        before = scrape_counters(base_url)
+        print(
+            f"Running {args.scenario} scenario with {args.concurrency} clients for {args.duration:g}s "
+            f"(source {args.source}, {args.workers} worker processes) ..."
+        )
+        samples, elapsed = asyncio.run(
+            drive(base_url, args.scenario, endpoints, args.concurrency, args.duration, args.seed)
+        )
+        after = scrape_counters(base_url)
+    except (RuntimeError, TimeoutError):
+        with open(log_path, "r", encoding="utf-8") as log:
+            print(log.read(), file=sys.stderr)
+        raise
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+        wfs.shutdown()
+        shutil.rmtree(data_path, ignore_errors=True)
+
+    summary = summarise(samples, elapsed)
+    caches = cache_report(before, after)
+    rejections = {key.split(".")[1]: after[key] - before.get(key, 0) for key in after if key.startswith("rejected.")}
+    print_report(summary, caches, rejections, wfs.requests, elapsed)
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "config": {key: value for key, value in vars(args).items() if key != "serve"},
+                    "elapsed": elapsed,
+                    "endpoints": summary,
+                    "caches": caches,
+                    "rejections": rejections,
+                    "wfs_requests": wfs.requests,
+                },
+                f,
+                indent=2,
+            )
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+Offline benchmark suite of the OAEM computation.
+
+The benchmarks run on synthetic CityGML tiles (see benchmarks.citygen) without geoid file,
+WFS or shared tile store. Results are written as JSON and can be compared against a baseline.
+
+Usage:
+
+    python -m benchmarks.run                                # run all benchmarks, save to benchmarks/results
+    python -m benchmarks.run --quick --filter oaem          # fewer repetitions, only matching benchmarks
+    python -m benchmarks.run --baseline benchmarks/results/baseline.json --tolerance 0.2
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Callable
+
+import numpy as np
+
+import config
+
+# the benchmarks must not depend on external data or on the state of previous runs
+config.GEOID_FILE = ""
+config.TILE_CACHE_PATH = ""
+config.EDGE_SOURCE = "FILE"
+config.EDGE_LOD = 2
+config.EDGE_DATA_PATH = tempfile.mkdtemp(prefix="oaem-benchmark-")
+
+# the app modules read the configuration on import
+from pointset import PointSet
+
+from app import tasks
+from app.cache import cache_manager
+from app.gml import GMLData, parse_citygml
+from app.oaem import compute_oaem, compute_oaem_track, oaem_from_edges
+from app.plotting import create_json_fig, create_plot_data
+from app.raster import create_png, create_svg
+from app.suntrack import SunTrack
+from benchmarks.citygen import TILE_SIZE, random_edges, write_tiles
+
+RESULTS_PATH = os.path.join(os.path.dirname(__file__), "results")
+TILE = (364, 5620)
+CENTER = np.array([(TILE[0] + 0.5) * TILE_SIZE, (TILE[1] + 0.5) * TILE_SIZE, 62.0])
+EDGE_COUNTS = (100, 1000, 5000, 20000)
+
+Benchmark = tuple[Callable[..., Any], Callable[[], tuple] | None, dict]
+
+
+def measure(func: Callable[..., Any], setup: Callable[[], tuple] | None, repeat: int) -> dict:
+    """
+    Runs func repeat times, setup is called before every run and is not measured.
+    """
+    times = []
+    for _ in range(repeat):
+        args = setup() if setup is not None else ()
+        start_time = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start_time)
+
+    return {"median": float(np.median(times)), "min": float(np.min(times)), "repeat": repeat}
+
+
+def create_benchmarks(density: int, edge_counts: tuple[int, ...]) -> dict[str, Benchmark]:
+    """
+    Creates the synthetic data and returns the benchmarks as name: (func, setup, params).
+    """
+    lod1_file = write_tiles(config.EDGE_DATA_PATH, [TILE], lod=1, density=density)[0]
+    lod2_file = write_tiles(config.EDGE_DATA_PATH, [TILE], lod=2, density=density)[0]
+    coordinates = np.array(parse_citygml(lod2_file, lod=2), dtype=np.float64).reshape(-1, 7)
+    gml_data = GMLData(coordinates)
+    query_positions = CENTER + np.c_[np.random.default_rng(0).uniform(-400, 400, size=(100, 2)), np.zeros(100)]
+    pos = PointSet(xyz=CENTER[None], epsg=config.ROUNDING_EPSG, init_local_transformer=False)
+
+    def query_edges() -> None:
+        for query_position in query_positions:
+            gml_data.query_edges(query_position[None])
+
+    def edge_setup(n_edges: int) -> Callable[[], tuple]:
+        edge_coords = random_edges(np.random.default_rng(n_edges), CENTER, n_edges)
+        return lambda: (edge_coords, pos)
+
+    def compute_cold() -> None:
+        cache_manager.clear()
+        compute_oaem(*CENTER, config.ROUNDING_EPSG)
+
+    # 10 Hz positions of a vehicle driving at 10 m/s
+    trajectory = CENTER + np.c_[np.arange(100) * 1.0, np.zeros(100), np.zeros(100)]
+
+    def trajectory_independent() -> None:
+        for position in trajectory:
+            compute_oaem(*position, config.ROUNDING_EPSG)
+
+    oaem = compute_oaem(*CENTER, config.ROUNDING_EPSG)
+    sun_track = SunTrack(*CENTER, epsg=config.ROUNDING_EPSG)
+
+    benchmarks: dict[str, Benchmark] = {
+        "parse_lod1": (lambda: parse_citygml(lod1_file, lod=1), None, {"density": density}),
+        "parse_lod2": (lambda: parse_citygml(lod2_file, lod=2), None, {"density": density}),
+        "index_build": (lambda: GMLData(coordinates), None, {"edges": len(coordinates)}),
+        "edge_query_x100": (query_edges, None, {"edges": len(coordinates), "queries": len(query_positions)}),
+    }
+
+    for n_edges in edge_counts:
+        benchmarks[f"oaem_{n_edges}_edges"] = (oaem_from_edges, edge_setup(n_edges), {"edges": n_edges})
+
+    benchmarks.update(
+        {
+            "compute_oaem_cold": (compute_cold, None, {"density": density}),
+            "compute_oaem_warm": (lambda: compute_oaem(*CENTER, config.ROUNDING_EPSG), None, {"density": density}),
+            "trajectory_100_independent": (trajectory_independent, None, {"positions": len(trajectory)}),
+            "trajectory_100_incremental": (
+                lambda: compute_oaem_track(trajectory, config.ROUNDING_EPSG),
+                None,
+                {"positions": len(trajectory)},
+            ),
+            "sun_visibility": (lambda: tasks.sun_visibility(oaem, SunTrack(*CENTER)), None, {}),
+            "serialise_az_el_str": (lambda: oaem.az_el_str, None, {}),
+            "serialise_plot_compact": (lambda: json.dumps(create_plot_data(oaem, sun_track)), None, {}),
+            "serialise_plot_plotly": (lambda: create_json_fig(600, 600, 0.0, oaem, sun_track), None, {}),
+            "render_png": (lambda: create_png(600, 600, 0.0, oaem, sun_track), None, {}),
+            "render_svg": (lambda: create_svg(600, 600, 0.0, oaem, sun_track), None, {}),
+        }
+    )
+    return benchmarks
+
+
+def metadata() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = ""
+
+    return {
+        "date": datetime.now().astimezone().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> bool:
+    """
+    Prints the ratio of the current and the baseline median times and returns whether there is no regression.
+    """
+    passed = True
+    print(f"\n{'benchmark':<28} {'baseline':>12} {'current':>12} {'ratio':>8}")
+
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+
+        ratio = result["median"] / baseline[name]["median"]
+        regression = ratio > 1 + tolerance
+        passed &= not regression
+        print(
+            f"{name:<28} {baseline[name]['median'] * 1000:>10.3f}ms {result['median'] * 1000:>10.3f}ms "
+            f"{ratio:>7.2f}x{'  REGRESSION' if regression else ''}"
+        )
+
+    return passed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Runs the offline OAEM benchmarks.")
+    parser.add_argument("--quick", action="store_true", help="fewer repetitions and smaller inputs")
+    parser.add_argument("--filter", default="", help="only run benchmarks containing this string")
+    parser.add_argument("--density", type=int, default=2000, help="buildings per km² of the synthetic tiles")
+    parser.add_argument("--repeat", type=int, default=0, help="repetitions per benchmark, 0 uses the default")
+    parser.add_argument("--output", default="", help="result file, defaults to benchmarks/results/<date>.json")
+    parser.add_argument("--baseline", default="", help="result file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown")
+    args = parser.parse_args()
+
+    logging.getLogger("root").setLevel(logging.WARNING)
+    density = args.density // 4 if args.quick else args.density
+    edge_counts = EDGE_COUNTS[:-1] if args.quick else EDGE_COUNTS
+    repeat = args.repeat or (3 if args.quick else 10)
+
+    results = {}
+    try:
+        for name, (func, setup, params) in create_benchmarks(density, edge_counts).items():
+            if args.filter not in name:
+                continue
+
+            results[name] = {**measure(func, setup, repeat), "params": params}
+            print(f"{name:<28} {results[name]['median'] * 1000:>10.3f}ms (min {results[name]['min'] * 1000:.3f}ms)")
+    finally:
+        shutil.rmtree(config.EDGE_DATA_PATH, ignore_errors=True)
+
+    output = args.output or os.path.join(RESULTS_PATH, f"{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({"meta": metadata(), "results": results}, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+
+        if not compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -20,10 +20,60 @@ EDGE_DATA_PATH = "./gmldata"  # only relevant if EDGE_SOURCE == "FILE"
 EDGE_LOD = 2  # 1 or 2, 2 includes roof shapes and more detailed buildings but is slower
 EDGE_EPSG = 25832  # EPSG of the CityGML data source
 
+TILE_CACHE_PATH = "./tilecache"  # directory of the tile cache shared by all workers, "" disables it
+TILE_CACHE_WFS_MAX_SIZE = 1024**3  # bytes, the oldest WFS responses beyond this size are removed from the tile cache
+TILE_CACHE_WFS_MAX_AGE = 7 * 86400  # seconds, older WFS responses in the tile cache are requested again
+
+CACHE_BUDGET = 512 * 1024**2  # bytes, memory budget of all in-memory caches of one worker process
+SKYPLOT_CACHE_BUDGET = 64 * 1024**2  # bytes, memory budget of the precomputed skyplot pixel grids
+CACHE_POLICY = "LRU"  # "LRU" or "LFU", eviction policy of the in-memory caches
+
 WFS_EPSG = 25832
 WFS_URL = "https://www.wfs.nrw.de/geobasis/wfs_nw_3d-gebaeudemodell_lod1"
 WFS_BASE_REQUEST = "Service=WFS&REQUEST=GetFeature&VERSION=1.1.0&TYPENAME=bldg:Building"
 
+WORKER_PROCESSES = 0  # number of worker processes for the OAEM computation, 0 uses a thread pool in the server process
+WORKER_QUEUE_SIZE = 32  # maximum number of queued and running jobs, further requests are rejected with 503
+WORKER_RETRY_AFTER = 1  # seconds, sent in the Retry-After header of rejected requests
+
+OAEM_TIMEOUT = 10.0  # seconds, timeout of the OAEM computation
+SUNVIS_TIMEOUT = 5.0  # seconds, timeout of the sun visibility computation
+PLOT_TIMEOUT = 10.0  # seconds, timeout of the plot creation
+WARM_UP_TIMEOUT = 120.0  # seconds, timeout of the background initialization of a worker
+WARM_UP_RETRY = 10.0  # seconds, delay before a failed warm-up is retried and interval of the readiness check
+
+PLOT_TEMPLATE_MAX_AGE = 86400  # seconds, clients may cache the static skyplot template of /plot/layout
+OAEM_MAX_AGE = 86400  # seconds, clients and proxies may cache /oaem responses, revalidated with their ETag
+ETAG_RES = 0.001  # meters, positions are quantised to ETAG_RES in ROUNDING_EPSG for the ETags of /oaem
+DATA_VERSION = ""  # version of the building data in the ETags, "" derives it from the CityGML files
+GZIP_MIN_SIZE = 1024  # bytes, larger responses are compressed if the client accepts gzip
+MAX_IMAGE_SIZE = 2048  # pixels, maximum width and height of the /plot.png and /plot.svg images
+
+ADMIN_TOKEN = ""  # bearer token of the /admin endpoints, "" disables them
+
+PREFETCH_PARALLELISM = 4  # maximum number of concurrent jobs of a warm-up
+PREFETCH_CHUNK_SIZE = 25  # neighborhood cells per warm-up job
+PREFETCH_TIMEOUT = 120.0  # seconds, timeout of a warm-up job
+PREFETCH_MAX_CELLS = 100000  # maximum number of neighborhood cells of an /admin/warm request
+PREFETCH_ENABLED = False  # prefetch the neighborhood cells ahead of moving clients
+PREFETCH_HORIZON = 60.0  # seconds, prefetch the path of the next PREFETCH_HORIZON seconds ...
+PREFETCH_DISTANCE = 500.0  # meters, ... but at most PREFETCH_DISTANCE meters ahead
+PREFETCH_MAX_AGE = 30.0  # seconds, older client positions are not used to estimate the direction of travel
+
+SUN_ENGINE = "NUMPY"  # "NUMPY" or "PVLIB", solar position algorithm of the sun track, see app/solar.py
+
+METRICS_ENABLED = False  # record stage durations and cache statistics, exported at /metrics
+
+VISIBILITY_TIMEOUT = 30.0  # seconds, timeout of the satellite visibility of /visibility
+VISIBILITY_MAX_OBSERVATIONS = 4_000_000  # maximum number of epochs x satellites of a /visibility request
+VISIBILITY_MAX_BODY_SIZE = 48 * 1024**2  # bytes, larger /visibility requests are rejected with 413
+VISIBILITY_MAX_POSITIONS = 3600  # maximum number of distinct positions of a /visibility request
+
+PROFILE_TIMEOUT = 60.0  # seconds, timeout of a profiled OAEM computation (/oaem?profile=1)
+PROFILE_REPORT_LINES = 40  # number of functions in the cProfile report
+
+TRACK_TOLERANCE = 1.0  # meters, the OAEM of a tracked client is recomputed if it moves further or enters another cell
+
 APP_HOST = "0.0.0.0"
 APP_PORT = 8000
 logging.basicConfig(
@@ -1,15 +1,50 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.staticfiles import StaticFiles
-from config import VERSION, APP_HOST, APP_PORT
+from config import VERSION, APP_HOST, APP_PORT, GZIP_MIN_SIZE, METRICS_ENABLED
+from app.admin import admin_router
+from app.warmup import warm_up
+from app.executor import worker_pool
+from app.metrics import REQUEST_DURATION, record
 from app.routes import router
 
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    warm_up_task = asyncio.create_task(warm_up())
+    yield
+    warm_up_task.cancel()
+    worker_pool.shutdown()
+
+
 app = FastAPI(
     title="OAEM-API",
     version=VERSION,
+    lifespan=lifespan,
 )
 app.include_router(router)
+app.include_router(admin_router)
 app.mount("/static", StaticFiles(directory="./app/static"), name="static")
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_MIN_SIZE)
+
+
+if METRICS_ENABLED:
+
+    @app.middleware("http")
+    async def record_request_duration(request: Request, call_next):
+        start_time = time.perf_counter()
+        response = await call_next(request)
+        route = request.scope.get("route")
+
+        if route is not None:
+            record(REQUEST_DURATION, (route.path, str(response.status_code)), time.perf_counter() - start_time)
+
+        return response
 
 
 if __name__ == "__main__":
@@ -0,0 +1,26 @@
+import tempfile
+
+import pytest
+from fastapi.testclient import TestClient
+
+import config
+from benchmarks.citygen import write_tiles
+
+# the tests must not depend on external data or on the state of previous runs, like the benchmarks
+config.GEOID_FILE = ""
+config.TILE_CACHE_PATH = ""
+config.EDGE_SOURCE = "FILE"
+config.EDGE_DATA_PATH = tempfile.mkdtemp(prefix="oaem-test-")
+
+
+@pytest.fixture(scope="session")
+def client() -> TestClient:
+    """
+    Client of the app with a synthetic CityGML tile around (364500, 5620500) in EPSG:25832.
+    """
+    write_tiles(config.EDGE_DATA_PATH, [(364, 5620)], lod=config.EDGE_LOD)
+
+    # imported after the configuration is set, since the app modules read it on import
+    from main import app
+
+    return TestClient(app)
@@ -0,0 +1,161 @@
+import sys
+import threading
+import time
+
+import numpy as np
+import pytest
+from pointset import PointSet
+
+from app.cache import CacheManager, CachePolicy, make_key, sizeof
+
+
+def point(x: float, y: float, epsg: int = 25832) -> PointSet:
+    return PointSet(xyz=np.array([[x, y, 0.0]]), epsg=epsg, init_local_transformer=False)
+
+
+def cached_keys(cache: CacheManager) -> str:
+    # without get, which would count as a hit
+    return "".join(sorted(str(key) for _, key in cache._entries))
+
+
+def test_put_evicts_entries_beyond_budget():
+    cache = CacheManager(budget=100, policy=CachePolicy.LRU)
+    for index in range(5):
+        cache.put("tier", index, index, 30)
+
+    assert cache.nbytes == 90
+    assert cached_keys(cache) == "234"
+
+    stats = cache.stats()["tiers"]["tier"]
+    assert (stats["entries"], stats["nbytes"], stats["evictions"]) == (3, 90, 2)
+
+
+def test_put_replaces_entry_and_skips_oversized_values():
+    cache = CacheManager(budget=100, policy=CachePolicy.LRU)
+    cache.put("tier", "a", 1, 40)
+    cache.put("tier", "a", 2, 60)
+    cache.put("tier", "b", 3, 101)
+
+    assert cache.nbytes == 60
+    assert cache.get("tier", "a") == (True, 2)
+    assert cache.get("tier", "b") == (False, None)
+
+
+def test_lru_evicts_least_recently_used():
+    cache = CacheManager(budget=30, policy=CachePolicy.LRU)
+    for key in "abc":
+        cache.put("tier", key, key, 10)
+
+    cache.get("tier", "a")
+    cache.put("other", "d", "d", 10)
+
+    assert cached_keys(cache) == "acd"
+    assert cache.stats()["tiers"]["tier"]["evictions"] == 1
+
+
+def test_lfu_evicts_least_frequently_used():
+    cache = CacheManager(budget=30, policy=CachePolicy.LFU)
+    for key in "abc":
+        cache.put("tier", key, key, 10)
+    for key in "aab":
+        cache.get("tier", key)
+
+    # a has two hits, b one and c none
+    cache.put("tier", "d", "d", 10)
+    assert cached_keys(cache) == "abd"
+
+    # a new entry is not evicted by the next one before it had the chance of a hit
+    cache.put("tier", "e", "e", 10)
+    assert cached_keys(cache) == "abe"
+
+    # b and e have one hit, b was used less recently
+    cache.get("tier", "e")
+    cache.put("tier", "f", "f", 10)
+    assert cached_keys(cache) == "aef"
+
+
+def test_lfu_evicts_after_removals():
+    cache = CacheManager(budget=30, policy=CachePolicy.LFU)
+    for key in "abc":
+        cache.put("tier", key, key, 10)
+    for key in "aabbcc":
+        cache.get("tier", key)
+
+    cache.put("tier", "d", "d", 10)
+    assert cached_keys(cache) == "bcd"
+
+    # replacing b resets its hits
+    for _ in range(3):
+        cache.get("tier", "d")
+    cache.put("tier", "b", "b", 10)
+    cache.put("tier", "e", "e", 10)
+    assert cached_keys(cache) == "cde"
+
+    # evicts e without hits first, then c with two hits
+    cache.put("tier", "f", "f", 20)
+    assert cached_keys(cache) == "df"
+    assert cache.nbytes == 30
+
+    cache.clear()
+    cache.put("tier", "a", "a", 30)
+    assert cached_keys(cache) == "a"
+
+
+def test_sizeof():
+    array = np.zeros((10, 7))
+
+    class Sized:
+        nbytes = 123
+
+    assert sizeof(array) == array.nbytes
+    assert sizeof(Sized()) == 123
+    assert sizeof([array, array]) == sys.getsizeof([array, array]) + 2 * array.nbytes
+    assert sizeof((array, (array, Sized()))) > 2 * array.nbytes + 123
+    assert sizeof("text") == sys.getsizeof("text")
+
+
+def test_make_key():
+    assert make_key("f", point(1.0, 2.0)) == make_key("f", point(1.0, 2.0))
+    assert make_key("f", point(1.0, 2.0)) != make_key("f", point(1.0, 2.5))
+    assert make_key("f", point(1.0, 2.0)) != make_key("f", point(1.0, 2.0, epsg=4326))
+    assert make_key("f", 1, a=2, b=3) == make_key("f", 1, b=3, a=2)
+    assert make_key("f", 1, a=2) != make_key("f", 1, b=2)
+    hash(make_key("f", point(1.0, 2.0), pos=point(3.0, 4.0)))
+
+
+def test_cached_loads_value_once():
+    cache = CacheManager(budget=1000, policy=CachePolicy.LRU)
+    calls = []
+
+    @cache.cached(tier="tier", size=lambda value: 10)
+    def load(value: int) -> int:
+        calls.append(value)
+        time.sleep(0.1)
+        return value * 2
+
+    threads = [threading.Thread(target=load, args=(1,)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert load(1) == 2
+    assert load(2) == 4
+    assert calls == [1, 2]
+
+    stats = cache.stats()["tiers"]["tier"]
+    assert stats["shared_loads"] == 3
+    assert (stats["entries"], stats["nbytes"]) == (2, 20)
+
+
+@pytest.mark.parametrize("policy", list(CachePolicy))
+def test_eviction_is_fast(policy):
+    cache = CacheManager(budget=10000, policy=policy)
+    start_time = time.perf_counter()
+
+    for index in range(50000):
+        cache.put("tier", index, index, 1)
+        cache.get("tier", index - index % 7)
+
+    assert cache.nbytes == 10000
+    assert time.perf_counter() - start_time < 5
@@ -0,0 +1,84 @@
+import pytest
+
+from app import http_cache, routes
+
+POSITION = {"pos_x": 364500.0, "pos_y": 5620500.0, "pos_z": 62.0, "epsg": 25832}
+
+
+@pytest.fixture
+def data_version(monkeypatch):
+    """
+    Determines the data version like the warm-up and resets it afterwards.
+    """
+    http_cache.data_version.cache_clear()
+    monkeypatch.setattr(http_cache, "DATA_VERSION", "1")
+    http_cache.data_version()
+    yield
+    http_cache.data_version.cache_clear()
+
+
+def etag(pos_x: float = POSITION["pos_x"]) -> str | None:
+    return http_cache.oaem_etag(pos_x, POSITION["pos_y"], POSITION["pos_z"], POSITION["epsg"])
+
+
+def test_matching_etag_returns_not_modified(client, data_version, monkeypatch):
+    response = client.get("/oaem", params=POSITION)
+    assert response.status_code == 200
+    assert response.headers["ETag"] == etag()
+    assert response.headers["Cache-Control"].startswith("public, max-age=")
+
+    async def fail(*args):
+        raise AssertionError("the OAEM must not be computed")
+
+    monkeypatch.setattr(routes, "get_oaem", fail)
+
+    for if_none_match in (etag(), f'"other", W/{etag()}', "*"):
+        response = client.get("/oaem", params=POSITION, headers={"If-None-Match": if_none_match})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["ETag"] == etag()
+
+
+def test_other_etag_returns_oaem(client, data_version):
+    response = client.get("/oaem", params=POSITION, headers={"If-None-Match": '"other"'})
+
+    assert response.status_code == 200
+    assert response.json()["data"]
+
+
+def test_etag_requires_data_version(client):
+    http_cache.data_version.cache_clear()
+    response = client.get("/oaem", params=POSITION)
+
+    assert response.status_code == 200
+    assert "ETag" not in response.headers
+
+
+def test_etag_changes_with_position_and_configuration(data_version, monkeypatch):
+    reference = etag()
+    assert etag(POSITION["pos_x"] + 0.01 * http_cache.ETAG_RES) == reference
+    assert etag(POSITION["pos_x"] + 2 * http_cache.ETAG_RES) != reference
+
+    monkeypatch.setattr(http_cache, "N_RES", http_cache.N_RES * 2)
+    assert etag() != reference
+
+    monkeypatch.undo()
+    http_cache.data_version.cache_clear()
+    monkeypatch.setattr(http_cache, "DATA_VERSION", "2")
+    http_cache.data_version()
+    assert etag() not in (None, reference)
+
+
+def test_data_version_changes_with_gml_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(http_cache, "DATA_VERSION", "")
+    monkeypatch.setattr(http_cache, "EDGE_SOURCE", "FILE")
+    monkeypatch.setattr(http_cache, "EDGE_DATA_PATH", str(tmp_path))
+    versions = []
+
+    for content in ("<a/>", "<a></a>"):
+        (tmp_path / "LoD2_32_364_5620_1_NW.gml").write_text(content)
+        http_cache.data_version.cache_clear()
+        versions.append(http_cache.data_version())
+
+    http_cache.data_version.cache_clear()
+    assert versions[0] != versions[1]
@@ -0,0 +1,129 @@
+import numpy as np
+import pytest
+
+from app import oaem
+from app.edge import elevation_at, summarise_buildings
+from app.oaem import AZIMUTH_COS, AZIMUTH_GRID, AZIMUTH_SIN, evaluate_edges
+from benchmarks.citygen import random_edges
+
+CENTER = np.array([364500.0, 5620500.0, 62.0])
+TOLERANCE = 1e-9  # radians
+
+
+def brute_force(edges: np.ndarray, pos: np.ndarray) -> np.ndarray:
+    """
+    Evaluates every edge in every azimuth bin by intersecting the line of sight with the edge.
+    """
+    elevation = np.zeros(len(AZIMUTH_GRID))
+    start = edges[:, :2] - pos[:2]
+    direction = edges[:, 3:5] - edges[:, :2]
+
+    def cross(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        return a[..., 0] * b[..., 1] - a[..., 1] * b[..., 0]
+
+    for i, azimuth in enumerate(AZIMUTH_GRID):
+        ray = np.array([np.sin(azimuth), np.cos(azimuth)])
+
+        # distance * ray = start + t * direction
+        with np.errstate(divide="ignore", invalid="ignore"):
+            denominator = cross(ray, direction)
+            distance = cross(start, direction) / denominator
+            t = cross(start, ray) / denominator
+
+        hit = (denominator != 0) & (distance > 0) & (t >= 0) & (t <= 1)
+        if hit.any():
+            elevation[i] = max(np.arctan2(edges[hit, 2] - pos[2], distance[hit]).max(), 0.0)
+
+    return elevation
+
+
+@pytest.fixture(scope="module", params=[300, 5000], ids=lambda n_edges: f"{n_edges}_edges")
+def edges(request) -> np.ndarray:
+    # centimetre coordinates like the edges of the tile store
+    edges = random_edges(np.random.default_rng(request.param), CENTER, request.param)
+    edges[:, :6] = np.round(edges[:, :6], 2)
+    return edges
+
+
+def random_positions(seed: int, count: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return CENTER + np.c_[rng.uniform(-60, 60, (count, 2)), rng.uniform(-5, 20, count)]
+
+
+def assert_consistent(edges: np.ndarray, pos: np.ndarray, elevation: np.ndarray, winners: np.ndarray) -> None:
+    np.testing.assert_allclose(elevation, brute_force(edges, pos), rtol=0, atol=TOLERANCE)
+    np.testing.assert_array_equal(winners >= 0, elevation > 0)
+
+    bins = np.flatnonzero(winners >= 0)
+    np.testing.assert_allclose(
+        elevation_at(edges[winners[bins]], pos, AZIMUTH_SIN[bins], AZIMUTH_COS[bins]), elevation[bins], rtol=0, atol=0
+    )
+
+
+def test_evaluate_edges_matches_brute_force(edges):
+    for pos in random_positions(0, 15):
+        assert_consistent(edges, pos, *evaluate_edges(edges, pos))
+
+
+def test_evaluate_edges_with_warm_start_matches_brute_force(edges):
+    for previous, pos in zip(random_positions(1, 10), random_positions(2, 10)):
+        # the winners of a nearby position, as used for the positions of a track
+        _, winners = evaluate_edges(edges, pos + np.r_[previous[:2] - pos[:2], 0.0] * 0.05)
+        assert_consistent(edges, pos, *evaluate_edges(edges, pos, np.unique(winners[winners >= 0])))
+
+        # also unrelated edges and edges below the position
+        assert_consistent(edges, pos, *evaluate_edges(edges, pos, np.arange(0, len(edges), 7)))
+        assert_consistent(edges, pos, *evaluate_edges(edges, pos, np.empty(0, dtype=np.int64)))
+
+
+def test_warm_start_evaluates_fewer_bins(monkeypatch):
+    edges = random_edges(np.random.default_rng(5000), CENTER, 5000)
+    buildings = summarise_buildings(edges)
+    # 10 Hz positions of a vehicle driving at 5 m/s
+    track = CENTER + np.c_[np.arange(20) * 0.5, np.zeros(20), np.zeros(20)]
+    evaluated = []
+
+    def counting_elevation_at(edges: np.ndarray, *args) -> np.ndarray:
+        evaluated.append(len(edges))
+        return elevation_at(edges, *args)
+
+    monkeypatch.setattr(oaem, "elevation_at", counting_elevation_at)
+
+    expected = [evaluate_edges(edges, pos, buildings=buildings)[0] for pos in track[1:]]
+    independent, evaluated[:] = sum(evaluated), []
+
+    _, winners = evaluate_edges(edges, track[0], buildings=buildings)
+    for pos, expected_elevation in zip(track[1:], expected):
+        elevation, winners = evaluate_edges(edges, pos, np.unique(winners[winners >= 0]), buildings)
+        np.testing.assert_allclose(elevation, expected_elevation, rtol=0, atol=TOLERANCE)
+
+    assert sum(evaluated) < 0.8 * independent
+
+
+@pytest.mark.parametrize("batch", [1, oaem.CULLING_BATCH])
+def test_building_culling_matches_single_pass(edges, batch, monkeypatch):
+    building = edges[edges[:, 6] == edges[0, 6]]
+    # random positions, a position inside the bounding circle of a building and one with the buildings across ±pi
+    positions = [
+        *random_positions(3, 20),
+        np.r_[(building[:, :2].min(axis=0) + building[:, :2].max(axis=0)) / 2, CENTER[2]],
+        CENTER + np.r_[0.0, 90.0, 0.0],
+    ]
+
+    monkeypatch.setattr(oaem, "CULLING_MIN_EDGES", len(edges) + 1)
+    expected = [evaluate_edges(edges, pos) for pos in positions]
+
+    monkeypatch.setattr(oaem, "CULLING_MIN_EDGES", 0)
+    monkeypatch.setattr(oaem, "CULLING_BATCH", batch)
+
+    for pos, (expected_elevation, expected_winners) in zip(positions, expected):
+        elevation, winners = evaluate_edges(edges, pos)
+        np.testing.assert_array_equal(elevation, expected_elevation)
+        np.testing.assert_array_equal(winners, expected_winners)
+
+
+def test_evaluate_edges_without_edges():
+    elevation, winners = evaluate_edges(np.empty((0, 7)), CENTER)
+
+    assert not elevation.any()
+    assert (winners == -1).all()
@@ -0,0 +1,74 @@
+import threading
+import time
+
+import pytest
+
+from app.singleflight import SingleFlight
+
+WAITERS = 4
+
+
+def run_concurrently(flight: SingleFlight, func) -> list:
+    """
+    Calls flight.do with the same key from several threads and returns their results or exceptions.
+    """
+    results: list = [None] * WAITERS
+
+    def call(index: int) -> None:
+        try:
+            results[index] = flight.do("key", func)
+        except ValueError as exc:
+            results[index] = exc
+
+    threads = [threading.Thread(target=call, args=(index,)) for index in range(WAITERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return results
+
+
+def slow(calls: list, result=None, exception: Exception | None = None):
+    def func():
+        calls.append(1)
+        # long enough for the other threads to join the call in flight
+        time.sleep(0.2)
+        if exception is not None:
+            raise exception
+        return result
+
+    return func
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    calls: list = []
+
+    results = run_concurrently(flight, slow(calls, result="value"))
+
+    assert len(calls) == 1
+    assert sorted(results, key=lambda result: result[1]) == [("value", False)] + [("value", True)] * (WAITERS - 1)
+
+
+def test_exception_reaches_every_waiter():
+    flight = SingleFlight()
+    calls: list = []
+    error = ValueError("failed")
+
+    results = run_concurrently(flight, slow(calls, exception=error))
+
+    assert len(calls) == 1
+    assert all(result is error for result in results)
+
+
+def test_call_after_completion_executes_again():
+    flight = SingleFlight()
+    calls: list = []
+
+    with pytest.raises(ValueError):
+        flight.do("key", slow(calls, exception=ValueError("failed")))
+
+    assert flight.do("key", slow(calls, result=1)) == (1, False)
+    assert flight.do("other", slow(calls, result=2)) == (2, False)
+    assert len(calls) == 3
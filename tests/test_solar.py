@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+import pytest
+from pvlib import solarposition
+
+from app.solar import HORIZON_DIP, solar_position
+
+# latitude, longitude and altitude of the compared locations, from the equator to the polar circle
+LOCATIONS = [(50.7, 7.1, 60.0), (51.5, 6.5, 300.0), (0.0, 0.0, 0.0), (-33.9, 151.2, 50.0), (65.0, 25.0, 100.0)]
+START, END, STEP = pd.Timestamp("2024-01-01", tz="UTC"), pd.Timestamp("2027-01-01", tz="UTC"), 977.0
+
+ELEVATION_TOLERANCE = 0.002  # degrees
+AZIMUTH_TOLERANCE = 0.002  # degrees on the sky, i.e. the azimuth deviation scaled by the cosine of the elevation
+CUTOFF_BAND = 0.01  # degrees around the refraction cutoff where the refraction may only be applied by one of both
+
+
+@pytest.fixture(scope="module", params=LOCATIONS, ids=lambda location: f"lat{location[0]}")
+def positions(request) -> tuple[np.ndarray, np.ndarray, pd.DataFrame]:
+    latitude, longitude, altitude = request.param
+    timestamps = np.arange(START.timestamp(), END.timestamp(), STEP)
+    expected = solarposition.get_solarposition(pd.to_datetime(timestamps, unit="s", utc=True), *request.param)
+    azimuth, elevation = solar_position(timestamps, latitude, longitude, altitude)
+    return np.rad2deg(azimuth), np.rad2deg(elevation), expected
+
+
+def test_matches_pvlib(positions):
+    azimuth, elevation, expected = positions
+    true_elevation = expected["elevation"].to_numpy()
+    near_cutoff = np.abs(true_elevation + HORIZON_DIP) < CUTOFF_BAND
+
+    elevation_deviation = np.abs(elevation - expected["apparent_elevation"].to_numpy())
+    azimuth_deviation = np.abs((azimuth - expected["azimuth"].to_numpy() + 180) % 360 - 180)
+
+    assert elevation_deviation[~near_cutoff].max() < ELEVATION_TOLERANCE
+    assert (azimuth_deviation * np.cos(np.deg2rad(true_elevation))).max() < AZIMUTH_TOLERANCE
+
+
+def test_deviation_at_refraction_cutoff_is_bounded_by_horizon_refraction(positions):
+    _, elevation, expected = positions
+    apparent_elevation = expected["apparent_elevation"].to_numpy()
+    near_cutoff = np.abs(expected["elevation"].to_numpy() + HORIZON_DIP) < CUTOFF_BAND
+
+    # refraction of pvlib at the cutoff, it is switched off below in both implementations
+    horizon_refraction = (apparent_elevation - expected["elevation"].to_numpy())[near_cutoff].max()
+
+    assert np.abs(elevation - apparent_elevation)[near_cutoff].max() <= horizon_refraction + ELEVATION_TOLERANCE
+    assert horizon_refraction < 0.7
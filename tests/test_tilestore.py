@@ -0,0 +1,167 @@
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from app.tilestore import EDGE_LIMIT, EDGE_SCALE, TILE_FORMAT, TMP_MAX_AGE, TileStore, decode_edges, encode_edges
+
+
+@pytest.fixture
+def store(tmp_path) -> TileStore:
+    return TileStore(str(tmp_path))
+
+
+def random_coordinates(seed: int, count: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    # UTM coordinates and heights in meters with millimetres, the building index in the last column
+    xyz = np.c_[rng.uniform(280000, 920000, count), rng.uniform(5.2e6, 6.1e6, count), rng.uniform(-10, 400, count)]
+    return np.c_[xyz, xyz + rng.uniform(-50, 50, (count, 3)), np.arange(count) // 4].round(3)
+
+
+def tile_path(store: TileStore, key: str, version: int = TILE_FORMAT) -> str:
+    return os.path.join(store.path, f"{key}.v{version}.npy" if version else f"{key}.npy")
+
+
+def age(path: str, seconds: float) -> None:
+    timestamp = time.time() - seconds
+    os.utime(path, (timestamp, timestamp))
+
+
+def test_encode_decode_round_trip():
+    coordinates = random_coordinates(0, 1000)
+    centimetres = encode_edges(coordinates)
+
+    assert centimetres.dtype == np.int32
+    # rounded to the nearest centimetre, up to the float64 resolution of the coordinates
+    np.testing.assert_allclose(
+        decode_edges(centimetres)[:, :6], coordinates[:, :6], rtol=0, atol=0.5 / EDGE_SCALE + 1e-8
+    )
+    np.testing.assert_array_equal(decode_edges(centimetres)[:, 6], coordinates[:, 6])
+    assert np.shares_memory(encode_edges(centimetres), centimetres)
+    assert encode_edges([]).shape == (0, 7)
+
+
+def test_encode_rejects_large_coordinates():
+    coordinates = random_coordinates(1, 10)
+    coordinates[3, 1] = EDGE_LIMIT + 1
+
+    with pytest.raises(ValueError):
+        encode_edges(coordinates)
+
+
+def test_get_stores_tile_once(store):
+    coordinates = random_coordinates(2, 100)
+    calls = []
+
+    def loader() -> np.ndarray:
+        calls.append(1)
+        return coordinates
+
+    first = store.get("tile", loader)
+    second = store.get("tile", loader)
+
+    assert len(calls) == 1
+    assert isinstance(second, np.memmap) and not second.flags.writeable
+    np.testing.assert_array_equal(first, encode_edges(coordinates))
+    np.testing.assert_array_equal(second, first)
+    assert sorted(os.listdir(store.path)) == [os.path.basename(tile_path(store, "tile"))]
+
+
+def test_get_loads_expired_tile_again(store):
+    store.get("tile", lambda: random_coordinates(3, 10))
+    age(tile_path(store, "tile"), 100)
+    coordinates = random_coordinates(4, 20)
+
+    np.testing.assert_array_equal(
+        store.get("tile", lambda: coordinates, max_age=1000), encode_edges(random_coordinates(3, 10))
+    )
+    np.testing.assert_array_equal(store.get("tile", lambda: coordinates, max_age=10), encode_edges(coordinates))
+
+
+def test_concurrent_get_loads_tile_once(store):
+    coordinates = random_coordinates(5, 100)
+    calls = []
+
+    def loader() -> np.ndarray:
+        calls.append(1)
+        time.sleep(0.2)
+        return coordinates
+
+    results = [None] * 4
+
+    def get(index: int) -> None:
+        results[index] = store.get("tile", loader)
+
+    threads = [threading.Thread(target=get, args=(index,)) for index in range(len(results))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    for result in results:
+        np.testing.assert_array_equal(result, encode_edges(coordinates))
+    assert not [name for name in os.listdir(store.path) if name.endswith(".lock")]
+
+
+def test_disabled_store_loads_directly():
+    coordinates = random_coordinates(6, 10)
+
+    np.testing.assert_array_equal(TileStore("").get("tile", lambda: coordinates), encode_edges(coordinates))
+    assert TileStore("").prune() == 0
+
+
+def test_prune_removes_stale_files(store):
+    for key, version in (("old", 0), ("older", TILE_FORMAT - 1), ("current", TILE_FORMAT)):
+        np.save(tile_path(store, key, version), encode_edges(random_coordinates(7, 10)))
+
+    stale_tmp, fresh_tmp = tile_path(store, "a") + ".1.tmp", tile_path(store, "b") + ".2.tmp"
+    for path in (stale_tmp, fresh_tmp, os.path.join(store.path, "unused.lock")):
+        open(path, "wb").close()
+    age(stale_tmp, TMP_MAX_AGE + 10)
+
+    assert store.prune() == 4
+    assert sorted(os.listdir(store.path)) == sorted(
+        os.path.basename(path) for path in (tile_path(store, "current"), fresh_tmp)
+    )
+
+
+def test_prune_keeps_held_lock(store):
+    with store._lock("tile"):
+        assert store.prune() == 0
+        assert os.path.exists(os.path.join(store.path, "tile.lock"))
+
+
+def test_prune_removes_superseded_revisions(store):
+    store.get("a.lod2@1.10", lambda: random_coordinates(8, 10))
+    store.get("b.lod2@1.10", lambda: random_coordinates(9, 10))
+    for key in ("a.lod2@1.10", "b.lod2@1.10"):
+        age(tile_path(store, key), 10)
+
+    # storing a new revision removes the earlier ones of the same source
+    store.get("a.lod2@2.20", lambda: random_coordinates(10, 10))
+    assert sorted(os.listdir(store.path)) == [f"a.lod2@2.20.v{TILE_FORMAT}.npy", f"b.lod2@1.10.v{TILE_FORMAT}.npy"]
+
+    np.save(tile_path(store, "b.lod1@1.10"), encode_edges(random_coordinates(11, 10)))
+    np.save(tile_path(store, "b.lod2@2.30"), encode_edges(random_coordinates(12, 10)))
+    assert store.prune() == 1
+    assert not os.path.exists(tile_path(store, "b.lod2@1.10"))
+    assert os.path.exists(tile_path(store, "b.lod1@1.10"))
+
+
+def test_prune_evicts_oldest_tiles_with_prefix(store):
+    data = encode_edges(random_coordinates(13, 100))
+    for index in range(5):
+        np.save(tile_path(store, f"wfs.{index}"), data)
+        age(tile_path(store, f"wfs.{index}"), 100 * (5 - index))
+    np.save(tile_path(store, "other"), data)
+    age(tile_path(store, "other"), 1000)
+    size = os.path.getsize(tile_path(store, "wfs.0"))
+
+    # wfs.4 is the newest, wfs.0 is older than max_age
+    assert store.prune("wfs.", max_size=int(3.5 * size), max_age=450) == 2
+    assert sorted(os.listdir(store.path)) == sorted(
+        os.path.basename(tile_path(store, key)) for key in ("wfs.2", "wfs.3", "wfs.4", "other")
+    )
@@ -0,0 +1,93 @@
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+from app import tracking
+
+POSITION = {"pos_x": 364500.0, "pos_y": 5620500.0, "pos_z": 62.0, "epsg": 25832}
+SATELLITES = {"G01": [0.5, 1.5], "G02": [-2.0, -0.1]}
+
+
+def moved(dx: float = 0.0, dy: float = 0.0, **fields) -> dict:
+    return {**POSITION, "pos_x": POSITION["pos_x"] + dx, "pos_y": POSITION["pos_y"] + dy, **fields}
+
+
+def test_oaem_is_reused_within_tolerance(client):
+    with client.websocket_connect("/ws/track?tolerance=5") as websocket:
+        websocket.send_json(moved(seq=1, satellites=SATELLITES))
+        first = websocket.receive_json()
+        assert (first["seq"], first["skipped"], first["updated"]) == (1, 0, True)
+        assert first["data"].count(":") == 360
+        assert first["visible"] == {"G01": True, "G02": False}
+
+        websocket.send_json(moved(dx=3.0, seq=2, satellites=SATELLITES))
+        second = websocket.receive_json()
+        assert (second["seq"], second["updated"]) == (2, False)
+        assert "data" not in second
+        assert second["visible"] == first["visible"]
+
+        websocket.send_json(moved(dx=6.0, seq=3))
+        assert websocket.receive_json()["updated"]
+
+
+def test_oaem_is_recomputed_in_another_cell(client):
+    # the cells are N_RES = 20 m wide and centered on multiples of N_RES
+    with client.websocket_connect("/ws/track?tolerance=20&masks=false") as websocket:
+        websocket.send_json(moved(dx=9.5))
+        assert websocket.receive_json()["updated"]
+
+        websocket.send_json(moved(dx=9.9))
+        assert not websocket.receive_json()["updated"]
+
+        websocket.send_json(moved(dx=10.5))
+        response = websocket.receive_json()
+        assert response["updated"]
+        assert "data" not in response
+
+
+def test_error_frames_keep_the_session(client):
+    with client.websocket_connect("/ws/track") as websocket:
+        websocket.send_text("not json")
+        assert isinstance(websocket.receive_json()["error"], list)
+
+        websocket.send_json({"pos_x": 364500.0})
+        assert [error["loc"] for error in websocket.receive_json()["error"]] == [["pos_y"], ["pos_z"], ["epsg"]]
+
+        websocket.send_json(moved(seq=1))
+        assert websocket.receive_json()["updated"]
+
+        # a failed update discards the OAEM, so that no visibility is answered from an outdated one
+        websocket.send_json(moved(epsg=1, seq=2, satellites=SATELLITES))
+        response = websocket.receive_json()
+        assert response == {"seq": 2, "skipped": 0, "error": "Invalid EPSG code 1.", "updated": False, "visible": {}}
+
+        websocket.send_json(moved(seq=3))
+        assert websocket.receive_json()["updated"]
+
+
+def test_unexpected_error_is_reported(client, monkeypatch):
+    def fail(*args):
+        raise RuntimeError("failed")
+
+    with client.websocket_connect("/ws/track") as websocket:
+        monkeypatch.setattr(tracking, "compute_oaem", fail)
+        websocket.send_json(moved(seq=1))
+        assert websocket.receive_json() == {
+            "seq": 1,
+            "skipped": 0,
+            "error": "Internal server error.",
+            "updated": False,
+        }
+
+        monkeypatch.undo()
+        websocket.send_json(moved(seq=2))
+        assert websocket.receive_json()["updated"]
+
+
+def test_binary_frame_closes_websocket(client):
+    with client.websocket_connect("/ws/track") as websocket:
+        websocket.send_bytes(b"\x00\x01")
+
+        with pytest.raises(WebSocketDisconnect) as exc_info:
+            websocket.receive_json()
+
+    assert exc_info.value.code == 1003
@@ -0,0 +1,152 @@
+import base64
+
+import numpy as np
+import pytest
+from pointset import PointSet
+
+from app import routes
+from app.oaem import AZIMUTH_GRID, Oaem
+from config import OAEM_RES
+
+POSITION = [364500.0, 5620500.0, 62.0]
+
+
+def encode(values: list[list[float]]) -> str:
+    return base64.b64encode(np.array(values, dtype="<f4").tobytes()).decode("ascii")
+
+
+def observations(encoding: str, azimuth: list[list[float]], elevation: list[list[float]], **fields) -> dict:
+    """
+    Returns a /visibility request of one static position with the observations in the given encoding.
+    """
+    request = {"positions": [POSITION], "epsg": 25832, "encoding": encoding}
+    if encoding == "base64":
+        request |= {"azimuth": encode(azimuth), "elevation": encode(elevation), "shape": np.shape(azimuth)}
+    else:
+        request |= {"azimuth": azimuth, "elevation": elevation}
+
+    return request | fields
+
+
+@pytest.fixture
+def ramp() -> Oaem:
+    """
+    OAEM whose elevation rises from 0 in the first bin at -pi to 1 in the last bin at pi - OAEM_RES.
+    """
+    pos = PointSet(xyz=np.array([POSITION]), epsg=25832, init_local_transformer=False)
+    return Oaem(pos=pos, azimuth=AZIMUTH_GRID.copy(), elevation=np.linspace(0.0, 1.0, len(AZIMUTH_GRID)))
+
+
+def test_query_many_interpolates_across_wrap_around(ramp):
+    last = AZIMUTH_GRID[-1]
+    between = last + 0.25 * OAEM_RES
+
+    # the gap between the last bin and the first bin at -pi = pi is bridged in both directions
+    assert ramp.query_many(np.array([between]))[0] == pytest.approx(0.75)
+    assert ramp.query_many(np.array([between - 2 * np.pi]))[0] == pytest.approx(0.75)
+    assert ramp.query(np.pi) == pytest.approx(0.0)
+    assert ramp.query(-np.pi) == pytest.approx(0.0)
+
+
+def test_query_many_wraps_azimuths_and_keeps_shape(ramp):
+    azimuth = np.array([[0.1, 1.0, -3.0], [2.5, -0.7, AZIMUTH_GRID[-1] + 0.5 * OAEM_RES]])
+    expected = ramp.query_many(azimuth)
+
+    assert expected.shape == azimuth.shape
+    assert expected[1, 2] == pytest.approx(0.5)
+    for turns in (-2, 1, 3):
+        np.testing.assert_allclose(ramp.query_many(azimuth + turns * 2 * np.pi), expected, atol=1e-9)
+
+
+def test_visibility_encodings_agree(client):
+    azimuth = [[0.5, -2.0, None], [1.0, 0.0, -3.1]]
+    elevation = [[1.5, -0.1, None], [-0.2, 1.4, 1.55]]
+    results = {}
+    for encoding in ("base64", "list"):
+        response = client.post("/visibility", json=observations(encoding, azimuth, elevation))
+        assert response.status_code == 200
+        results[encoding] = response.json()
+
+    listed, packed = results["list"], results["base64"]
+    assert listed["shape"] == packed["shape"] == [2, 3]
+    assert listed["visible"] == [[True, False, False], [False, True, True]]
+
+    # every epoch starts at a new byte, the first satellite is the most significant bit
+    assert base64.b64decode(packed["bitmask"]) == bytes([0b10000000, 0b01100000])
+    margin = np.frombuffer(base64.b64decode(packed["margin"]), dtype="<f4").reshape(2, 3)
+    assert np.isnan(margin[0, 2]) and listed["margin"][0][2] is None
+    np.testing.assert_allclose(margin, np.array(listed["margin"], dtype=np.float64), atol=1e-4)
+
+
+@pytest.mark.parametrize("encoding", ["base64", "list"])
+def test_visibility_rejects_large_bodies(client, encoding, monkeypatch):
+    monkeypatch.setattr(routes, "VISIBILITY_MAX_BODY_SIZE", 256)
+    azimuth = [[0.5] * 10] * 10
+
+    response = client.post("/visibility", json=observations(encoding, azimuth, azimuth))
+    assert response.status_code == 413
+
+    # without a content-length, the body is rejected while it is streamed
+    def chunks():
+        yield b'{"positions": [[364500.0, 5620500.0, 62.0]],'
+        yield b" " * 512
+
+    response = client.post("/visibility", content=chunks(), headers={"Content-Type": "application/json"})
+    assert response.status_code == 413
+
+
+@pytest.mark.parametrize("encoding", ["base64", "list"])
+def test_visibility_rejects_too_many_observations(client, encoding, monkeypatch):
+    monkeypatch.setattr(routes, "VISIBILITY_MAX_OBSERVATIONS", 5)
+    azimuth = [[0.5] * 3] * 2
+
+    response = client.post("/visibility", json=observations(encoding, azimuth, azimuth))
+
+    assert response.status_code == 422
+    assert "At most 5 observations" in response.json()["detail"][0]["msg"]
+
+
+@pytest.mark.parametrize(
+    ("request_fields", "message"),
+    [
+        ({"shape": None}, "shape E x S is required"),
+        ({"shape": [2, 3]}, "Expected 6 float32 values, got 4."),
+        ({"azimuth": "not base64!"}, "must be base64 encoded"),
+        ({"elevation": [[0.5, 0.5], [0.5, 0.5]]}, "both be base64 strings or both be nested lists"),
+        ({"positions": [POSITION] * 3}, "one position per epoch"),
+    ],
+)
+def test_visibility_validates_base64(client, request_fields, message):
+    request = observations("base64", [[0.5, 0.5], [0.5, 0.5]], [[0.5, 0.5], [0.5, 0.5]]) | request_fields
+
+    response = client.post("/visibility", json=request)
+
+    assert response.status_code == 422
+    assert message in response.json()["detail"][0]["msg"]
+
+
+@pytest.mark.parametrize(
+    ("request_fields", "message"),
+    [
+        ({"azimuth": []}, "non-empty rectangular array"),
+        ({"azimuth": [[0.5, 0.5], [0.5]]}, "non-empty rectangular array"),
+        ({"elevation": [[0.5, 0.5]]}, "arrays of the same shape"),
+        ({"elevation": [[0.5, 0.5], [0.5, "high"]]}, "valid number"),
+    ],
+)
+def test_visibility_validates_lists(client, request_fields, message):
+    request = observations("list", [[0.5, 0.5], [0.5, 0.5]], [[0.5, 0.5], [0.5, 0.5]]) | request_fields
+
+    response = client.post("/visibility", json=request)
+
+    assert response.status_code == 422
+    assert any(message in error["msg"] for error in response.json()["detail"])
+
+
+def test_visibility_rejects_invalid_epsg(client):
+    request = observations("list", [[0.5]], [[0.5]], epsg=1)
+
+    response = client.post("/visibility", json=request)
+
+    assert response.status_code == 422
+    assert response.json()["detail"] == "Invalid EPSG code 1."